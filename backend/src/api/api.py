@@ -6,6 +6,7 @@ Includes all API routes and middleware.
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 import sys
 from pathlib import Path
 import time
@@ -19,11 +20,18 @@ from utils.logger import get_logger
 from middleware.metrics_middleware import MetricsMiddleware
 from middleware.cors_middleware import setup_cors
 
+# Import services
+from services.gallery_service import gallery_service
+from services.execution_engine import face_engine
+from services.job_queue import job_queue, bulk_job_queue
+from utils.database import database
+
 # Import API routes
 from api.health import router as health_router
 from api.users import router as users_router
 from api.recognition import router as recognition_router
 from api.registration import router as registration_router
+from api.streaming import router as streaming_router
 
 # Get logger
 logger = get_logger("api")
@@ -42,6 +50,64 @@ app = FastAPI(
 app.add_middleware(MetricsMiddleware)
 setup_cors(app)
 
+# Load the resident face gallery once at startup
+@app.on_event("startup")
+async def load_gallery():
+    """
+    Load all registered face encodings into the in-memory gallery.
+    """
+    await gallery_service.load()
+
+# Start the face worker pool at startup so workers are warm before traffic
+@app.on_event("startup")
+async def start_face_engine():
+    """
+    Start the face execution engine and pre-warm its workers.
+    """
+    await run_in_threadpool(face_engine.start)
+
+# Resume queued background jobs at startup
+@app.on_event("startup")
+async def start_job_queue():
+    """
+    Start the background job workers.
+    """
+    await job_queue.start()
+    await bulk_job_queue.start()
+
+# Stop the background job workers on shutdown
+@app.on_event("shutdown")
+async def stop_job_queue():
+    """
+    Stop the background job workers; unfinished jobs resume on the next start.
+    """
+    await job_queue.stop()
+    await bulk_job_queue.stop()
+
+# Persist the gallery index on shutdown
+@app.on_event("shutdown")
+async def save_gallery_index():
+    """
+    Save the gallery nearest-neighbour index to disk.
+    """
+    gallery_service.save_index()
+
+# Stop the face worker pool on shutdown
+@app.on_event("shutdown")
+async def stop_face_engine():
+    """
+    Shut down the face execution engine.
+    """
+    face_engine.shutdown()
+
+# Close the pooled database connections last
+@app.on_event("shutdown")
+async def close_database():
+    """
+    Close the database connections, checkpointing the write-ahead log.
+    """
+    database.close()
+
 # Add exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -66,6 +132,7 @@ app.include_router(health_router)
 app.include_router(users_router)
 app.include_router(recognition_router)
 app.include_router(registration_router)
+app.include_router(streaming_router)
 
 # Mount static files
 app.mount("/uploads", StaticFiles(directory=str(config.UPLOADS_DIR)), name="uploads")
@@ -5,16 +5,18 @@ Face recognition endpoints for the Face Recognition API.
 import json
 import time
 import asyncio
-from fastapi import APIRouter, HTTPException, File, UploadFile, Body, Request, BackgroundTasks
+from fastapi import APIRouter, HTTPException, File, UploadFile, Body, Query, Request, BackgroundTasks
 from fastapi.responses import JSONResponse
 from fastapi.concurrency import run_in_threadpool
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import sys
 from pathlib import Path
 
 # Import services and utilities
 sys.path.append(str(Path(__file__).resolve().parent.parent))
-from services.face_service import face_service
+from services.execution_engine import face_engine
+from services.gallery_service import gallery_service, AGGREGATIONS
+from services.probe_cache import probe_cache, recent_probes
 from utils.database import database
 from utils.logger import get_logger
 from config import config
@@ -28,19 +30,155 @@ router = APIRouter(tags=["Recognition"])
 # Create semaphore to limit concurrent recognition operations
 recognition_semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_RECOGNITIONS)
 
+async def _compute_probe(image_data: Any, multi_face: bool) -> Optional[Dict[str, Any]]:
+    """
+    Decode a probe image, detect its faces and analyze and encode them.
+    
+    The whole pipeline runs in one face worker call, so only the encoded
+    image is sent to the worker and the decoded image never leaves it.
+    
+    Args:
+        image_data: Uploaded bytes or base64 string
+        multi_face: Whether to process every detected face instead of only the first
+    
+    Returns:
+        A probe entry with "face_locations" and processed "faces", or None if the image is invalid
+    """
+    return await face_engine.call("process_probe_faces", image_data, multi_face)
+
+def _client_id(request: Request) -> str:
+    """Identify the calling client by its X-Client-ID header, falling back to its address."""
+    client_id = request.headers.get("X-Client-ID")
+    if client_id:
+        return client_id
+    return request.client.host if request.client else "unknown"
+
+def _probe_covers(probe: Dict[str, Any], multi_face: bool) -> bool:
+    """Check whether a cached probe has processed every face the request needs."""
+    needed = len(probe["face_locations"]) if multi_face else min(1, len(probe["face_locations"]))
+    return len(probe["faces"]) >= needed
+
+async def _best_existing_match(
+    candidates: List[Dict[str, Any]]
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Take the best match whose user still exists.
+    
+    A cached ranking can name users deleted since the gallery was searched,
+    so candidates within tolerance are checked in rank order.
+    
+    Args:
+        candidates: Ranked search candidates
+    
+    Returns:
+        The matching candidate and its user, or (None, None) if there is no match
+    """
+    for candidate in candidates:
+        if not candidate["within_tolerance"]:
+            break
+        user = await database.get_user_by_id(candidate["user_id"])
+        if user:
+            return candidate, user
+    return None, None
+
+async def _recognize_all_faces(
+    probe: Dict[str, Any],
+    top_k: Optional[int],
+    aggregate: str
+) -> Dict[str, Any]:
+    """
+    Recognize every detected face in an image.
+    
+    All faces are matched against the gallery in one vectorized pass.
+    
+    Args:
+        probe: Probe entry with every detected face processed
+        top_k: Optional number of best distinct users to return per face
+        aggregate: How each user's multi-angle distances are reduced
+    
+    Returns:
+        Recognition result with one entry per detected face
+    """
+    face_locations = probe["face_locations"]
+    processed = probe["faces"]
+    encoded = [i for i, result in enumerate(processed) if result["encoding"] is not None]
+    
+    search_results = {}
+    if encoded and gallery_service.size:
+        params = ("multi_face", top_k or 1, aggregate)
+        version = gallery_service.version
+        batch_results = probe_cache.get_result(probe, params, version)
+        if batch_results is None:
+            batch_results = await run_in_threadpool(
+                lambda: gallery_service.search_batch(
+                    [processed[i]["encoding"] for i in encoded],
+                    top_k or 1,
+                    aggregate,
+                    [(processed[i]["face_analysis"] or {}).get("pose") for i in encoded]
+                )
+            )
+            probe_cache.put_result(probe, params, version, batch_results)
+        search_results = dict(zip(encoded, batch_results))
+    
+    faces = []
+    for i, face_location in enumerate(face_locations):
+        top, right, bottom, left = face_location
+        face = {
+            "face_location": {"top": top, "right": right, "bottom": bottom, "left": left},
+            "recognized": False,
+            "face_analysis": processed[i]["face_analysis"]
+        }
+        quality = processed[i].get("quality_check")
+        if quality and not quality["passed"]:
+            face["quality_check"] = quality
+            face["message"] = quality["message"]
+        if i in search_results:
+            candidates = search_results[i]["candidates"]
+            best_match, user = await _best_existing_match(candidates)
+            if best_match:
+                face["recognized"] = True
+                face["user"] = user
+                face["confidence"] = best_match["confidence"]
+                face["possible_match"] = best_match["confidence"] < 0.7
+            if top_k:
+                face["candidates"] = candidates
+        faces.append(face)
+    
+    recognized = sum(1 for face in faces if face["recognized"])
+    return {
+        "status": "success",
+        "message": f"Recognized {recognized} of {len(faces)} faces",
+        "recognized": recognized > 0,
+        "faces": faces,
+        "diagnostic": {
+            "faces_detected": len(face_locations),
+            "encodings_generated": len(encoded),
+            "comparisons": search_results[encoded[0]]["comparisons"] if search_results else 0
+        }
+    }
+
 @router.post("/api/recognize")
 async def recognize_face(
     request: Request,
     file: UploadFile = File(None),
-    image_base64: str = Body(None)
+    image_base64: str = Body(None),
+    top_k: Optional[int] = Body(None),
+    aggregate: str = Body("min"),
+    multi_face: bool = Body(False)
 ):
     """
     Recognize a face from a provided image.
     
+    Clients streaming frames should send a stable X-Client-ID header so that
+    near-identical consecutive frames can reuse the previous match result.
+    
     Args:
         request: The request object
         file: Optional uploaded image file
         image_base64: Optional base64 encoded image
+        top_k: Optional number of best distinct users to return as candidates
+        aggregate: How each user's multi-angle distances are reduced ("min" or "mean")
+        multi_face: Whether to recognize every detected face instead of only the first
     
     Returns:
         Recognition result with matched user data or failure message
@@ -84,24 +222,34 @@ async def recognize_face(
             content={"status": "error", "message": "No image provided. Please upload a file or provide base64 image data."}
         )
     
+    # Validate candidate ranking options
+    if top_k is not None and not 1 <= top_k <= config.RECOGNITION_MAX_TOP_K:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": f"top_k must be between 1 and {config.RECOGNITION_MAX_TOP_K}"}
+        )
+    if aggregate not in AGGREGATIONS:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": f"aggregate must be one of: {', '.join(AGGREGATIONS)}"}
+        )
+    
     # Use semaphore to limit concurrent face recognition operations
     async with recognition_semaphore:
         try:
-            # Process the image in a thread pool to avoid blocking
-            image_array = await run_in_threadpool(
-                lambda: face_service.process_image(image_data)
-            )
-            
-            if image_array is None:
-                return JSONResponse(
-                    status_code=400,
-                    content={"status": "error", "message": "Invalid image data or format not supported"}
-                )
+            # Reuse the probe of a byte-identical recent image, else compute it
+            cache_key = probe_cache.key(image_data)
+            probe = probe_cache.get(cache_key)
+            if probe is None or not _probe_covers(probe, multi_face):
+                probe = await _compute_probe(image_data, multi_face)
+                if probe is None:
+                    return JSONResponse(
+                        status_code=400,
+                        content={"status": "error", "message": "Invalid image data or format not supported"}
+                    )
+                probe = probe_cache.put(cache_key, probe)
             
-            # Detect faces in a separate thread
-            face_locations = await run_in_threadpool(
-                lambda: face_service.detect_faces(image_array)
-            )
+            face_locations = probe["face_locations"]
             
             if not face_locations:
                 return {
@@ -111,18 +259,26 @@ async def recognize_face(
                     "diagnostic": {"face_detected": False}
                 }
             
-            # Get first face location
-            face_location = face_locations[0]
+            if multi_face:
+                return await _recognize_all_faces(probe, top_k, aggregate)
             
-            # Analyze face to get pose and feature information
-            face_analysis = await run_in_threadpool(
-                lambda: face_service.analyze_face(image_array, face_location)
-            )
+            # Use the first face
+            face_analysis = probe["faces"][0]["face_analysis"]
+            face_encoding = probe["faces"][0]["encoding"]
+            quality = probe["faces"][0].get("quality_check")
             
-            # Generate face encoding in a separate thread
-            face_encoding = await run_in_threadpool(
-                lambda: face_service.encode_face(image_array, face_location)
-            )
+            # Frames rejected by the quality gate never reach the encoder
+            if quality and not quality["passed"]:
+                return {
+                    "status": "success",
+                    "message": f"{quality['message']} Please try again.",
+                    "recognized": False,
+                    "diagnostic": {
+                        "face_detected": True,
+                        "encoding_generated": False,
+                        "quality_check": quality
+                    }
+                }
             
             if face_encoding is None:
                 return {
@@ -136,10 +292,7 @@ async def recognize_face(
                     }
                 }
             
-            # Get all face encodings from database
-            db_face_encodings = await database.get_all_face_encodings()
-            
-            if not db_face_encodings:
+            if gallery_service.size == 0:
                 return {
                     "status": "success",
                     "message": "No registered faces in the database to compare against.",
@@ -147,118 +300,36 @@ async def recognize_face(
                     "diagnostic": {"registered_faces": 0}
                 }
             
-            # Find the closest match
-            best_match = None
-            lowest_distance = 1.0
-            total_comparisons = 0
-            used_poses = False
+            # Rank gallery users against the probe in a single vectorized pass,
+            # reusing the cached ranking while the gallery is unchanged
+            probe_pose = face_analysis.get("pose") if face_analysis else None
+            params = ("single_face", top_k or 1, aggregate)
+            version = gallery_service.version
+            search_result = probe_cache.get_result(probe, params, version)
+            if search_result is None:
+                # Consecutive frames from the same client usually encode almost identically
+                client_id = _client_id(request)
+                search_result = recent_probes.get(client_id, face_encoding, params, version)
+                if search_result is None:
+                    search_result = await run_in_threadpool(
+                        lambda: gallery_service.search(face_encoding, top_k or 1, aggregate, probe_pose)
+                    )
+                    recent_probes.put(client_id, face_encoding, params, version, search_result)
+                probe_cache.put_result(probe, params, version, search_result)
+            candidates = search_result["candidates"]
+            total_comparisons = search_result["comparisons"]
+            used_poses = search_result["used_pose_adjustment"]
             
-            for db_face in db_face_encodings:
-                if db_face["face_encoding"]:
-                    # Try to use multi-angle encodings if available
-                    multi_encodings = None
-                    if db_face.get("multi_angle_encodings"):
-                        try:
-                            multi_encodings = face_service.decode_multiple_from_bytes(db_face["multi_angle_encodings"])
-                        except Exception as e:
-                            logger.error(f"Error decoding multi-angle encodings: {e}")
-                    
-                    if multi_encodings:
-                        # Compare against all multi-angle encodings and find the best match
-                        for db_encoding in multi_encodings:
-                            # Check if we have pose data for better matching
-                            poses = None
-                            if face_analysis and "pose" in face_analysis and db_face.get("face_analysis"):
-                                try:
-                                    db_face_analysis = json.loads(db_face["face_analysis"])
-                                    if "pose" in db_face_analysis:
-                                        poses = {
-                                            "known": db_face_analysis["pose"],
-                                            "unknown": face_analysis["pose"]
-                                        }
-                                        used_poses = True
-                                except:
-                                    poses = None
-                            
-                            # Run comparison in thread pool with pose information if available
-                            if poses:
-                                match_result, distance, adjusted_tolerance = await run_in_threadpool(
-                                    lambda: face_service.compare_faces(db_encoding, face_encoding, poses=poses)
-                                )
-                            else:
-                                match_result, distance, adjusted_tolerance = await run_in_threadpool(
-                                    lambda: face_service.compare_faces(db_encoding, face_encoding)
-                                )
-                            
-                            total_comparisons += 1
-                            
-                            if match_result and distance < lowest_distance:
-                                lowest_distance = distance
-                                best_match = {
-                                    "user_id": db_face["id"],
-                                    "face_id": db_face["face_id"],
-                                    "name": db_face["name"],
-                                    "image_path": db_face["image_path"] or db_face["image_url"],
-                                    "confidence": 1.0 - distance,  # Convert distance to confidence
-                                    "adjusted_tolerance": adjusted_tolerance,
-                                    "multi_angle_match": True
-                                }
-                    else:
-                        # Fall back to single encoding comparison
-                        db_encoding = face_service.decode_from_bytes(db_face["face_encoding"])
-                        
-                        # Check if we have pose data for both faces for better matching
-                        poses = None
-                        if face_analysis and "pose" in face_analysis and db_face.get("face_analysis"):
-                            try:
-                                db_face_analysis = json.loads(db_face["face_analysis"])
-                                if "pose" in db_face_analysis:
-                                    poses = {
-                                        "known": db_face_analysis["pose"],
-                                        "unknown": face_analysis["pose"]
-                                    }
-                                    used_poses = True
-                            except:
-                                poses = None
-                        
-                        # Run comparison in thread pool with pose information if available
-                        if poses:
-                            match_result, distance, adjusted_tolerance = await run_in_threadpool(
-                                lambda: face_service.compare_faces(db_encoding, face_encoding, poses=poses)
-                            )
-                        else:
-                            match_result, distance, adjusted_tolerance = await run_in_threadpool(
-                                lambda: face_service.compare_faces(db_encoding, face_encoding)
-                            )
-                        
-                        total_comparisons += 1
-                        
-                        if match_result and distance < lowest_distance:
-                            lowest_distance = distance
-                            best_match = {
-                                "user_id": db_face["id"],
-                                "face_id": db_face["face_id"],
-                                "name": db_face["name"],
-                                "image_path": db_face["image_path"] or db_face["image_url"],
-                                "confidence": 1.0 - distance,  # Convert distance to confidence
-                                "adjusted_tolerance": adjusted_tolerance,
-                                "multi_angle_match": False
-                            }
+            # Take the best match whose user still exists
+            best_match, user = await _best_existing_match(candidates)
             
             # If we have a match
             if best_match:
-                # Get full user info
-                user = await database.get_user_by_id(best_match["user_id"])
-                if "face_encoding" in user:
-                    del user["face_encoding"]
-                if "multi_angle_encodings" in user:
-                    del user["multi_angle_encodings"]
-                
                 confidence = best_match["confidence"]
                 
                 # Determine if this is a solid match or a possible match
                 if confidence >= 0.7:  # More confident match
-                    return {
+                    response = {
                         "status": "success",
                         "message": f"Face recognized as {user['name']}!",
                         "recognized": True,
@@ -273,7 +344,7 @@ async def recognize_face(
                         }
                     }
                 else:  # Less confident match
-                    return {
+                    response = {
                         "status": "success",
                         "message": f"Possible match found: {user['name']}",
                         "recognized": True,
@@ -290,7 +361,7 @@ async def recognize_face(
                         }
                     }
             else:
-                return {
+                response = {
                     "status": "success",
                     "message": "No matching face found in the database.",
                     "recognized": False,
@@ -302,6 +373,11 @@ async def recognize_face(
                         "pose_recommendation": face_analysis.get("pose_recommendation") if face_analysis else None
                     }
                 }
+            
+            # Include ranked candidates for operator review when requested
+            if top_k:
+                response["candidates"] = candidates
+            return response
         except Exception as e:
             logger.error(f"Error during face recognition: {e}")
             return JSONResponse(
@@ -312,8 +388,183 @@ async def recognize_face(
                 }
             )
 
+async def _read_batch_images(request: Request) -> List[Any]:
+    """
+    Read batch probe images from a JSON array or a multipart upload.
+    
+    JSON bodies may be an array of base64 strings or an object with an
+    "images" array. Multipart bodies may repeat "files" uploads and/or
+    "image_base64" fields. Empty entries are kept so that results line up
+    with the request.
+    
+    Args:
+        request: The request object
+    
+    Returns:
+        A list of raw image bytes or base64 strings, with empty entries as None
+    """
+    if request.headers.get("content-type", "").startswith("application/json"):
+        body = await request.json()
+        if isinstance(body, dict):
+            body = body.get("images", [])
+        if not isinstance(body, list):
+            raise ValueError("Expected a JSON array of base64 images")
+        return [image or None for image in body]
+    
+    form = await request.form()
+    images = []
+    for item in form.getlist("files"):
+        if hasattr(item, "read"):
+            images.append(await item.read() or None)
+    images.extend(item or None for item in form.getlist("image_base64"))
+    return images
+
+async def _process_batch_image(image: Any, limit: asyncio.Semaphore) -> Dict[str, Any]:
+    """Process one batch probe image, reporting an empty entry as an error."""
+    if not image:
+        return {"error": "No image provided."}
+    async with limit:
+        return await face_engine.call("process_probe", image)
+
+@router.post("/api/recognize/batch")
+async def recognize_faces_batch(
+    request: Request,
+    top_k: Optional[int] = Query(None, description="Number of best distinct users to return per image"),
+    aggregate: str = Query("min", description="Per-user reduction of multi-angle distances (min or mean)")
+):
+    """
+    Recognize the first face in each of many probe images in one request.
+    
+    Images are decoded, detected and encoded in parallel on a worker pool,
+    at most FACE_WORKERS at a time, then all probe encodings are matched
+    against the gallery together. The whole batch counts as one of the
+    MAX_CONCURRENT_RECOGNITIONS concurrent recognitions.
+    
+    Args:
+        request: The request object carrying a JSON array or multipart images
+        top_k: Optional number of best distinct users to return as candidates
+        aggregate: How each user's multi-angle distances are reduced ("min" or "mean")
+    
+    Returns:
+        One recognition result per image, in request order
+    """
+    if top_k is not None and not 1 <= top_k <= config.RECOGNITION_MAX_TOP_K:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": f"top_k must be between 1 and {config.RECOGNITION_MAX_TOP_K}"}
+        )
+    if aggregate not in AGGREGATIONS:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": f"aggregate must be one of: {', '.join(AGGREGATIONS)}"}
+        )
+    
+    try:
+        images = await _read_batch_images(request)
+    except Exception as e:
+        logger.error(f"Error reading batch images: {e}")
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": f"Error reading batch images: {str(e)}"}
+        )
+    
+    if not images:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "No images provided."}
+        )
+    if len(images) > config.MAX_BATCH_IMAGES:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": f"At most {config.MAX_BATCH_IMAGES} images per batch"}
+        )
+    
+    # Use semaphore to limit concurrent face recognition operations
+    async with recognition_semaphore:
+        return await _recognize_batch(images, top_k, aggregate)
+
+async def _recognize_batch(images: List[Any], top_k: Optional[int], aggregate: str):
+    """
+    Recognize the first face in each batch probe image.
+    
+    Args:
+        images: Raw image bytes or base64 strings, with empty entries as None
+        top_k: Optional number of best distinct users to return as candidates
+        aggregate: How each user's multi-angle distances are reduced
+    
+    Returns:
+        One recognition result per image, in request order
+    """
+    try:
+        logger.info(f"Processing recognition batch of {len(images)} images")
+        
+        # Decode, detect and encode the images on the face worker pool, keeping
+        # no more in flight than there are workers so other requests can interleave
+        limit = asyncio.Semaphore(config.FACE_WORKERS)
+        probes = await asyncio.gather(*(_process_batch_image(image, limit) for image in images))
+        
+        # Match all probe encodings against the gallery together
+        encoded = [i for i, probe in enumerate(probes) if "encoding" in probe]
+        search_results = []
+        if encoded:
+            search_results = await run_in_threadpool(
+                lambda: gallery_service.search_batch(
+                    [probes[i]["encoding"] for i in encoded],
+                    top_k or 1,
+                    aggregate,
+                    [(probes[i]["face_analysis"] or {}).get("pose") for i in encoded]
+                )
+            )
+        matches = dict(zip(encoded, search_results))
+        
+        results = []
+        for i, probe in enumerate(probes):
+            if i not in matches:
+                result = {"index": i, "recognized": False, "message": probe["error"]}
+                if "quality_check" in probe:
+                    result["quality_check"] = probe["quality_check"]
+                results.append(result)
+                continue
+            
+            candidates = matches[i]["candidates"]
+            best_match, _ = await _best_existing_match(candidates)
+            result = {
+                "index": i,
+                "recognized": best_match is not None,
+                "face_location": probe["face_location"],
+                "comparisons": matches[i]["comparisons"],
+            }
+            if best_match:
+                result["message"] = f"Face recognized as {best_match['name']}"
+                result["match"] = best_match
+                result["confidence"] = best_match["confidence"]
+            else:
+                result["message"] = "No matching face found in the database."
+            if top_k:
+                result["candidates"] = candidates
+            results.append(result)
+        
+        recognized = sum(1 for result in results if result["recognized"])
+        return {
+            "status": "success",
+            "message": f"Recognized {recognized} of {len(images)} images",
+            "results": results,
+            "diagnostic": {
+                "images": len(images),
+                "encoded": len(encoded),
+                "recognized": recognized,
+                "registered_encodings": gallery_service.size
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error during batch face recognition: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"Error processing batch recognition request: {str(e)}"}
+        )
+
 # Legacy endpoint for backward compatibility
 @router.post("/recognize")
-async def recognize_face_legacy(image_base64: str = Body(..., embed=True)):
+async def recognize_face_legacy(request: Request, image_base64: str = Body(..., embed=True)):
     """Legacy endpoint for face recognition"""
-    return await recognize_face(Request, image_base64=image_base64)
+    return await recognize_face(request, file=None, image_base64=image_base64, top_k=None, aggregate="min", multi_face=False)
@@ -6,7 +6,10 @@ import uuid
 import json
 import os
 import base64
-from fastapi import APIRouter, HTTPException, File, UploadFile, Body, BackgroundTasks
+import shutil
+import tarfile
+import zipfile
+from fastapi import APIRouter, HTTPException, File, Form, UploadFile, Body
 from fastapi.responses import JSONResponse
 from fastapi.concurrency import run_in_threadpool
 from typing import List, Dict, Any, Optional
@@ -17,6 +20,9 @@ import time
 # Import services and utilities
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from services.face_service import face_service
+from services.execution_engine import face_engine
+from services.job_queue import job_queue, bulk_job_queue
+from services.bulk_enrollment import run_bulk_enrollment, load_checkpoint, read_manifest
 from utils.database import database
 from utils.logger import get_logger
 from config import config
@@ -27,63 +33,83 @@ logger = get_logger("api.registration")
 # Create router
 router = APIRouter(tags=["Registration"])
 
-async def process_face_encoding(user_id: str, file_path: str):
+async def process_face_encoding(
+    user_id: str,
+    file_path: str,
+    train_multiple: bool = True,
+    face_location: Optional[List[int]] = None
+) -> bool:
     """
-    Process face encoding in background
+    Compute a registered user's multi-angle encodings from their stored image.
+    
+    Runs as a "face_encoding" job on the background job queue. Registration
+    has already stored the base encoding, so only the variants are computed.
+    
+    Args:
+        user_id: The ID of the user
+        file_path: Path of the user's saved image
+        train_multiple: Whether to generate multi-angle encodings
+        face_location: Face box found at registration as (top, right, bottom, left),
+            in the uploaded image's coordinates; jobs queued without it detect
+            the face again
+    
+    Returns:
+        True if the user's encodings were updated, False otherwise
     """
+    if not train_multiple:
+        return True
+    
     try:
-        logger.info(f"Processing face encoding for user {user_id} from {file_path}")
-        # Offload CPU-intensive operation to thread pool
-        face_encoding = await run_in_threadpool(
-            lambda: face_service.process_image_file(file_path)
+        logger.info(f"Processing multi-angle encodings for user {user_id} from {file_path}")
+        # Decode the stored image the same way as the original upload
+        image, factor = await run_in_threadpool(
+            lambda: face_service.process_image_scaled(Path(file_path).read_bytes())
         )
-        
-        if face_encoding is not None:
-            # Detect faces
-            face_locations = face_service.detect_faces(face_encoding)
-            
-            if face_locations:
-                # Get first face location
-                face_location = face_locations[0]
-                
-                # Generate face encoding
-                face_encoding_vector = face_service.encode_face(face_encoding, face_location)
-                
-                if face_encoding_vector is not None:
-                    # Convert to bytes
-                    face_encoding_bytes = face_service.encode_to_bytes(face_encoding_vector)
-                    
-                    # Generate multi-angle encodings
-                    multi_encodings = face_service.generate_multi_angle_encodings(face_encoding, face_location)
-                    multi_encodings_bytes = face_service.encode_multiple_to_bytes(multi_encodings) if multi_encodings else None
-                    
-                    # Analyze face
-                    face_analysis = face_service.analyze_face(face_encoding, face_location)
-                    face_analysis_json = json.dumps(face_analysis) if face_analysis else None
-                    
-                    # Update in database
-                    await database.update_user(
-                        user_id, 
-                        {"face_analysis": face_analysis_json},
-                        face_encoding_bytes,
-                        multi_encodings_bytes
-                    )
-                    
-                    logger.info(f"✅ Updated face encoding for user {user_id}")
-                    return True
-            
-            logger.warning(f"⚠️ No faces detected in image for user {user_id}")
+        if image is None:
+            logger.warning(f"⚠️ Failed to process image for user {user_id}")
             return False
+        
+        if face_location is not None:
+            face_location = face_service.from_upload_location(face_location, factor, image.shape)
         else:
-            logger.warning(f"⚠️ Failed to process image for user {user_id}")
+            # Detect faces on the face worker pool
+            face_locations = await face_engine.call("detect_faces", image)
+            if not face_locations:
+                logger.warning(f"⚠️ No faces detected in image for user {user_id}")
+                return False
+            face_location = face_locations[0]
+        
+        # Generate multi-angle encodings
+        multi_encodings = await face_engine.call("generate_multi_angle_encodings", image, tuple(face_location))
+        if not multi_encodings:
+            logger.warning(f"⚠️ Failed to generate multi-angle encodings for user {user_id}")
             return False
+        
+        # Update in database, keeping the stored base encoding
+        updated = await database.update_user(
+            user_id,
+            {},
+            None,
+            face_service.encode_multiple_to_bytes(multi_encodings)
+        )
+        if not updated:
+            # Nothing left to do for a user deleted while the job was queued
+            logger.warning(f"⚠️ User {user_id} no longer exists; skipping face encoding")
+            return True
+        
+        logger.info(f"✅ Updated multi-angle encodings for user {user_id}")
+        return True
     except Exception as e:
         logger.error(f"❌ Error processing face encoding for user {user_id}: {e}")
         return False
 
+# Run face encoding jobs on the background job queue and bulk enrollment
+# jobs on their own queue
+job_queue.register_handler("face_encoding", process_face_encoding)
+bulk_job_queue.register_handler("bulk_enrollment", run_bulk_enrollment)
+
 @router.post("/api/register")
 async def register_face(
-    background_tasks: BackgroundTasks,
     name: str = Body(...),
     image_base64: str = Body(...),
     employee_id: Optional[str] = Body(None),
@@ -122,8 +148,8 @@ async def register_face(
     
     try:
         # Process the image using thread pool
-        image_array = await run_in_threadpool(
-            lambda: face_service.process_image(image_base64)
+        image_array, factor = await run_in_threadpool(
+            lambda: face_service.process_image_scaled(image_base64)
         )
         
         if image_array is None:
@@ -132,10 +158,8 @@ async def register_face(
                 content={"status": "error", "message": "Invalid image data"}
             )
         
-        # Detect faces using thread pool
-        face_locations = await run_in_threadpool(
-            lambda: face_service.detect_faces(image_array)
-        )
+        # Detect faces on the face worker pool
+        face_locations = await face_engine.call("detect_faces", image_array)
         
         if not face_locations:
             return JSONResponse(
@@ -146,10 +170,9 @@ async def register_face(
         # Get first face location
         face_location = face_locations[0]
         
-        # Analyze face to get pose and feature information
-        face_analysis = await run_in_threadpool(
-            lambda: face_service.analyze_face(image_array, face_location)
-        )
+        # Analyze and encode the face from a single landmark pass on the face worker pool
+        processed = await face_engine.call("process_face", image_array, face_location)
+        face_analysis = processed["face_analysis"]
         
         # Check face angle if not bypassed
         if not bypass_angle_check and face_analysis and "pose" in face_analysis:
@@ -169,10 +192,7 @@ async def register_face(
                     }
                 )
         
-        # Generate face encoding in a separate thread
-        face_encoding = await run_in_threadpool(
-            lambda: face_service.encode_face(image_array, face_location)
-        )
+        face_encoding = processed["encoding"]
         
         if face_encoding is None:
             return JSONResponse(
@@ -180,16 +200,9 @@ async def register_face(
                 content={"status": "error", "message": "Failed to generate face encoding. Please try a different image."}
             )
         
-        # Generate multi-angle encodings if requested
-        multi_encodings = None
-        if train_multiple:
-            multi_encodings = await run_in_threadpool(
-                lambda: face_service.generate_multi_angle_encodings(image_array, face_location)
-            )
-        
-        # Convert encodings to bytes for storage
+        # Convert encoding to bytes for storage; multi-angle encodings are
+        # generated afterwards by a background job
         face_encoding_bytes = face_service.encode_to_bytes(face_encoding)
-        multi_encodings_bytes = face_service.encode_multiple_to_bytes(multi_encodings) if multi_encodings else None
         
         # Generate user ID and face ID
         user_id = str(uuid.uuid4())
@@ -229,11 +242,28 @@ async def register_face(
             "created_at": time.strftime('%Y-%m-%d %H:%M:%S')
         }
         
-        # Add user to database
-        await database.add_user(user_data, face_encoding_bytes, multi_encodings_bytes)
+        # Add user to database; the user is recognizable from the base encoding right away
+        await database.add_user(user_data, face_encoding_bytes)
+        
+        # Queue multi-angle encoding generation
+        job = None
+        if train_multiple:
+            if image_path:
+                job_id = await job_queue.enqueue(
+                    "face_encoding",
+                    {
+                        "user_id": user_id,
+                        "file_path": image_path,
+                        "train_multiple": True,
+                        "face_location": list(face_service.to_upload_location(face_location, factor, image_array.shape))
+                    }
+                )
+                job = {"id": job_id, "status": "queued", "status_url": f"/api/register/jobs/{job_id}"}
+            else:
+                logger.warning(f"Skipping multi-angle encodings for user {user_id}: image was not saved")
         
         # Return success response
-        return {
+        response = {
             "status": "success",
             "message": f"User {name} registered successfully",
             "user_id": user_id,
@@ -250,9 +280,137 @@ async def register_face(
             },
             "face_analysis": face_analysis
         }
+        if job:
+            response["job"] = job
+        return response
     except Exception as e:
         logger.error(f"Error registering face: {e}")
         return JSONResponse(
             status_code=500,
             content={"status": "error", "message": f"Error registering face: {str(e)}"}
         )
+
+@router.post("/api/register/bulk")
+async def register_bulk(
+    archive: UploadFile = File(...),
+    manifest: UploadFile = File(...),
+    bypass_angle_check: bool = Form(False),
+    train_multiple: bool = Form(True)
+):
+    """
+    Register users in bulk from a zip or tar archive of images and a CSV manifest.
+    
+    The manifest has name, employee_id, department and role columns, plus an
+    image column with each user's image file name; without it, images are
+    matched by employee_id to the file name stem. The import runs as a
+    background job that resumes from its checkpoint if interrupted.
+    
+    Args:
+        archive: Zip or tar archive of face images
+        manifest: CSV manifest of the users
+        bypass_angle_check: Whether to accept faces not looking at the camera
+        train_multiple: Whether to generate multi-angle encodings
+    
+    Returns:
+        The queued import job
+    """
+    import_dir = Path(config.BULK_IMPORT_DIR) / str(uuid.uuid4())
+    try:
+        # Stream the uploads to disk so the job can read them later
+        def save_uploads() -> None:
+            import_dir.mkdir(parents=True, exist_ok=True)
+            for upload, target in ((archive, "images"), (manifest, "manifest.csv")):
+                with open(import_dir / target, "wb") as f:
+                    shutil.copyfileobj(upload.file, f)
+        
+        await run_in_threadpool(save_uploads)
+        source = str(import_dir / "images")
+        csv_path = str(import_dir / "manifest.csv")
+        error = None
+        if not (zipfile.is_zipfile(source) or tarfile.is_tarfile(source)):
+            error = "Archive must be a zip or tar file"
+        else:
+            try:
+                await run_in_threadpool(lambda: read_manifest(csv_path))
+            except (ValueError, UnicodeDecodeError) as e:
+                error = f"Invalid CSV manifest: {str(e)}"
+        if error:
+            await run_in_threadpool(lambda: shutil.rmtree(import_dir, ignore_errors=True))
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": error}
+            )
+        
+        job_id = await bulk_job_queue.enqueue(
+            "bulk_enrollment",
+            {
+                "source": source,
+                "csv_path": csv_path,
+                "checkpoint_path": str(import_dir / "checkpoint.json"),
+                "train_multiple": train_multiple,
+                "bypass_angle_check": bypass_angle_check
+            }
+        )
+        logger.info(f"Queued bulk enrollment job {job_id} from {archive.filename}")
+        
+        return {
+            "status": "success",
+            "message": "Bulk enrollment queued",
+            "job": {"id": job_id, "status": "queued", "status_url": f"/api/register/jobs/{job_id}"}
+        }
+    except Exception as e:
+        logger.error(f"Error queuing bulk enrollment: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"Error queuing bulk enrollment: {str(e)}"}
+        )
+
+@router.get("/api/register/jobs/{job_id}")
+async def get_registration_job(job_id: str):
+    """
+    Get the status of a background registration job.
+    
+    Args:
+        job_id: The ID of the job
+    
+    Returns:
+        The job's status, attempts and last error
+    """
+    try:
+        job = await job_queue.get_job(job_id)
+        if not job:
+            return JSONResponse(
+                status_code=404,
+                content={"status": "error", "message": f"Job with ID {job_id} not found"}
+            )
+        
+        response = {
+            "status": "success",
+            "job": {
+                "id": job["id"],
+                "kind": job["kind"],
+                "status": job["status"],
+                "user_id": job["payload"].get("user_id"),
+                "attempts": job["attempts"],
+                "error": job["error"],
+                "created_at": job["created_at"],
+                "updated_at": job["updated_at"]
+            }
+        }
+        
+        # Report bulk import progress from its checkpoint
+        if job["kind"] == "bulk_enrollment":
+            checkpoint = await run_in_threadpool(lambda: load_checkpoint(job["payload"]["checkpoint_path"]))
+            response["job"]["progress"] = {
+                "processed": checkpoint["position"],
+                "registered": checkpoint["registered"],
+                "failed": checkpoint["failed"],
+                "failures": checkpoint["failures"][:config.BULK_FAILURE_SAMPLE]
+            } if checkpoint else None
+        return response
+    except Exception as e:
+        logger.error(f"Error getting job {job_id}: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"Error getting job: {str(e)}"}
+        )
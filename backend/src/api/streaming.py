@@ -0,0 +1,333 @@
+"""
+Streaming recognition endpoints for the Face Recognition API.
+"""
+
+import time
+import uuid
+import base64
+import asyncio
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Dict, List, Optional, Union
+import sys
+from pathlib import Path
+
+# Import services and utilities
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from services.face_service import face_service
+from services.execution_engine import face_engine
+from services.face_tracker import FaceTracker
+from services.gallery_service import gallery_service, AGGREGATIONS
+from services.probe_cache import recent_probes
+from api.recognition import recognition_semaphore
+from utils.logger import get_logger
+from config import config
+
+# Get logger
+logger = get_logger("api.streaming")
+
+# Create router
+router = APIRouter(tags=["Streaming"])
+
+class LatestFrame:
+    """
+    Single-slot frame buffer for one connection.
+
+    A new frame overwrites any frame that has not been picked up yet, so
+    a slow consumer always processes the most recent frame.
+    """
+
+    def __init__(self):
+        self.frame: Optional[Union[bytes, str]] = None
+        self.sequence = 0
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def put(self, frame: Union[bytes, str]) -> None:
+        """Store a frame, dropping the pending one if there is any."""
+        if self.frame is not None:
+            self.dropped += 1
+        self.frame = frame
+        self.received += 1
+        self.sequence = self.received
+        self._ready.set()
+
+    def close(self) -> None:
+        """Wake the consumer and signal that no more frames will arrive."""
+        self.closed = True
+        self._ready.set()
+
+    async def take(self) -> Optional[tuple]:
+        """
+        Wait for the next frame.
+
+        Returns:
+            The latest frame and its sequence number, or None once the connection is closed
+        """
+        await self._ready.wait()
+        self._ready.clear()
+        if self.closed:
+            return None
+        frame, self.frame = self.frame, None
+        return frame, self.sequence
+
+async def _receive_frames(websocket: WebSocket, frames: LatestFrame) -> None:
+    """
+    Read frames from the socket into the frame slot until the client disconnects.
+
+    Binary messages are raw encoded images; text messages are base64 images.
+    """
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes") or message.get("text")
+            if data:
+                frames.put(data)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        # Abrupt closes surface as server-specific errors rather than WebSocketDisconnect
+        logger.info(f"Streaming connection closed while receiving: {e}")
+    finally:
+        frames.close()
+
+def _identity(candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Summarize the best candidate as a track identity, or None if it is not a match."""
+    best_match = candidates[0] if candidates and candidates[0]["within_tolerance"] else None
+    if best_match is None:
+        return None
+    return {
+        "user": {
+            "id": best_match["user_id"],
+            "name": best_match["name"],
+            "image_path": best_match["image_path"]
+        },
+        "confidence": best_match["confidence"],
+        "possible_match": best_match["confidence"] < 0.7
+    }
+
+async def _recognize_frame(
+    frame: Union[bytes, str],
+    client_id: str,
+    top_k: int,
+    aggregate: str
+) -> Dict[str, Any]:
+    """
+    Recognize the first face of one frame.
+
+    Args:
+        frame: Encoded image bytes or base64 string
+        client_id: Connection identifier for near-duplicate result reuse
+        top_k: Number of best distinct users to return as candidates
+        aggregate: How each user's multi-angle distances are reduced
+
+    Returns:
+        A recognition event
+    """
+    if isinstance(frame, str):
+        if frame.startswith("data:image"):
+            frame = frame.split(",")[1]
+        frame = base64.b64decode(frame)
+
+    # Decode, detect and encode on the face worker pool
+    probe = await face_engine.call("process_probe", frame)
+    if "error" in probe:
+        event = {"recognized": False, "message": probe["error"]}
+        if "quality_check" in probe:
+            event["quality_check"] = probe["quality_check"]
+        return event
+
+    top, right, bottom, left = probe["face_location"]
+    event = {
+        "recognized": False,
+        "face_location": {"top": top, "right": right, "bottom": bottom, "left": left},
+        "face_analysis": probe["face_analysis"]
+    }
+    if gallery_service.size == 0:
+        event["message"] = "No registered faces in the database to compare against."
+        return event
+
+    encoding = probe["encoding"]
+    pose = (probe["face_analysis"] or {}).get("pose")
+    params = ("single_face", top_k, aggregate)
+    version = gallery_service.version
+    search_result = recent_probes.get(client_id, encoding, params, version)
+    if search_result is None:
+        search_result = await run_in_threadpool(
+            lambda: gallery_service.search(encoding, top_k, aggregate, pose)
+        )
+        recent_probes.put(client_id, encoding, params, version, search_result)
+
+    candidates = search_result["candidates"]
+    identity = _identity(candidates)
+    if identity:
+        event.update(identity)
+        event["recognized"] = True
+        event["message"] = f"Face recognized as {identity['user']['name']}!"
+    else:
+        event["message"] = "No matching face found in the database."
+    if top_k > 1:
+        event["candidates"] = candidates
+    return event
+
+async def _track_frame(
+    frame: Union[bytes, str],
+    tracker: FaceTracker,
+    top_k: int,
+    aggregate: str
+) -> Dict[str, Any]:
+    """
+    Recognize the faces of one frame in tracking mode.
+
+    Faces are followed between periodic detections, and only tracks that
+    are new or not yet identified are encoded and matched.
+
+    Args:
+        frame: Encoded image bytes or base64 string
+        tracker: The connection's face tracker
+        top_k: Number of best distinct users to return as candidates per track
+        aggregate: How each user's multi-angle distances are reduced
+
+    Returns:
+        A recognition event with one entry per tracked face
+    """
+    image, factor = await run_in_threadpool(lambda: face_service.process_image_scaled(frame))
+    if image is None:
+        return {"recognized": False, "message": "Invalid image data or format not supported"}
+
+    detected = False
+    if not tracker.needs_detection():
+        await run_in_threadpool(lambda: tracker.follow(image))
+
+    # Detect periodically, or right away when a track was lost
+    pending = []
+    if tracker.needs_detection():
+        detected = True
+        version = gallery_service.version
+        face_locations = await face_engine.call("detect_faces", image)
+        pending = await run_in_threadpool(lambda: tracker.update(image, face_locations, version))
+
+    if pending:
+        version = gallery_service.version
+        processed = await face_engine.call("process_faces", image, [track.location for track in pending], True)
+        encoded = [i for i, result in enumerate(processed) if result["encoding"] is not None]
+        if encoded and gallery_service.size:
+            search_results = await run_in_threadpool(
+                lambda: gallery_service.search_batch(
+                    [processed[i]["encoding"] for i in encoded],
+                    top_k,
+                    aggregate,
+                    [(processed[i]["face_analysis"] or {}).get("pose") for i in encoded]
+                )
+            )
+            for i, search_result in zip(encoded, search_results):
+                candidates = search_result["candidates"]
+                tracker.identify(pending[i], _identity(candidates), version, candidates)
+
+    faces = []
+    for track in tracker.tracks:
+        # Tracks follow the decoded frame; report boxes in the uploaded frame's coordinates
+        top, right, bottom, left = face_service.to_upload_location(track.location, factor, image.shape)
+        face = {
+            "track_id": track.track_id,
+            "face_location": {"top": top, "right": right, "bottom": bottom, "left": left},
+            "recognized": track.identity is not None
+        }
+        if track.identity:
+            face.update(track.identity)
+        if top_k > 1:
+            face["candidates"] = track.candidates
+        faces.append(face)
+
+    recognized = sum(1 for face in faces if face["recognized"])
+    return {
+        "recognized": recognized > 0,
+        "message": f"Recognized {recognized} of {len(faces)} faces",
+        "faces": faces,
+        "detected": detected,
+        "identified_tracks": len(pending)
+    }
+
+@router.websocket("/ws/recognize")
+async def recognize_stream(websocket: WebSocket):
+    """
+    Recognize faces in a stream of frames.
+
+    The client pushes encoded images (binary JPEG frames, or base64 text)
+    and receives one JSON recognition event per processed frame. Frames
+    arriving while a frame is being processed replace each other, so only
+    the latest one is processed next and the rest are counted as dropped.
+
+    Query parameters:
+        top_k: Number of best distinct users to return as candidates (default 1)
+        aggregate: How each user's multi-angle distances are reduced ("min" or "mean")
+        client_id: Optional stable client identifier
+        track: If true, follow faces between periodic detections and identify
+            each track once instead of recognizing every frame from scratch
+    """
+    params = websocket.query_params
+    try:
+        top_k = int(params.get("top_k", "1"))
+    except ValueError:
+        top_k = 0
+    aggregate = params.get("aggregate", "min")
+    tracking = params.get("track", "false").lower() in ("1", "true", "yes")
+
+    await websocket.accept()
+    if not 1 <= top_k <= config.RECOGNITION_MAX_TOP_K:
+        await websocket.send_json({"status": "error", "message": f"top_k must be between 1 and {config.RECOGNITION_MAX_TOP_K}"})
+        await websocket.close(code=1008)
+        return
+    if aggregate not in AGGREGATIONS:
+        await websocket.send_json({"status": "error", "message": f"aggregate must be one of: {', '.join(AGGREGATIONS)}"})
+        await websocket.close(code=1008)
+        return
+
+    client_id = params.get("client_id") or f"ws:{uuid.uuid4()}"
+    frames = LatestFrame()
+    tracker = FaceTracker() if tracking else None
+    receiver = asyncio.create_task(_receive_frames(websocket, frames))
+    logger.info(f"Streaming recognition started for {client_id}")
+
+    try:
+        while True:
+            taken = await frames.take()
+            if taken is None:
+                break
+            frame, sequence = taken
+
+            start_time = time.time()
+            try:
+                async with recognition_semaphore:
+                    if tracker is not None:
+                        event = await _track_frame(frame, tracker, top_k, aggregate)
+                    else:
+                        event = await _recognize_frame(frame, client_id, top_k, aggregate)
+                event["status"] = "success"
+            except Exception as e:
+                logger.error(f"Error during streaming recognition: {e}")
+                event = {"status": "error", "message": f"Error processing frame: {str(e)}"}
+
+            event.update({
+                "frame": sequence,
+                "dropped_frames": frames.dropped,
+                "processing_ms": round((time.time() - start_time) * 1000, 2)
+            })
+            try:
+                await websocket.send_json(event)
+            except Exception as e:
+                # Abrupt closes surface as server-specific errors rather than WebSocketDisconnect
+                logger.info(f"Streaming connection for {client_id} closed while sending: {e}")
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        logger.info(
+            f"Streaming recognition ended for {client_id} "
+            f"({frames.received} frames received, {frames.dropped} dropped)"
+        )
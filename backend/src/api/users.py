@@ -4,9 +4,12 @@ User management endpoints for the Face Recognition API.
 
 import uuid
 import time
+import json
+import base64
+import binascii
 from fastapi import APIRouter, HTTPException, Path, Query, Response
 from fastapi.responses import JSONResponse, FileResponse
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import sys
 from pathlib import Path as FilePath
 import os
@@ -23,18 +26,64 @@ logger = get_logger("api.users")
 # Create router
 router = APIRouter(tags=["Users"])
 
+def _encode_cursor(user: Dict[str, Any]) -> str:
+    """
+    Build the opaque cursor pointing after a user in the listing order.
+    
+    Args:
+        user: The last user of a page
+    
+    Returns:
+        A URL-safe cursor string
+    """
+    position = json.dumps([user["created_at"] or "", user["id"]]).encode()
+    return base64.urlsafe_b64encode(position).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Read the listing position from a cursor made by _encode_cursor.
+    
+    Args:
+        cursor: The cursor string
+    
+    Returns:
+        The (created_at, id) position
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(user_id, str):
+        raise ValueError("Invalid cursor")
+    return created_at, user_id
+
 @router.get("/api/users")
-async def get_users(page: int = Query(1, description="Page number"), limit: int = Query(100, description="Items per page")):
+async def get_users(
+    page: int = Query(1, description="Page number"),
+    limit: int = Query(100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page; takes precedence over page")
+):
     """
     Get all registered users with pagination and caching.
     
+    Pages are either numbered (page) or follow a cursor: every full page
+    carries a next_cursor, and passing it back returns the following page
+    with a constant-cost index seek however deep the listing goes.
+    
     Args:
         page: Page number (starting from 1)
         limit: Number of items per page
+        cursor: Opaque position from a previous page's next_cursor
     
     Returns:
         List of registered users
     """
+    if cursor is not None:
+        return await _get_users_after_cursor(cursor, limit)
+    
     cache_key = f"users_page_{page}_limit_{limit}"
     
     try:
@@ -47,13 +96,6 @@ async def get_users(page: int = Query(1, description="Page number"), limit: int
         logger.info(f"Getting users (page {page}, limit {limit})")
         users = await database.get_users_paginated(page, limit)
         
-        # Clean face_encoding from response
-        for user in users:
-            if "face_encoding" in user:
-                del user["face_encoding"]
-            if "multi_angle_encodings" in user:
-                del user["multi_angle_encodings"]
-        
         # Get total count for pagination info
         total_count = await database.get_users_count()
         
@@ -65,7 +107,8 @@ async def get_users(page: int = Query(1, description="Page number"), limit: int
                 "page": page,
                 "limit": limit,
                 "total": total_count,
-                "pages": (total_count + limit - 1) // limit
+                "pages": (total_count + limit - 1) // limit,
+                "next_cursor": _encode_cursor(users[-1]) if users and page * limit < total_count else None
             }
         }
         
@@ -80,6 +123,100 @@ async def get_users(page: int = Query(1, description="Page number"), limit: int
             content={"status": "error", "message": f"Failed to retrieve users: {str(e)}"}
         )
 
+async def _get_users_after_cursor(cursor: str, limit: int):
+    """
+    Get the page of users following a cursor.
+    
+    Args:
+        cursor: Opaque position from a previous page's next_cursor
+        limit: Number of items per page
+    
+    Returns:
+        List of registered users with the cursor of the following page
+    """
+    try:
+        after = _decode_cursor(cursor)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": str(e)}
+        )
+    
+    cache_key = f"users_cursor_{cursor}_limit_{limit}"
+    
+    try:
+        # Try to get data from cache first
+        cache_data = await database.get_cache(cache_key)
+        if cache_data:
+            logger.info(f"Retrieved users from cache (cursor {cursor}, limit {limit})")
+            return cache_data
+        
+        # Fetch one extra user to know whether another page follows
+        users = await database.get_users_after(after, limit + 1)
+        has_more = len(users) > limit
+        users = users[:limit]
+        
+        # Get total count for pagination info
+        total_count = await database.get_users_count()
+        
+        response = {
+            "status": "success",
+            "message": f"Retrieved {len(users)} users",
+            "users": users,
+            "pagination": {
+                "limit": limit,
+                "total": total_count,
+                "next_cursor": _encode_cursor(users[-1]) if has_more else None
+            }
+        }
+        
+        # Cache the response for 5 minutes
+        await database.set_cache(cache_key, response, 300)
+        
+        return response
+    except Exception as e:
+        logger.error(f"Error getting users after cursor: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"Failed to retrieve users: {str(e)}"}
+        )
+
+# Declared before /api/users/{user_id}, which would otherwise capture "search" as a user ID
+@router.get("/api/users/search")
+async def search_users(
+    query: str = Query(..., description="Search query"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results")
+):
+    """
+    Search for users by name, employee ID, department, or role.
+    
+    Each word of the query matches as a prefix, so partial input works for
+    type-ahead search. Results are ranked by relevance.
+    
+    Args:
+        query: The search query
+        limit: Maximum number of results
+    
+    Returns:
+        List of matching users
+    """
+    try:
+        logger.info(f"Searching for users with query: {query}")
+        
+        users = await database.search_users(query, limit)
+        
+        return {
+            "status": "success",
+            "message": f"Found {len(users)} users matching '{query}'",
+            "users": users
+        }
+    except Exception as e:
+        logger.error(f"Error searching users: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"Failed to search users: {str(e)}"}
+        )
+
 @router.get("/api/users/{user_id}")
 async def get_user_by_id(user_id: str = Path(..., description="The ID of the user to retrieve")):
     """
@@ -102,12 +239,6 @@ async def get_user_by_id(user_id: str = Path(..., description="The ID of the use
                 content={"status": "error", "message": f"User with ID {user_id} not found"}
             )
         
-        # Don't send face encoding data
-        if "face_encoding" in user:
-            del user["face_encoding"]
-        if "multi_angle_encodings" in user:
-            del user["multi_angle_encodings"]
-        
         return {
             "status": "success",
             "message": "User found",
@@ -223,46 +354,11 @@ async def delete_user(user_id: str = Path(..., description="The ID of the user t
             content={"status": "error", "message": f"Failed to delete user: {str(e)}"}
         )
 
-@router.get("/api/users/search")
-async def search_users(query: str = Query(..., description="Search query")):
-    """
-    Search for users by name, employee ID, department, or role.
-    
-    Args:
-        query: The search query
-    
-    Returns:
-        List of matching users
-    """
-    try:
-        logger.info(f"Searching for users with query: {query}")
-        
-        users = await database.search_users(query)
-        
-        # Clean face_encoding from response
-        for user in users:
-            if "face_encoding" in user:
-                del user["face_encoding"]
-            if "multi_angle_encodings" in user:
-                del user["multi_angle_encodings"]
-        
-        return {
-            "status": "success",
-            "message": f"Found {len(users)} users matching '{query}'",
-            "users": users
-        }
-    except Exception as e:
-        logger.error(f"Error searching users: {e}")
-        return JSONResponse(
-            status_code=500,
-            content={"status": "error", "message": f"Failed to search users: {str(e)}"}
-        )
-
 # Legacy endpoints for backward compatibility
 @router.get("/users")
 async def get_users_legacy():
     """Legacy endpoint for getting all users"""
-    return await get_users()
+    return await get_users(page=1, limit=100, cursor=None)
 
 @router.get("/users/{user_id}")
 async def get_user_by_id_legacy(user_id: str = Path(..., description="The ID of the user to retrieve")):
@@ -0,0 +1,70 @@
+"""
+Command line bulk enrollment for the Face Recognition API.
+
+Registers users from a directory or zip/tar archive of images and a CSV
+manifest. Re-running the same command resumes an interrupted import from
+its checkpoint. A running API server picks up the new users on restart.
+
+Usage:
+    python bulk_enroll.py <images dir or archive> <manifest.csv> [options]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Import config and logger
+sys.path.append(str(Path(__file__).resolve().parent))
+from config import config
+from utils.logger import get_logger
+from services.execution_engine import face_engine
+from services.bulk_enrollment import BulkEnrollment
+
+# Get logger
+logger = get_logger("bulk_enroll")
+
+async def run(args: argparse.Namespace) -> dict:
+    """
+    Run the import on a freshly started face worker pool.
+    
+    Args:
+        args: Parsed command line arguments
+    
+    Returns:
+        The import's final checkpoint
+    """
+    face_engine.start()
+    try:
+        return await BulkEnrollment(
+            args.source,
+            args.manifest,
+            args.checkpoint,
+            train_multiple=not args.no_multi_angle,
+            bypass_angle_check=args.bypass_angle_check,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size
+        ).run()
+    finally:
+        face_engine.shutdown()
+
+def main():
+    """
+    Main entry point for bulk enrollment.
+    """
+    parser = argparse.ArgumentParser(description="Register users in bulk from images and a CSV manifest.")
+    parser.add_argument("source", help="Directory, zip file or tar file of face images")
+    parser.add_argument("manifest", help="CSV with name, employee_id, department, role and optional image columns")
+    parser.add_argument("--checkpoint", help="Progress checkpoint file (derived from the paths by default)")
+    parser.add_argument("--no-multi-angle", action="store_true", help="Skip multi-angle encodings")
+    parser.add_argument("--bypass-angle-check", action="store_true", help="Accept faces not looking at the camera")
+    parser.add_argument("--concurrency", type=int, default=config.BULK_CONCURRENCY, help="Images processed at once")
+    parser.add_argument("--batch-size", type=int, default=config.BULK_BATCH_SIZE, help="Users written per transaction")
+    args = parser.parse_args()
+    
+    summary = asyncio.run(run(args))
+    print(json.dumps({key: summary[key] for key in ("position", "registered", "failed", "failures", "failures_path")}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
 # Database settings
 DB_PATH = os.environ.get("DB_PATH", str(BASE_DIR / "data" / "face_recognition.db"))
+# Milliseconds a connection waits for a lock held by another writer
+DB_TIMEOUT = int(os.environ.get("DB_TIMEOUT", "10000"))
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", "16384"))  # page cache per connection
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+# Threads running read-only queries concurrently; writes share one writer thread
+DB_READERS = int(os.environ.get("DB_READERS", "4"))
 
 # API settings
 API_HOST = os.environ.get("API_HOST", "0.0.0.0")
@@ -26,7 +32,65 @@ API_VERSION = "1.0.0"
 FACE_RECOGNITION_TOLERANCE = float(os.environ.get("FACE_RECOGNITION_TOLERANCE", "0.6"))
 FACE_RECOGNITION_MODEL = os.environ.get("FACE_RECOGNITION_MODEL", "hog")  # 'hog' or 'cnn'
 MULTI_ANGLE_JITTER = int(os.environ.get("MULTI_ANGLE_JITTER", "10"))
+FACE_ENCODING_JITTERS = int(os.environ.get("FACE_ENCODING_JITTERS", "1"))
+# Longest image side used for face detection; 0 detects at full resolution
+FACE_DETECTION_MAX_SIDE = int(os.environ.get("FACE_DETECTION_MAX_SIDE", "640"))
+# Large JPEGs are decoded at a reduced scale that keeps the longest side at least this; 0 decodes at full size
+IMAGE_DECODE_MAX_SIDE = int(os.environ.get("IMAGE_DECODE_MAX_SIDE", "1600"))
 MAX_CONCURRENT_RECOGNITIONS = int(os.environ.get("MAX_CONCURRENT_RECOGNITIONS", "5"))
+RECOGNITION_MAX_TOP_K = int(os.environ.get("RECOGNITION_MAX_TOP_K", "20"))
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", "500"))
+# Early rejection of recognition probes that cannot match, checked before encoding
+QUALITY_GATE_ENABLED = os.environ.get("QUALITY_GATE_ENABLED", "True").lower() == "true"
+QUALITY_MIN_FACE_SIZE = int(os.environ.get("QUALITY_MIN_FACE_SIZE", "40"))  # pixels
+QUALITY_MIN_SHARPNESS = float(os.environ.get("QUALITY_MIN_SHARPNESS", "20"))  # Laplacian variance
+QUALITY_MIN_BRIGHTNESS = float(os.environ.get("QUALITY_MIN_BRIGHTNESS", "40"))  # mean gray level
+QUALITY_MAX_BRIGHTNESS = float(os.environ.get("QUALITY_MAX_BRIGHTNESS", "220"))
+QUALITY_MAX_YAW = float(os.environ.get("QUALITY_MAX_YAW", "45"))  # degrees
+QUALITY_MAX_ROLL = float(os.environ.get("QUALITY_MAX_ROLL", "40"))  # degrees
+# Pool running detection, encoding and analysis: 'thread' or 'process'
+FACE_EXECUTOR = os.environ.get("FACE_EXECUTOR", "thread")
+FACE_WORKERS = int(os.environ.get("FACE_WORKERS", str(os.cpu_count() or 4)))
+FACE_PROCESS_START_METHOD = os.environ.get("FACE_PROCESS_START_METHOD", "spawn")
+
+# Background job settings
+# Jobs (such as multi-angle registration encodings) executed concurrently
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))  # seconds
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+# Bulk enrollment settings
+# Images decoded and encoded concurrently during a bulk import
+BULK_CONCURRENCY = int(os.environ.get("BULK_CONCURRENCY", str(FACE_WORKERS)))
+# Users written per database transaction
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", "200"))
+# Bulk imports executed concurrently, on workers separate from JOB_WORKERS
+BULK_JOB_WORKERS = int(os.environ.get("BULK_JOB_WORKERS", "1"))
+# Failures kept in an import's checkpoint; every failure goes to its failures log
+BULK_FAILURE_SAMPLE = int(os.environ.get("BULK_FAILURE_SAMPLE", "100"))
+# Uploaded bulk imports and their progress checkpoints
+BULK_IMPORT_DIR = os.environ.get("BULK_IMPORT_DIR", str(BASE_DIR / "data" / "bulk"))
+
+# Streaming settings
+# Frames between full face detections when tracking a stream
+STREAM_DETECT_INTERVAL = int(os.environ.get("STREAM_DETECT_INTERVAL", "10"))
+# Template match score below which a tracked face is re-detected
+STREAM_TRACK_MIN_SCORE = float(os.environ.get("STREAM_TRACK_MIN_SCORE", "0.6"))
+# Box overlap needed to keep a track's identity across detections
+STREAM_TRACK_MIN_IOU = float(os.environ.get("STREAM_TRACK_MIN_IOU", "0.3"))
+# Frames after which a tracked face's identity is verified again
+STREAM_TRACK_REVERIFY_INTERVAL = int(os.environ.get("STREAM_TRACK_REVERIFY_INTERVAL", "30"))
+
+# Gallery settings
+# Fraction of tombstoned gallery rows that triggers a background compaction
+GALLERY_COMPACTION_THRESHOLD = float(os.environ.get("GALLERY_COMPACTION_THRESHOLD", "0.2"))
+# Nearest-neighbour index behind the gallery matcher: 'exact' or 'ivf'
+GALLERY_INDEX = os.environ.get("GALLERY_INDEX", "exact")
+# Number of IVF clusters; 0 picks ~sqrt(N) when the index is trained
+GALLERY_IVF_NLIST = int(os.environ.get("GALLERY_IVF_NLIST", "0"))
+# IVF clusters scanned per query: higher improves recall, lower reduces latency
+GALLERY_IVF_NPROBE = int(os.environ.get("GALLERY_IVF_NPROBE", "8"))
+GALLERY_INDEX_PATH = os.environ.get("GALLERY_INDEX_PATH", str(BASE_DIR / "data" / "gallery_index.npz"))
 
 # File storage settings
 UPLOADS_DIR = BASE_DIR / "uploads"
@@ -57,6 +121,14 @@ CORS_ORIGINS = os.environ.get("CORS_ORIGINS", "*").split(",")
 # Cache settings
 CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "True").lower() == "true"
 CACHE_TTL = int(os.environ.get("CACHE_TTL", "3600"))  # 1 hour
+# In-process cache of probe encodings keyed by image content; 0 entries disables it
+PROBE_CACHE_SIZE = int(os.environ.get("PROBE_CACHE_SIZE", "1024"))
+PROBE_CACHE_TTL = int(os.environ.get("PROBE_CACHE_TTL", "300"))  # 5 minutes
+# Per-client reuse of match results for near-identical consecutive probes; distance 0 disables it
+PROBE_REUSE_DISTANCE = float(os.environ.get("PROBE_REUSE_DISTANCE", "0.05"))
+PROBE_REUSE_TTL = float(os.environ.get("PROBE_REUSE_TTL", "5"))  # seconds
+PROBE_REUSE_PER_CLIENT = int(os.environ.get("PROBE_REUSE_PER_CLIENT", "4"))
+PROBE_REUSE_MAX_CLIENTS = int(os.environ.get("PROBE_REUSE_MAX_CLIENTS", "1024"))
 
 # Security settings
 JWT_SECRET = os.environ.get("JWT_SECRET", "your-secret-key-change-in-production")
@@ -82,11 +154,56 @@ def get_all_config() -> Dict[str, Any]:
             "tolerance": FACE_RECOGNITION_TOLERANCE,
             "model": FACE_RECOGNITION_MODEL,
             "multi_angle_jitter": MULTI_ANGLE_JITTER,
+            "encoding_jitters": FACE_ENCODING_JITTERS,
+            "detection_max_side": FACE_DETECTION_MAX_SIDE,
+            "decode_max_side": IMAGE_DECODE_MAX_SIDE,
             "max_concurrent_recognitions": MAX_CONCURRENT_RECOGNITIONS,
+            "max_top_k": RECOGNITION_MAX_TOP_K,
+            "max_batch_images": MAX_BATCH_IMAGES,
+            "quality_gate": {
+                "enabled": QUALITY_GATE_ENABLED,
+                "min_face_size": QUALITY_MIN_FACE_SIZE,
+                "min_sharpness": QUALITY_MIN_SHARPNESS,
+                "min_brightness": QUALITY_MIN_BRIGHTNESS,
+                "max_brightness": QUALITY_MAX_BRIGHTNESS,
+                "max_yaw": QUALITY_MAX_YAW,
+                "max_roll": QUALITY_MAX_ROLL,
+            },
+            "executor": FACE_EXECUTOR,
+            "workers": FACE_WORKERS,
+        },
+        "jobs": {
+            "workers": JOB_WORKERS,
+            "poll_interval": JOB_POLL_INTERVAL,
+            "max_attempts": JOB_MAX_ATTEMPTS,
+        },
+        "bulk_enrollment": {
+            "concurrency": BULK_CONCURRENCY,
+            "batch_size": BULK_BATCH_SIZE,
+            "job_workers": BULK_JOB_WORKERS,
+            "failure_sample": BULK_FAILURE_SAMPLE,
+            "import_dir": BULK_IMPORT_DIR,
+        },
+        "streaming": {
+            "detect_interval": STREAM_DETECT_INTERVAL,
+            "track_min_score": STREAM_TRACK_MIN_SCORE,
+            "track_min_iou": STREAM_TRACK_MIN_IOU,
+            "track_reverify_interval": STREAM_TRACK_REVERIFY_INTERVAL,
+        },
+        "gallery": {
+            "compaction_threshold": GALLERY_COMPACTION_THRESHOLD,
+            "index": GALLERY_INDEX,
+            "ivf_nlist": GALLERY_IVF_NLIST,
+            "ivf_nprobe": GALLERY_IVF_NPROBE,
+            "index_path": GALLERY_INDEX_PATH,
         },
         "storage": {
             "uploads_dir": str(UPLOADS_DIR),
             "db_path": DB_PATH,
+            "db_timeout": DB_TIMEOUT,
+            "db_cache_size_kb": DB_CACHE_SIZE_KB,
+            "db_mmap_size": DB_MMAP_SIZE,
+            "db_readers": DB_READERS,
         },
         "logging": {
             "level": LOG_LEVEL,
@@ -98,5 +215,11 @@ def get_all_config() -> Dict[str, Any]:
         "cache": {
             "enabled": CACHE_ENABLED,
             "ttl": CACHE_TTL,
+            "probe_cache_size": PROBE_CACHE_SIZE,
+            "probe_cache_ttl": PROBE_CACHE_TTL,
+            "probe_reuse_distance": PROBE_REUSE_DISTANCE,
+            "probe_reuse_ttl": PROBE_REUSE_TTL,
+            "probe_reuse_per_client": PROBE_REUSE_PER_CLIENT,
+            "probe_reuse_max_clients": PROBE_REUSE_MAX_CLIENTS,
         },
     }
@@ -0,0 +1,422 @@
+"""
+Nearest-neighbour indexes for the face gallery.
+Indexes narrow a probe down to a bounded set of candidate gallery rows; the
+gallery then computes exact distances on those rows only.
+"""
+
+import os
+import math
+import hashlib
+import numpy as np
+from typing import Any, List, Optional
+import sys
+from pathlib import Path
+
+# Import config and logger
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import config
+from utils.logger import get_logger
+
+# Get logger
+logger = get_logger("ann_index")
+
+# Rows per chunk when assigning vectors to centroids, to bound temporary memory
+ASSIGN_CHUNK_ROWS = 65536
+# Training sample size per IVF cluster
+TRAIN_ROWS_PER_LIST = 64
+# Lloyd iterations used to train the IVF centroids
+TRAIN_ITERATIONS = 10
+
+class ExactIndex:
+    """Brute-force index: every gallery row is a candidate."""
+
+    name = "exact"
+
+    def build(self, matrix: np.ndarray, owners: np.ndarray) -> None:
+        """Build the index over the gallery rows."""
+
+    def train(self, matrix: np.ndarray) -> None:
+        """Build the index over the gallery rows from scratch, ignoring persisted state."""
+
+    def needs_training(self, count: int) -> bool:
+        """Check whether a gallery of the given size should retrain the index."""
+        return False
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Index newly appended gallery rows."""
+
+    def remap(self, remap: np.ndarray) -> None:
+        """Renumber rows after a gallery compaction."""
+
+    def snapshot(self) -> Any:
+        """Return an immutable view of the index state for a concurrent search."""
+        return None
+
+    def candidates(self, state: Any, probe: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Select candidate rows for a probe.
+
+        Returns:
+            Row indices to compare against, or None to compare against all rows
+        """
+        return None
+
+    def save(self, matrix: np.ndarray, owners: np.ndarray, alive: np.ndarray) -> None:
+        """Persist the index to disk."""
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file index: rows are clustered around k-means centroids and a
+    query only scans the clusters closest to the probe.
+    """
+
+    name = "ivf"
+
+    def __init__(
+        self,
+        nlist: int = config.GALLERY_IVF_NLIST,
+        nprobe: int = config.GALLERY_IVF_NPROBE,
+        path: Optional[str] = config.GALLERY_INDEX_PATH
+    ):
+        """
+        Initialize an untrained IVF index.
+
+        Args:
+            nlist: Number of clusters, or 0 to pick ~sqrt(N) when building
+            nprobe: Number of clusters scanned per query (recall vs latency)
+            path: File the index is persisted to, or None to disable persistence
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.path = path
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+
+    def build(self, matrix: np.ndarray, owners: np.ndarray) -> None:
+        """
+        Build the index, reusing persisted centroids and assignments when possible.
+
+        Args:
+            matrix: Gallery matrix (N x 128)
+            owners: Row owner user IDs
+        """
+        assign = self._load(matrix, owners)
+        if assign is None:
+            self.train(matrix)
+            return
+
+        self._lists = self._group(np.arange(len(matrix)), assign)
+
+    def train(self, matrix: np.ndarray) -> None:
+        """
+        Train centroids on the gallery rows and assign every row.
+
+        A gallery too small to partition is left untrained and searched
+        exhaustively until needs_training() reports that it has grown enough.
+
+        Args:
+            matrix: Gallery matrix (N x 128)
+        """
+        nlist = self._target_nlist(len(matrix))
+        if nlist is None:
+            logger.info(f"Gallery too small for IVF ({len(matrix)} rows); using exact search")
+            self._centroids = None
+            self._lists = []
+            return
+
+        self._centroids = self._train(matrix, nlist)
+        self._lists = self._group(np.arange(len(matrix)), self._assign(matrix))
+        logger.info(f"Trained IVF index with {nlist} lists over {len(matrix)} rows")
+
+    def needs_training(self, count: int) -> bool:
+        """
+        Check whether a gallery of the given size should retrain the index.
+
+        An untrained index trains once the gallery is large enough to
+        partition. With an automatic list count, a trained index retrains
+        when the gallery has grown enough to double the number of lists.
+
+        Args:
+            count: Number of live gallery rows
+
+        Returns:
+            True if the index should be retrained
+        """
+        nlist = self._target_nlist(count)
+        if nlist is None:
+            return False
+        if self._centroids is None:
+            return True
+        return not self.nlist and nlist >= 2 * len(self._centroids)
+
+    def _target_nlist(self, count: int) -> Optional[int]:
+        """
+        Pick the number of clusters for a gallery size.
+
+        Args:
+            count: Number of gallery rows
+
+        Returns:
+            The number of clusters, or None if the gallery is too small to partition
+        """
+        nlist = self.nlist or int(math.sqrt(count))
+        if nlist < 2 or count < nlist:
+            return None
+        return nlist
+
+    def _train(self, matrix: np.ndarray, nlist: int) -> np.ndarray:
+        """
+        Train cluster centroids with k-means on a sample of the gallery.
+
+        Args:
+            matrix: Gallery matrix
+            nlist: Number of clusters
+
+        Returns:
+            Centroid matrix (nlist x 128)
+        """
+        rng = np.random.default_rng(0)
+        sample_size = min(len(matrix), nlist * TRAIN_ROWS_PER_LIST)
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(TRAIN_ITERATIONS):
+            assign = self._nearest(sample, centroids)
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=nlist)
+            filled = np.flatnonzero(counts)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+            centroids[filled] = np.add.reduceat(sample[order], starts, axis=0) / counts[filled, None]
+
+            # Reseed empty clusters from random sample rows
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+
+        return np.ascontiguousarray(centroids, dtype=np.float32)
+
+    def _nearest(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """
+        Find the nearest centroid for each vector, in bounded-size chunks.
+
+        Args:
+            vectors: Vectors to assign (N x 128)
+            centroids: Centroid matrix
+
+        Returns:
+            Array of N centroid indices
+        """
+        c_norms = np.einsum("ij,ij->i", centroids, centroids)
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+            chunk = vectors[start:start + ASSIGN_CHUNK_ROWS]
+            assign[start:start + len(chunk)] = np.argmin(c_norms - 2.0 * (chunk @ centroids.T), axis=1)
+        return assign
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Assign vectors to the trained centroids."""
+        return self._nearest(vectors, self._centroids)
+
+    def _group(self, rows: np.ndarray, assign: np.ndarray) -> List[np.ndarray]:
+        """
+        Group row indices into one sorted array per cluster.
+
+        Args:
+            rows: Row indices
+            assign: Cluster index for each row
+
+        Returns:
+            A list of row arrays, one per cluster
+        """
+        nlist = len(self._centroids)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.cumsum(np.bincount(assign, minlength=nlist))[:-1]
+        return np.split(rows[order].astype(np.int64), bounds)
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        Index newly appended gallery rows.
+
+        Args:
+            rows: Row indices of the new vectors
+            vectors: The new vectors
+        """
+        if self._centroids is None:
+            return
+
+        # Copy-on-write so concurrent searches keep a consistent view
+        lists = list(self._lists)
+        for list_id, new_rows in enumerate(self._group(rows, self._assign(vectors))):
+            if len(new_rows):
+                lists[list_id] = np.concatenate([lists[list_id], new_rows])
+        self._lists = lists
+
+    def remap(self, remap: np.ndarray) -> None:
+        """
+        Renumber rows after a gallery compaction.
+
+        Args:
+            remap: New index for each old row, or -1 for dropped rows
+        """
+        if self._centroids is None:
+            return
+
+        lists = []
+        for rows in self._lists:
+            rows = remap[rows]
+            lists.append(rows[rows >= 0])
+        self._lists = lists
+
+    def snapshot(self) -> Any:
+        """Return the current centroids and inverted lists."""
+        if self._centroids is None:
+            return None
+        return self._centroids, self._lists
+
+    def candidates(self, state: Any, probe: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Select the rows in the clusters closest to the probe.
+
+        Args:
+            state: Index state from snapshot()
+            probe: Probe encoding
+
+        Returns:
+            Candidate row indices, or None if the index is not trained
+        """
+        if state is None:
+            return None
+
+        centroids, lists = state
+        distances = np.einsum("ij,ij->i", centroids, centroids) - 2.0 * (centroids @ probe)
+        nprobe = min(self.nprobe, len(centroids))
+        probed = np.argpartition(distances, nprobe - 1)[:nprobe]
+        return np.concatenate([lists[list_id] for list_id in probed])
+
+    def save(self, matrix: np.ndarray, owners: np.ndarray, alive: np.ndarray) -> None:
+        """
+        Persist centroids, the cluster assignment of every live row and a
+        digest of each user's encodings.
+
+        Args:
+            matrix: Gallery matrix
+            owners: Row owner user IDs
+            alive: Mask of live rows
+        """
+        if not self.path or self._centroids is None:
+            return
+
+        try:
+            n = len(owners)
+            assign = np.full(n, -1, dtype=np.int32)
+            for list_id, rows in enumerate(self._lists):
+                assign[rows[rows < n]] = list_id
+
+            live = np.flatnonzero(alive & (assign >= 0))
+            live_owners = owners[live]
+            digests = [self._digest(matrix[live[start:end]]) for start, end in self._runs(live_owners)]
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez(
+                tmp_path,
+                centroids=self._centroids,
+                owners=live_owners.astype(str),
+                assign=assign[live],
+                digests=np.array(digests, dtype=str)
+            )
+            os.replace(tmp_path, self.path)
+            logger.info(f"Saved IVF index with {len(live)} rows to {self.path}")
+        except Exception as e:
+            logger.error(f"Error saving IVF index: {e}")
+
+    def _load(self, matrix: np.ndarray, owners: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Load persisted centroids and recover row assignments.
+
+        Rows of users whose encodings are unchanged, by digest, keep their
+        persisted assignment; all other rows are assigned to the nearest
+        centroid.
+
+        Args:
+            matrix: Gallery matrix
+            owners: Row owner user IDs
+
+        Returns:
+            The cluster assignment of every row, or None if nothing usable was persisted
+        """
+        if not self.path or not os.path.exists(self.path):
+            return None
+
+        try:
+            with np.load(self.path) as data:
+                centroids = data["centroids"]
+                saved_owners = data["owners"]
+                saved_assign = data["assign"]
+                # Indexes saved before digests were recorded reassign every row
+                saved_digests = data["digests"] if "digests" in data.files else None
+        except Exception as e:
+            logger.error(f"Error loading IVF index from {self.path}: {e}")
+            return None
+
+        if self.nlist and len(centroids) != self.nlist:
+            logger.info(f"Persisted IVF index has {len(centroids)} lists, {self.nlist} configured; retraining")
+            return None
+
+        self._centroids = centroids
+        saved = {}
+        if saved_digests is not None:
+            for (start, end), digest in zip(self._runs(saved_owners), saved_digests):
+                saved[saved_owners[start]] = (digest, saved_assign[start:end])
+
+        assign = np.full(len(matrix), -1, dtype=np.int32)
+        for start, end in self._runs(owners):
+            previous = saved.get(owners[start])
+            if (previous is not None and len(previous[1]) == end - start
+                    and previous[0] == self._digest(matrix[start:end])):
+                assign[start:end] = previous[1]
+
+        missing = np.flatnonzero(assign < 0)
+        if len(missing):
+            assign[missing] = self._assign(matrix[missing])
+
+        logger.info(
+            f"Loaded IVF index with {len(centroids)} lists from {self.path} "
+            f"({len(missing)} of {len(matrix)} rows reassigned)"
+        )
+        return assign
+
+    def _digest(self, vectors: np.ndarray) -> str:
+        """Hash a user's encoding rows, to detect encodings replaced by others."""
+        return hashlib.blake2b(np.ascontiguousarray(vectors).tobytes(), digest_size=16).hexdigest()
+
+    def _runs(self, owners: np.ndarray) -> List[tuple]:
+        """
+        Split an owner array into (start, end) runs of consecutive equal owners.
+
+        Args:
+            owners: Row owner user IDs
+
+        Returns:
+            A list of (start, end) tuples
+        """
+        if not len(owners):
+            return []
+        changes = np.flatnonzero(owners[1:] != owners[:-1]) + 1
+        bounds = np.concatenate([[0], changes, [len(owners)]])
+        return list(zip(bounds[:-1], bounds[1:]))
+
+def create_index(kind: str = config.GALLERY_INDEX) -> ExactIndex:
+    """
+    Create a gallery index by name.
+
+    Args:
+        kind: "exact" or "ivf"
+
+    Returns:
+        The index instance
+    """
+    if kind == "exact":
+        return ExactIndex()
+    if kind == "ivf":
+        return IVFIndex()
+    raise ValueError(f"Unknown gallery index type: {kind}")
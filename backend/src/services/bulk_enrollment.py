@@ -0,0 +1,414 @@
+"""
+Bulk enrollment for the Face Recognition API.
+Registers users from a directory or zip/tar archive of images and a CSV
+manifest, encoding images in parallel and writing users in batched
+transactions. Progress is checkpointed so an interrupted import resumes
+where it stopped.
+"""
+
+import os
+import csv
+import json
+import uuid
+import asyncio
+import hashlib
+import tarfile
+import zipfile
+from collections import deque
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+import sys
+from pathlib import Path, PurePosixPath
+
+# Import config and logger
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import config
+from utils.logger import get_logger
+from utils.database import database
+from services.face_service import face_service
+from services.execution_engine import face_engine
+
+# Get logger
+logger = get_logger("bulk_enrollment")
+
+# File extensions imported as images
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+# Largest yaw, pitch or roll in degrees accepted for registration, as in /api/register
+MAX_REGISTRATION_ANGLE = 15
+# Manifest columns copied onto the user
+MANIFEST_FIELDS = ("name", "employee_id", "department", "role")
+
+def _relative_name(name: str) -> str:
+    """Normalize an image path relative to the import source to POSIX form."""
+    return PurePosixPath(name.replace("\\", "/").lstrip("/")).as_posix()
+
+def read_manifest(csv_path: str) -> Tuple[Dict[str, Dict[str, Optional[str]]], str]:
+    """
+    Read the CSV manifest describing the users to import.
+
+    Rows are matched to images by an "image" column holding the image path
+    relative to the import source or its file name, or, without one, by
+    "employee_id" against the image file name stem.
+
+    Args:
+        csv_path: Path of the CSV file
+
+    Returns:
+        The rows keyed by image name or employee ID, and the key column
+    """
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        columns = {(column or "").strip().lower() for column in reader.fieldnames or []}
+        if "name" not in columns:
+            raise ValueError("CSV manifest must have a name column")
+        key_column = "image" if "image" in columns else "employee_id"
+        if key_column not in columns:
+            raise ValueError("CSV manifest must have an image or employee_id column")
+
+        manifest = {}
+        for row in reader:
+            row = {
+                (column or "").strip().lower(): (value or "").strip() or None
+                for column, value in row.items()
+                if column
+            }
+            key = row.get(key_column)
+            if key:
+                manifest[_relative_name(key) if key_column == "image" else key] = row
+    return manifest, key_column
+
+def iter_images(source: str, skip: int = 0) -> Iterator[Tuple[str, bytes]]:
+    """
+    Stream the images of a directory or zip/tar archive in a stable order.
+
+    Args:
+        source: Directory, zip file or (optionally compressed) tar file
+        skip: Number of leading images to pass over without reading them
+
+    Yields:
+        Tuples of image path relative to the source and encoded image bytes
+    """
+    def is_image(name: str) -> bool:
+        return Path(name).suffix.lower() in IMAGE_EXTENSIONS and not Path(name).name.startswith(".")
+
+    index = 0
+    if os.path.isdir(source):
+        for path in sorted(p for p in Path(source).rglob("*") if p.is_file() and is_image(p.name)):
+            index += 1
+            if index > skip:
+                yield path.relative_to(source).as_posix(), path.read_bytes()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_image(info.filename):
+                    continue
+                index += 1
+                if index > skip:
+                    yield _relative_name(info.filename), archive.read(info)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source, "r:*") as archive:
+            for member in archive:
+                if not member.isfile() or not is_image(member.name):
+                    continue
+                index += 1
+                if index > skip:
+                    yield _relative_name(member.name), archive.extractfile(member).read()
+    else:
+        raise ValueError(f"Unsupported bulk source: {source}")
+
+def default_checkpoint_path(source: str, csv_path: str) -> str:
+    """
+    Derive the checkpoint file of an import from its source and manifest paths.
+
+    Args:
+        source: Image directory or archive
+        csv_path: CSV manifest
+
+    Returns:
+        Path of the checkpoint file in the bulk import directory
+    """
+    key = hashlib.blake2b(
+        f"{os.path.abspath(source)}\n{os.path.abspath(csv_path)}".encode(), digest_size=16
+    ).hexdigest()
+    return str(Path(config.BULK_IMPORT_DIR) / f"{key}.json")
+
+def load_checkpoint(checkpoint_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Read an import's progress checkpoint.
+
+    Args:
+        checkpoint_path: Path of the checkpoint file
+
+    Returns:
+        The checkpoint or None if the import has not started
+    """
+    try:
+        with open(checkpoint_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+class BulkEnrollment:
+    """
+    One bulk import, processed as an ordered pipeline.
+
+    Images are read in source order and up to `concurrency` of them are
+    decoded, detected and encoded at once on the face worker pool. Results
+    are collected in source order and written `batch_size` users per
+    transaction; after each write the checkpoint records how many images
+    have been handled, so a restarted import skips them. Failures are
+    appended to a log next to the checkpoint, which keeps only their count
+    and the first `failure_sample` of them, so checkpoints stay small. User IDs are
+    derived from the import and image name, which makes replaying a batch
+    that was written but not checkpointed harmless; using the path within
+    the source keeps same-named images in different folders apart.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        csv_path: str,
+        checkpoint_path: Optional[str] = None,
+        train_multiple: bool = True,
+        bypass_angle_check: bool = False,
+        concurrency: int = config.BULK_CONCURRENCY,
+        batch_size: int = config.BULK_BATCH_SIZE,
+        failure_sample: int = config.BULK_FAILURE_SAMPLE
+    ):
+        """
+        Initialize an import.
+
+        Args:
+            source: Directory, zip file or tar file of images
+            csv_path: CSV manifest with name, employee_id, department and role columns
+            checkpoint_path: Progress checkpoint file; derived from the paths if omitted
+            train_multiple: Whether to generate multi-angle encodings
+            bypass_angle_check: Whether to accept faces not looking at the camera
+            concurrency: Images processed at once
+            batch_size: Users written per transaction
+            failure_sample: Failures kept in the checkpoint
+        """
+        self.source = source
+        self.csv_path = csv_path
+        self.checkpoint_path = checkpoint_path or default_checkpoint_path(source, csv_path)
+        self.train_multiple = train_multiple
+        self.bypass_angle_check = bypass_angle_check
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.failure_sample = max(0, failure_sample)
+        self.failures_path = str(Path(self.checkpoint_path).with_suffix(".failures.jsonl"))
+        self._namespace = uuid.uuid5(uuid.NAMESPACE_URL, self.checkpoint_path)
+        self._state: Dict[str, Any] = {}
+        self._batch: List[Tuple[Dict[str, Any], Optional[bytes], Optional[bytes]]] = []
+        self._failures: List[Dict[str, str]] = []
+        self._handled = 0
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run or resume the import.
+
+        Returns:
+            The final checkpoint: images handled, users registered, the
+            failure count with a sample of failures and the failures log path
+        """
+        manifest, key_column = await run_in_threadpool(lambda: read_manifest(self.csv_path))
+        self._state = load_checkpoint(self.checkpoint_path) or {
+            "source": self.source,
+            "csv_path": self.csv_path,
+            "position": 0,
+            "registered": 0,
+            "failed": 0,
+            "failures": [],
+            "failures_path": self.failures_path,
+            "failures_logged": 0,
+            "completed": False
+        }
+        if self._state["completed"]:
+            logger.info(f"Bulk import {self.checkpoint_path} already completed")
+            return self._state
+
+        # Drop failures logged after the last checkpoint; they are replayed
+        self._state.setdefault("failures_path", self.failures_path)
+        self._state.setdefault("failures_logged", 0)
+        await run_in_threadpool(self._truncate_failures_log)
+
+        start = self._state["position"]
+        self._handled = start
+        logger.info(f"Starting bulk import of {self.source} at image {start}")
+
+        images = iter_images(self.source, start)
+        pending: Deque[asyncio.Task] = deque()
+        try:
+            while True:
+                item = await run_in_threadpool(next, images, None)
+                if item is None:
+                    break
+                name, data = item
+                pending.append(asyncio.ensure_future(self._enroll(name, data, manifest, key_column)))
+                if len(pending) >= self.concurrency:
+                    await self._collect(await pending.popleft())
+            while pending:
+                await self._collect(await pending.popleft())
+        finally:
+            for task in pending:
+                task.cancel()
+            images.close()
+
+        self._state["completed"] = True
+        await self._flush()
+        logger.info(
+            f"Bulk import of {self.source} finished: "
+            f"{self._state['registered']} registered, {self._state['failed']} failed"
+        )
+        return self._state
+
+    async def _enroll(
+        self, name: str, data: bytes, manifest: Dict[str, Dict[str, Optional[str]]], key_column: str
+    ) -> Tuple[str, Any]:
+        """
+        Encode one image and prepare its user.
+
+        Args:
+            name: Image path relative to the source
+            data: Encoded image bytes
+            manifest: Manifest rows from read_manifest()
+            key_column: Manifest column rows are keyed by
+
+        Returns:
+            The image name and either the user tuple for Database.add_users or an error message
+        """
+        file_name = PurePosixPath(name)
+        if key_column == "image":
+            row = manifest.get(name) or manifest.get(file_name.name)
+        else:
+            row = manifest.get(file_name.stem)
+        if row is None or not row.get("name"):
+            return name, "No manifest row for image"
+
+        try:
+            processed = await face_engine.call("process_enrollment", data, self.train_multiple)
+        except Exception as e:
+            logger.error(f"Error encoding bulk image {name}: {e}")
+            return name, f"Error encoding image: {str(e)}"
+        if "error" in processed:
+            return name, processed["error"]
+
+        face_analysis = processed["face_analysis"]
+        pose = (face_analysis or {}).get("pose")
+        if not self.bypass_angle_check and pose and any(
+            abs(pose.get(angle, 0)) > MAX_REGISTRATION_ANGLE for angle in ("yaw", "pitch", "roll")
+        ):
+            return name, "Face angle is not optimal for registration"
+
+        user_id = str(uuid.uuid5(self._namespace, name))
+        try:
+            os.makedirs(config.UPLOADS_DIR, exist_ok=True)
+            image_path = os.path.join(config.UPLOADS_DIR, f"{user_id}.jpg")
+            await run_in_threadpool(lambda: Path(image_path).write_bytes(data))
+        except Exception as e:
+            logger.error(f"Error saving image for bulk user {user_id}: {e}")
+            image_path = None
+
+        user_data = {field: row.get(field) for field in MANIFEST_FIELDS}
+        user_data.update({
+            "id": user_id,
+            "face_id": str(uuid.uuid4()),
+            "image_path": f"uploads/{user_id}.jpg" if image_path else None,
+            "face_analysis": json.dumps(face_analysis) if face_analysis else None
+        })
+        multi_encodings = processed["multi_encodings"]
+        return name, (
+            user_data,
+            face_service.encode_to_bytes(processed["encoding"]),
+            face_service.encode_multiple_to_bytes(multi_encodings) if multi_encodings else None
+        )
+
+    async def _collect(self, result: Tuple[str, Any]) -> None:
+        """
+        Add one image's result to the current batch, writing the batch when full.
+
+        Args:
+            result: Result of _enroll()
+        """
+        name, outcome = result
+        self._handled += 1
+        if isinstance(outcome, str):
+            logger.warning(f"Skipping bulk image {name}: {outcome}")
+            failure = {"image": name, "message": outcome}
+            self._state["failed"] += 1
+            if len(self._state["failures"]) < self.failure_sample:
+                self._state["failures"].append(failure)
+            self._failures.append(failure)
+        else:
+            self._batch.append(outcome)
+
+        if len(self._batch) >= self.batch_size:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        """
+        Write the current batch in one transaction, log its failures and
+        checkpoint the progress.
+        """
+        if self._batch:
+            added = await database.add_users(self._batch)
+            self._state["registered"] += len(added)
+            self._batch = []
+
+        failures = "".join(json.dumps(failure) + "\n" for failure in self._failures).encode()
+        self._failures = []
+        self._state["position"] = self._handled
+        self._state["failures_logged"] += len(failures)
+        state = json.dumps(self._state)
+
+        def write() -> None:
+            failures_path = Path(self._state["failures_path"])
+            if failures:
+                failures_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(failures_path, "ab") as f:
+                    f.write(failures)
+
+            # Replace the checkpoint atomically so a crash never leaves it truncated
+            path = Path(self.checkpoint_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(state)
+            os.replace(tmp_path, path)
+
+        await run_in_threadpool(write)
+
+    def _truncate_failures_log(self) -> None:
+        """
+        Cut the failures log back to the size recorded by the checkpoint.
+        """
+        path = Path(self._state["failures_path"])
+        if path.exists() and path.stat().st_size > self._state["failures_logged"]:
+            os.truncate(path, self._state["failures_logged"])
+
+async def run_bulk_enrollment(
+    source: str,
+    csv_path: str,
+    checkpoint_path: Optional[str] = None,
+    train_multiple: bool = True,
+    bypass_angle_check: bool = False
+) -> Dict[str, Any]:
+    """
+    Run or resume a bulk import. Used as the "bulk_enrollment" job handler.
+
+    Args:
+        source: Directory, zip file or tar file of images
+        csv_path: CSV manifest
+        checkpoint_path: Progress checkpoint file
+        train_multiple: Whether to generate multi-angle encodings
+        bypass_angle_check: Whether to accept faces not looking at the camera
+
+    Returns:
+        The final checkpoint
+    """
+    return await BulkEnrollment(
+        source,
+        csv_path,
+        checkpoint_path,
+        train_multiple=train_multiple,
+        bypass_angle_check=bypass_angle_check
+    ).run()
@@ -0,0 +1,205 @@
+"""
+Execution engine for the Face Recognition API.
+Runs CPU-heavy FaceService stages either on a thread pool or on a pool of
+pre-warmed worker processes, passing images to workers through shared memory.
+"""
+
+import asyncio
+import multiprocessing
+import numpy as np
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, List, NamedTuple, Optional, Tuple
+import sys
+from pathlib import Path
+
+# Import config and logger
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import config
+from utils.logger import get_logger
+from services.face_service import face_service
+
+# Get logger
+logger = get_logger("execution_engine")
+
+# Executor modes supported by the engine
+EXECUTOR_MODES = ("thread", "process")
+
+class SharedArray(NamedTuple):
+    """Reference to a NumPy array placed in a shared memory block."""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing shared memory block without taking ownership of it.
+
+    The parent process creates and unlinks every block, so workers must not
+    register it with their resource tracker.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track flag. Workers share the parent's resource
+        # tracker, so unregistering after attaching would drop the parent's
+        # registration; skip registering instead
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+def _release_shared_memory(blocks: List[shared_memory.SharedMemory]) -> None:
+    """Close and unlink shared memory blocks created by the parent process."""
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+def _init_worker() -> None:
+    """
+    Initialize a worker process with a warm-up pass through the dlib models.
+    """
+    face_service.detect_faces(np.zeros((64, 64, 3), dtype=np.uint8))
+
+def _warm_up(_: int) -> int:
+    """No-op task used to force worker processes to start."""
+    return multiprocessing.current_process().pid
+
+def _run_in_worker(method: str, args: tuple) -> Any:
+    """
+    Run a FaceService method inside a worker process.
+
+    Args:
+        method: Name of the FaceService method
+        args: Positional arguments; SharedArray references are attached as arrays
+
+    Returns:
+        The method's result
+    """
+    blocks = []
+    resolved = []
+    try:
+        for arg in args:
+            if isinstance(arg, SharedArray):
+                shm = _attach_shared_memory(arg.name)
+                blocks.append(shm)
+                resolved.append(np.ndarray(arg.shape, dtype=np.dtype(arg.dtype), buffer=shm.buf))
+            else:
+                resolved.append(arg)
+        return getattr(face_service, method)(*resolved)
+    finally:
+        # Drop array views before closing the blocks they point into
+        resolved.clear()
+        for shm in blocks:
+            shm.close()
+
+class ExecutionEngine:
+    """Dispatches FaceService stages to a thread or process pool."""
+
+    def __init__(
+        self,
+        mode: str = config.FACE_EXECUTOR,
+        workers: int = config.FACE_WORKERS,
+        start_method: str = config.FACE_PROCESS_START_METHOD
+    ):
+        """
+        Initialize the execution engine. Pools are created by start().
+
+        Args:
+            mode: "thread" or "process"
+            workers: Number of pool workers
+            start_method: multiprocessing start method for process workers
+        """
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode: {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.start_method = start_method
+        self._executor: Optional[Executor] = None
+
+    def start(self) -> None:
+        """
+        Create the worker pool and, in process mode, pre-warm every worker.
+        """
+        if self._executor is not None:
+            return
+
+        if self.mode == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker
+            )
+            # Submitting more tasks than workers makes the pool spawn every
+            # worker now, running the model-loading initializer up front
+            pids = set(self._executor.map(_warm_up, range(self.workers * 2)))
+            logger.info(f"Started {len(pids)} pre-warmed face worker processes")
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="face-worker")
+            logger.info(f"Started face worker thread pool with {self.workers} threads")
+
+    def shutdown(self) -> None:
+        """
+        Shut down the worker pool.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def call(self, method: str, *args: Any) -> Any:
+        """
+        Run a FaceService method on the worker pool.
+
+        In process mode, NumPy array arguments are copied once into shared
+        memory instead of being pickled. The blocks are released when the
+        worker task finishes, not when the caller stops waiting, so a
+        cancelled call never unlinks a block a worker is still reading.
+
+        Args:
+            method: Name of the FaceService method
+            *args: Positional arguments for the method
+
+        Returns:
+            The method's result
+        """
+        if self._executor is None:
+            self.start()
+
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            return await loop.run_in_executor(self._executor, getattr(face_service, method), *args)
+
+        blocks: List[shared_memory.SharedMemory] = []
+        try:
+            shared_args = tuple(self._share(arg, blocks) for arg in args)
+            future = self._executor.submit(_run_in_worker, method, shared_args)
+        except BaseException:
+            _release_shared_memory(blocks)
+            raise
+        future.add_done_callback(lambda _: _release_shared_memory(blocks))
+        return await asyncio.wrap_future(future)
+
+    def _share(self, arg: Any, blocks: List[shared_memory.SharedMemory]) -> Any:
+        """
+        Copy an array argument into a new shared memory block.
+
+        Args:
+            arg: The argument to transport
+            blocks: List collecting created blocks so the caller can release them
+
+        Returns:
+            A SharedArray reference for arrays, the argument itself otherwise
+        """
+        if not isinstance(arg, np.ndarray) or arg.nbytes == 0:
+            return arg
+
+        shm = shared_memory.SharedMemory(create=True, size=arg.nbytes)
+        blocks.append(shm)
+        np.ndarray(arg.shape, dtype=arg.dtype, buffer=shm.buf)[...] = arg
+        return SharedArray(shm.name, arg.shape, arg.dtype.str)
+
+# Create execution engine instance
+face_engine = ExecutionEngine()
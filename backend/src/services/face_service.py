@@ -1,20 +1,149 @@
 import base64
-import io
 import math
 import sys
+import threading
+from contextlib import contextmanager
 import numpy as np
 import cv2
+import dlib
 import face_recognition
+from face_recognition.api import face_encoder, pose_predictor_5_point, pose_predictor_68_point
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import Iterator, List, Dict, Any, Optional, Tuple, Union
 
 # Append parent directory to import config and logger
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from config import config
 from utils.logger import get_logger
+from utils.encoding_codec import pack_vectors, unpack_vectors
 
 logger = get_logger("face_service")
 
+# Dimensionality of the dlib face descriptor
+ENCODING_SIZE = 128
+# Context kept around the face box when augmenting, as a fraction of the box size
+MULTI_ANGLE_PADDING = 0.25
+# Faces taller than this are downscaled before augmentation
+MULTI_ANGLE_FACE_SIZE = 300
+
+# Encodings align faces on dlib's 5-point shape, like the stored gallery encodings
+ENCODING_LANDMARK_MODEL = "small"
+
+# Height the face crop is reduced to before measuring sharpness and exposure
+QUALITY_CROP_SIZE = 128
+# User-facing descriptions of quality gate rejections
+QUALITY_REASONS = {
+    "face_too_small": "the face is too small",
+    "blurry": "the image is blurry",
+    "underexposed": "the image is too dark",
+    "overexposed": "the image is too bright",
+    "extreme_pose": "the face is turned too far from the camera",
+}
+
+# JPEG DCT-domain downscaling flags, largest reduction first
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+# JPEG start-of-frame markers, which carry the image dimensions
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read the (height, width) of a JPEG from its frame header without decoding it.
+
+    Args:
+        data: Encoded image bytes
+
+    Returns:
+        The dimensions, or None if the data is not a JPEG or has no frame header
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            # Standalone marker without a length field
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return (height, width) if height and width else None
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+# Scratch buffers reused for multi-angle augmentation canvases, shared by all threads
+SCRATCH_POOL_SIZE = 2
+# Scratch buffers larger than this are freed after use instead of being pooled
+SCRATCH_MAX_BYTES = 16 * 1024 * 1024
+_scratch_pool: List[np.ndarray] = []
+_scratch_lock = threading.Lock()
+
+class FaceContext:
+    """
+    A detected face with its landmark shapes, each computed at most once.
+
+    The 68-point shape feeds pose/quality analysis. The 5-point shape feeds
+    the quality gate's pose check and the encoder, which aligns the face on
+    it as face_recognition.face_encodings does by default, so encodings stay
+    comparable with the stored gallery encodings.
+    """
+
+    def __init__(self, image: np.ndarray, face_location: Tuple[int, int, int, int]):
+        top, right, bottom, left = face_location
+        self.image = image
+        self.face_location = face_location
+        self._rect = dlib.rectangle(left, top, right, bottom)
+        self._shape = None
+        self._shape_5 = None
+        self._landmarks: Optional[Dict[str, List[Tuple[int, int]]]] = None
+
+    @property
+    def shape(self) -> Any:
+        """The 68-point dlib shape."""
+        if self._shape is None:
+            self._shape = pose_predictor_68_point(self.image, self._rect)
+        return self._shape
+
+    @property
+    def shape_5(self) -> Any:
+        """The 5-point dlib shape (eye corners and nose base)."""
+        if self._shape_5 is None:
+            self._shape_5 = pose_predictor_5_point(self.image, self._rect)
+        return self._shape_5
+
+    @property
+    def landmarks(self) -> Dict[str, List[Tuple[int, int]]]:
+        """Landmarks grouped by facial feature, as returned by face_recognition.face_landmarks."""
+        if self._landmarks is None:
+            points = [(p.x, p.y) for p in self.shape.parts()]
+            self._landmarks = {
+                "chin": points[0:17],
+                "left_eyebrow": points[17:22],
+                "right_eyebrow": points[22:27],
+                "nose_bridge": points[27:31],
+                "nose_tip": points[31:36],
+                "left_eye": points[36:42],
+                "right_eye": points[42:48],
+                "top_lip": points[48:55] + [points[64], points[63], points[62], points[61], points[60]],
+                "bottom_lip": points[54:60] + [points[48], points[60], points[67], points[66], points[65], points[64]],
+            }
+        return self._landmarks
+
+    def encode(self, num_jitters: int = 1) -> np.ndarray:
+        """Compute the 128-d encoding, aligned on the 5-point shape."""
+        return np.array(face_encoder.compute_face_descriptor(self.image, self.shape_5, num_jitters))
+
 class FaceService:
     """Face recognition service for image processing and analysis."""
 
@@ -23,10 +152,19 @@ class FaceService:
         self.model = config.FACE_RECOGNITION_MODEL  # "cnn" for higher accuracy
         self.multi_angle_jitter = config.MULTI_ANGLE_JITTER  # e.g., 15
         self.num_jitters = config.FACE_ENCODING_JITTERS  # e.g., 5
+        self.detection_max_side = config.FACE_DETECTION_MAX_SIDE  # e.g., 640
+        self.decode_max_side = config.IMAGE_DECODE_MAX_SIDE  # e.g., 1600
+        self.quality_gate = config.QUALITY_GATE_ENABLED
         logger.info(f"Initialized FaceService with tolerance={self.tolerance}, model={self.model}, num_jitters={self.num_jitters}")
 
-    def _decode_image(self, image_data: Union[str, bytes]) -> Optional[np.ndarray]:
-        """Decode image data (base64 or bytes) to a NumPy array."""
+    def _decode_image(self, image_data: Union[str, bytes]) -> Optional[Tuple[np.ndarray, int]]:
+        """
+        Decode image data (base64 or bytes) to a NumPy array.
+
+        Returns:
+            The RGB image and the factor it was reduced by while decoding
+            (1 for a full-size decode), or None if the data cannot be decoded
+        """
         try:
             if isinstance(image_data, str):
                 if image_data.startswith('data:image'):
@@ -36,12 +174,68 @@ class FaceService:
                 image_bytes = image_data
 
             image_array = np.frombuffer(image_bytes, dtype=np.uint8)
-            image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            flag, factor = self._decode_flag(image_bytes)
+            image = cv2.imdecode(image_array, flag)
+            # Swap channels in place instead of allocating a second full-size buffer
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image), factor
         except Exception as e:
             logger.error(f"Failed to decode image: {e}")
             return None
 
+    def _decode_flag(self, image_bytes: bytes) -> Tuple[int, int]:
+        """
+        Pick the imdecode flag for an upload and the factor it reduces the image by.
+
+        JPEGs larger than the decode target are decoded at 1/2, 1/4 or 1/8
+        scale, which libjpeg does in the DCT domain at a fraction of the cost
+        of a full decode.
+        """
+        size = _jpeg_size(image_bytes) if self.decode_max_side > 0 else None
+        if size is None:
+            return cv2.IMREAD_COLOR, 1
+
+        longest = max(size)
+        for factor, flag in REDUCED_DECODE_FLAGS:
+            if longest // factor >= self.decode_max_side:
+                return flag, factor
+        return cv2.IMREAD_COLOR, 1
+
+    def process_image(self, image_data: Union[str, bytes]) -> Optional[np.ndarray]:
+        """
+        Decode an uploaded image (base64 string or raw bytes) to an RGB array.
+
+        Large JPEGs come back reduced; use process_image_scaled when face
+        boxes found on the result are reported or stored.
+        """
+        decoded = self._decode_image(image_data)
+        return decoded[0] if decoded else None
+
+    def process_image_scaled(self, image_data: Union[str, bytes]) -> Tuple[Optional[np.ndarray], int]:
+        """
+        Decode an uploaded image and report the factor it was reduced by.
+
+        Returns:
+            The RGB image (None if the data cannot be decoded) and the decode
+            factor to pass to to_upload_location and from_upload_location
+        """
+        return self._decode_image(image_data) or (None, 1)
+
+    def to_upload_location(
+        self, location: Tuple[int, int, int, int], factor: int, shape: Tuple[int, ...]
+    ) -> Tuple[int, int, int, int]:
+        """Map a face box on an image decoded at 1/factor scale to the uploaded image's coordinates."""
+        if factor == 1:
+            return tuple(location)
+        return self._upscale_location(location, 1 / factor, (shape[0] * factor, shape[1] * factor))
+
+    def from_upload_location(
+        self, location: Tuple[int, int, int, int], factor: int, shape: Tuple[int, ...]
+    ) -> Tuple[int, int, int, int]:
+        """Map a face box in the uploaded image's coordinates onto the image decoded at 1/factor scale."""
+        if factor == 1:
+            return tuple(location)
+        return self._upscale_location(location, factor, shape)
+
     def process_image_file(self, file_path: str) -> Optional[np.ndarray]:
         """Load an image file and return it as a NumPy array."""
         try:
@@ -51,15 +245,55 @@ class FaceService:
             return None
 
     def detect_faces(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
-        """Detect face locations in an image."""
+        """
+        Detect face locations in an image.
+
+        Large images are searched on a downscaled copy first and the boxes are
+        mapped back to full resolution; if nothing is found there, detection
+        falls back to the full-resolution image.
+        """
         try:
-            locations = face_recognition.face_locations(image, model=self.model)
+            locations = []
+            scale = self._detection_scale(image)
+            if scale < 1.0:
+                small = cv2.resize(
+                    image,
+                    (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale))),
+                    interpolation=cv2.INTER_AREA
+                )
+                locations = [
+                    self._upscale_location(location, scale, image.shape)
+                    for location in face_recognition.face_locations(small, model=self.model)
+                ]
+                if not locations:
+                    logger.info("No face found on downscaled image; retrying at full resolution.")
+            if not locations:
+                locations = face_recognition.face_locations(image, model=self.model)
             logger.info(f"Detected {len(locations)} faces.")
             return locations
         except Exception as e:
             logger.error(f"Face detection error: {e}")
             return []
 
+    def _detection_scale(self, image: np.ndarray) -> float:
+        """Return the factor that brings the image's longest side down to the detection size."""
+        if self.detection_max_side <= 0:
+            return 1.0
+        return min(1.0, self.detection_max_side / max(image.shape[:2]))
+
+    def _upscale_location(
+        self, location: Tuple[int, int, int, int], scale: float, shape: Tuple[int, ...]
+    ) -> Tuple[int, int, int, int]:
+        """Map a face box found on a copy resized by scale to the image of the given shape."""
+        top, right, bottom, left = location
+        height, width = shape[:2]
+        return (
+            max(0, int(top / scale)),
+            min(width, int(round(right / scale))),
+            min(height, int(round(bottom / scale))),
+            max(0, int(left / scale))
+        )
+
     def encode_face(
         self, image: np.ndarray, face_location: Optional[Tuple[int, int, int, int]] = None
     ) -> Optional[np.ndarray]:
@@ -72,80 +306,362 @@ class FaceService:
                     return None
                 face_location = faces[0]
 
-            encodings = face_recognition.face_encodings(
-                image, [face_location], num_jitters=self.num_jitters
-            )
-            if not encodings:
-                logger.warning("Encoding failed.")
-                return None
-
-            return encodings[0]
+            return FaceContext(image, face_location).encode(self.num_jitters)
         except Exception as e:
             logger.error(f"Encoding error: {e}")
             return None
 
+    def process_probe_faces(self, image_data: Union[str, bytes], multi_face: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Decode an image, detect its faces and gate, analyze and encode them.
+
+        Args:
+            image_data: Encoded image bytes or base64 string
+            multi_face: Whether to process every detected face instead of only the first
+
+        Returns:
+            A dict with all "face_locations", in the uploaded image's
+            coordinates, and the process_face results of the processed
+            "faces", or None if the image cannot be decoded
+        """
+        image, factor = self.process_image_scaled(image_data)
+        if image is None:
+            return None
+
+        locations = self.detect_faces(image)
+        targets = locations if multi_face else locations[:1]
+        return {
+            "face_locations": [self.to_upload_location(location, factor, image.shape) for location in locations],
+            "faces": self.process_faces(image, targets, True)
+        }
+
+    def process_probe(self, image_data: Union[str, bytes]) -> Dict[str, Any]:
+        """Decode an image and encode its first face for gallery matching."""
+        probe = self.process_probe_faces(image_data)
+        if probe is None:
+            return {"error": "Invalid image data or format not supported"}
+        if not probe["face_locations"]:
+            return {"error": "No faces detected in the image."}
+
+        location = probe["face_locations"][0]
+        result = probe["faces"][0]
+        quality = result.get("quality_check")
+        if quality and not quality["passed"]:
+            return {"error": quality["message"], "quality_check": quality}
+        if result["encoding"] is None:
+            return {"error": "Found a face but couldn't generate encoding.", "face_analysis": result["face_analysis"]}
+
+        return {"encoding": result["encoding"], "face_location": location, "face_analysis": result["face_analysis"]}
+
+    def process_enrollment(self, image_data: Union[str, bytes], train_multiple: bool = True) -> Dict[str, Any]:
+        """
+        Decode an image and compute everything needed to register its first face.
+
+        Args:
+            image_data: Encoded image bytes or base64 string
+            train_multiple: Whether to also generate multi-angle encodings
+
+        Returns:
+            A dict with "encoding", "face_analysis" and "multi_encodings", or
+            with "error" if the image cannot be registered
+        """
+        image = self.process_image(image_data)
+        if image is None:
+            return {"error": "Invalid image data or format not supported"}
+
+        locations = self.detect_faces(image)
+        if not locations:
+            return {"error": "No face detected in the image."}
+
+        location = locations[0]
+        result = self.process_face(image, location)
+        if result["encoding"] is None:
+            return {"error": "Failed to generate face encoding.", "face_analysis": result["face_analysis"]}
+
+        result["multi_encodings"] = self.generate_multi_angle_encodings(image, location) if train_multiple else []
+        return result
+
+    def process_face(
+        self, image: np.ndarray, face_location: Tuple[int, int, int, int], quality_gate: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Analyze and encode one face, running each landmark predictor at most once.
+
+        Args:
+            image: The image containing the face
+            face_location: Face box as (top, right, bottom, left)
+            quality_gate: Whether to run check_quality first and skip encoding on rejection
+
+        Returns:
+            A dict with "encoding" (None if encoding failed or the face was
+            rejected), "face_analysis" and, if the gate ran, "quality_check"
+        """
+        try:
+            context = FaceContext(image, face_location)
+        except Exception as e:
+            logger.error(f"Landmark extraction error: {e}")
+            return {"encoding": None, "face_analysis": {}}
+
+        quality = None
+        if quality_gate and self.quality_gate:
+            quality = self.check_quality(image, face_location, context)
+            if not quality["passed"]:
+                return {"encoding": None, "face_analysis": {}, "quality_check": quality}
+
+        result = self._analyze_and_encode(context)
+        if quality is not None:
+            result["quality_check"] = quality
+        return result
+
+    def _analyze_and_encode(self, context: FaceContext) -> Dict[str, Any]:
+        """Run pose/quality analysis from the 68-point landmarks, then encode the face."""
+        try:
+            analysis = self._analysis_from_landmarks(context.image, context.face_location, context.landmarks)
+        except Exception as e:
+            logger.error(f"Face analysis error: {e}")
+            analysis = {}
+
+        try:
+            encoding = context.encode(self.num_jitters)
+        except Exception as e:
+            logger.error(f"Encoding error: {e}")
+            encoding = None
+
+        return {"encoding": encoding, "face_analysis": analysis}
+
+    def process_faces(
+        self, image: np.ndarray, face_locations: List[Tuple[int, int, int, int]], quality_gate: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Analyze and encode several faces, one landmark pass per face."""
+        return [self.process_face(image, location, quality_gate) for location in face_locations]
+
+    def check_quality(
+        self,
+        image: np.ndarray,
+        face_location: Tuple[int, int, int, int],
+        context: Optional[FaceContext] = None
+    ) -> Dict[str, Any]:
+        """
+        Cheaply decide whether a detected face is worth encoding.
+
+        Checks face size, sharpness (Laplacian variance) and exposure of the
+        face crop, and yaw/roll from the 5-point landmark model, all before
+        the 68-point predictor and the encoder run.
+
+        Args:
+            image: The image containing the face
+            face_location: Face box as (top, right, bottom, left)
+            context: The face's FaceContext, so the encoder reuses the 5-point shape
+
+        Returns:
+            A dict with "passed", the failed check "reasons", a user-facing
+            "message" and the measured "metrics"
+        """
+        top, right, bottom, left = face_location
+        size = min(bottom - top, right - left)
+        metrics: Dict[str, Any] = {"face_size": size}
+        reasons = []
+        if size < config.QUALITY_MIN_FACE_SIZE:
+            reasons.append("face_too_small")
+
+        try:
+            crop = image[max(0, top):bottom, max(0, left):right]
+            if crop.size:
+                scale = min(1.0, QUALITY_CROP_SIZE / crop.shape[0])
+                if scale < 1.0:
+                    crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), QUALITY_CROP_SIZE),
+                                      interpolation=cv2.INTER_AREA)
+                gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+                metrics["sharpness"] = round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 2)
+                metrics["brightness"] = round(float(gray.mean()), 2)
+                if metrics["sharpness"] < config.QUALITY_MIN_SHARPNESS:
+                    reasons.append("blurry")
+                if metrics["brightness"] < config.QUALITY_MIN_BRIGHTNESS:
+                    reasons.append("underexposed")
+                elif metrics["brightness"] > config.QUALITY_MAX_BRIGHTNESS:
+                    reasons.append("overexposed")
+
+            if not reasons:
+                pose = self._estimate_pose_5_point(context or FaceContext(image, face_location))
+                metrics["pose"] = pose
+                if pose and (abs(pose["yaw"]) > config.QUALITY_MAX_YAW or abs(pose["roll"]) > config.QUALITY_MAX_ROLL):
+                    reasons.append("extreme_pose")
+        except Exception as e:
+            # A failing check must not reject a face the encoder could handle
+            logger.error(f"Quality check error: {e}")
+
+        message = None
+        if reasons:
+            message = "Face image quality too low: " + ", ".join(QUALITY_REASONS[r] for r in reasons) + "."
+        return {"passed": not reasons, "reasons": reasons, "message": message, "metrics": metrics}
+
+    def _estimate_pose_5_point(self, context: FaceContext) -> Dict[str, float]:
+        """Estimate yaw and roll from dlib's 5-point landmarks (eye corners and nose base)."""
+        points = [(p.x, p.y) for p in context.shape_5.parts()]
+        eye_a = ((points[0][0] + points[1][0]) / 2, (points[0][1] + points[1][1]) / 2)
+        eye_b = ((points[2][0] + points[3][0]) / 2, (points[2][1] + points[3][1]) / 2)
+        left_eye, right_eye = sorted([eye_a, eye_b])
+        nose = points[4]
+
+        half_distance = (right_eye[0] - left_eye[0]) / 2
+        if half_distance <= 0:
+            return {}
+        eye_center_x = (left_eye[0] + right_eye[0]) / 2
+        yaw = (nose[0] - eye_center_x) / half_distance * 30
+        roll = math.degrees(math.atan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]))
+        return {"yaw": round(yaw, 2), "roll": round(roll, 2)}
+
     def _adjust_brightness_contrast(self, image: np.ndarray, alpha: float, beta: int) -> np.ndarray:
         """Adjust brightness and contrast of an image."""
         return cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
 
+    def _padded_crop(
+        self, image: np.ndarray, face_location: Tuple[int, int, int, int]
+    ) -> Tuple[np.ndarray, Tuple[int, int, int, int]]:
+        """
+        Crop the face with context padding, downscaling very large faces.
+
+        Args:
+            image: Full image
+            face_location: Face box in image coordinates
+
+        Returns:
+            The crop and the face box remapped to crop coordinates
+        """
+        top, right, bottom, left = face_location
+        pad_y = int((bottom - top) * MULTI_ANGLE_PADDING)
+        pad_x = int((right - left) * MULTI_ANGLE_PADDING)
+        y0, x0 = max(0, top - pad_y), max(0, left - pad_x)
+        y1, x1 = min(image.shape[0], bottom + pad_y), min(image.shape[1], right + pad_x)
+        crop = image[y0:y1, x0:x1]
+        local = (top - y0, right - x0, bottom - y0, left - x0)
+
+        # dlib aligns faces to a 150px chip, so larger faces only cost memory
+        scale = MULTI_ANGLE_FACE_SIZE / max(1, bottom - top)
+        if scale < 1.0:
+            crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale))),
+                              interpolation=cv2.INTER_AREA)
+            local = tuple(int(v * scale) for v in local)
+        return crop, local
+
+    def _multi_angle_variants(
+        self, crop: np.ndarray, face_location: Tuple[int, int, int, int]
+    ) -> List[Tuple[str, Any, Tuple[int, int, int, int]]]:
+        """
+        List the augmentations of a face crop.
+
+        Args:
+            crop: Padded face crop
+            face_location: Face box in crop coordinates
+
+        Returns:
+            (operation, parameter, face box of the augmented face) tuples
+        """
+        top, right, bottom, left = face_location
+        height, width = bottom - top, right - left
+        variants = [("original", None, face_location)]
+
+        # Rotation jitter
+        for angle in range(-self.multi_angle_jitter, self.multi_angle_jitter + 1, 3):
+            if angle != 0:
+                variants.append(("rotate", angle, face_location))
+
+        # Scaling jitter
+        for scale in [0.95, 0.98, 1.02, 1.05]:
+            new_w, new_h = int(width * scale), int(height * scale)
+            new_top = max(0, top - (new_h - height) // 2)
+            new_left = max(0, left - (new_w - width) // 2)
+            new_bottom = min(crop.shape[0], new_top + new_h)
+            new_right = min(crop.shape[1], new_left + new_w)
+            variants.append(("scale", scale, (new_top, new_right, new_bottom, new_left)))
+
+        # Brightness and contrast adjustments
+        for alpha in [0.9, 1.0, 1.1]:
+            for beta in [-10, 0, 10]:
+                variants.append(("adjust", (alpha, beta), face_location))
+
+        return variants
+
+    @contextmanager
+    def _scratch_canvas(self, shape: Tuple[int, int, int]) -> Iterator[np.ndarray]:
+        """
+        Borrow a scratch buffer from the shared pool as a canvas of the given shape.
+
+        At most SCRATCH_POOL_SIZE buffers of up to SCRATCH_MAX_BYTES each are
+        kept between uses, so steady-state registrations allocate nothing
+        while idle workers hold no memory of their own.
+        """
+        size = int(np.prod(shape))
+        with _scratch_lock:
+            buffer = _scratch_pool.pop() if _scratch_pool else None
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(size, dtype=np.uint8)
+
+        try:
+            yield buffer[:size].reshape(shape)
+        finally:
+            if buffer.size <= SCRATCH_MAX_BYTES:
+                with _scratch_lock:
+                    if len(_scratch_pool) < SCRATCH_POOL_SIZE:
+                        _scratch_pool.append(buffer)
+
+    def _render_variant(self, face_img: np.ndarray, operation: str, param: Any, dst: np.ndarray) -> None:
+        """Write one augmented face into dst in place."""
+        if operation == "rotate":
+            height, width = face_img.shape[:2]
+            M = cv2.getRotationMatrix2D((width // 2, height // 2), param, 1.0)
+            cv2.warpAffine(face_img, M, (width, height), dst=dst)
+        elif operation == "scale":
+            cv2.resize(face_img, (dst.shape[1], dst.shape[0]), dst=dst)
+        elif operation == "adjust":
+            alpha, beta = param
+            cv2.convertScaleAbs(face_img, dst=dst, alpha=alpha, beta=beta)
+
+    def _encode_tiled(
+        self,
+        crop: np.ndarray,
+        face_location: Tuple[int, int, int, int],
+        variants: List[Tuple[str, Any, Tuple[int, int, int, int]]]
+    ) -> List[np.ndarray]:
+        """
+        Render every variant of a face crop into one canvas and encode them in a single call.
+
+        Args:
+            crop: Padded face crop
+            face_location: Face box in crop coordinates
+            variants: Augmentations from _multi_angle_variants
+
+        Returns:
+            One encoding per variant
+        """
+        top, right, bottom, left = face_location
+        face_img = crop[top:bottom, left:right]
+        cell_h, cell_w = crop.shape[:2]
+        cols = math.ceil(math.sqrt(len(variants)))
+        rows = math.ceil(len(variants) / cols)
+        with self._scratch_canvas((rows * cell_h, cols * cell_w, 3)) as canvas:
+            canvas.fill(0)
+
+            locations = []
+            for i, (operation, param, (v_top, v_right, v_bottom, v_left)) in enumerate(variants):
+                oy, ox = (i // cols) * cell_h, (i % cols) * cell_w
+                cell = canvas[oy:oy + cell_h, ox:ox + cell_w]
+                np.copyto(cell, crop)
+                self._render_variant(face_img, operation, param, cell[v_top:v_bottom, v_left:v_right])
+                locations.append((v_top + oy, v_right + ox, v_bottom + oy, v_left + ox))
+
+            return face_recognition.face_encodings(
+                canvas, locations, num_jitters=self.num_jitters, model=ENCODING_LANDMARK_MODEL
+            )
+
     def generate_multi_angle_encodings(
         self, image: np.ndarray, face_location: Tuple[int, int, int, int]
     ) -> List[np.ndarray]:
         """Generate multiple encodings with small variations to improve accuracy."""
         try:
-            top, right, bottom, left = face_location
-            face_img = image[top:bottom, left:right]
-            encodings = []
-
-            base_encoding = self.encode_face(image, face_location)
-            if base_encoding is None:
-                return []
-
-            encodings.append(base_encoding)
-
-            height, width = face_img.shape[:2]
-            center = (width // 2, height // 2)
-
-            # Rotation jitter
-            for angle in range(-self.multi_angle_jitter, self.multi_angle_jitter + 1, 3):
-                if angle == 0:
-                    continue
-                M = cv2.getRotationMatrix2D(center, angle, 1.0)
-                rotated = cv2.warpAffine(face_img, M, (width, height))
-                temp_image = image.copy()
-                temp_image[top:bottom, left:right] = rotated
-                enc = self.encode_face(temp_image, face_location)
-                if enc is not None:
-                    encodings.append(enc)
-
-            # Scaling jitter
-            for scale in [0.95, 0.98, 1.02, 1.05]:
-                new_w, new_h = int(width * scale), int(height * scale)
-                scaled = cv2.resize(face_img, (new_w, new_h))
-                temp_image = image.copy()
-
-                new_top = max(0, top - (new_h - height) // 2)
-                new_left = max(0, left - (new_w - width) // 2)
-                new_bottom = min(image.shape[0], new_top + new_h)
-                new_right = min(image.shape[1], new_left + new_w)
-
-                scaled = cv2.resize(scaled, (new_right - new_left, new_bottom - new_top))
-                temp_image[new_top:new_bottom, new_left:new_right] = scaled
-
-                new_loc = (new_top, new_right, new_bottom, new_left)
-                enc = self.encode_face(temp_image, new_loc)
-                if enc is not None:
-                    encodings.append(enc)
-
-            # Brightness and contrast adjustments
-            for alpha in [0.9, 1.0, 1.1]:
-                for beta in [-10, 0, 10]:
-                    adjusted = self._adjust_brightness_contrast(face_img, alpha, beta)
-                    temp_image = image.copy()
-                    temp_image[top:bottom, left:right] = adjusted
-                    enc = self.encode_face(temp_image, face_location)
-                    if enc is not None:
-                        encodings.append(enc)
+            crop, local_location = self._padded_crop(image, face_location)
+            variants = self._multi_angle_variants(crop, local_location)
+            encodings = self._encode_tiled(crop, local_location, variants)
 
             logger.info(f"Generated {len(encodings)} encodings with jitter.")
             return encodings
@@ -159,30 +675,47 @@ class FaceService:
             return None
         return np.mean(encodings, axis=0)
 
+    def encode_to_bytes(self, encoding: np.ndarray) -> bytes:
+        """Serialize a single face encoding for database storage."""
+        return pack_vectors([encoding])
+
+    def decode_from_bytes(self, data: bytes) -> np.ndarray:
+        """Deserialize a single face encoding stored with encode_to_bytes."""
+        return unpack_vectors(data)[0]
+
+    def encode_multiple_to_bytes(self, encodings: List[np.ndarray]) -> bytes:
+        """Serialize a list of face encodings as one contiguous block."""
+        return pack_vectors(encodings)
+
+    def decode_multiple_from_bytes(self, data: bytes) -> List[np.ndarray]:
+        """Deserialize encodings stored with encode_multiple_to_bytes."""
+        return list(unpack_vectors(data))
+
     def analyze_face(
         self, image: np.ndarray, face_location: Tuple[int, int, int, int]
     ) -> Dict[str, Any]:
         """Analyze face alignment and provide pose estimation."""
         try:
-            landmarks_list = face_recognition.face_landmarks(image, [face_location])
-            if not landmarks_list:
-                logger.warning("No landmarks found.")
-                return {}
-
-            landmarks = landmarks_list[0]
-            pose = self._estimate_pose(landmarks)
-            quality = self._estimate_quality(image, face_location, landmarks)
-            recommendation = self._generate_pose_recommendations(pose)
-
-            return {
-                "pose": pose,
-                "alignment_quality": quality,
-                "pose_recommendation": recommendation,
-            }
+            context = FaceContext(image, face_location)
+            return self._analysis_from_landmarks(image, face_location, context.landmarks)
         except Exception as e:
             logger.error(f"Face analysis error: {e}")
             return {}
 
+    def _analysis_from_landmarks(
+        self, image: np.ndarray, face_location: Tuple[int, int, int, int], landmarks: Dict[str, List[Tuple[int, int]]]
+    ) -> Dict[str, Any]:
+        """Build the pose and quality analysis for one face from its landmarks."""
+        pose = self._estimate_pose(landmarks)
+        quality = self._estimate_quality(image, face_location, landmarks)
+        recommendation = self._generate_pose_recommendations(pose)
+
+        return {
+            "pose": pose,
+            "alignment_quality": quality,
+            "pose_recommendation": recommendation,
+        }
+
     def _estimate_pose(self, landmarks: Dict[str, List[Tuple[int, int]]]) -> Dict[str, float]:
         """Estimate face pose based on landmarks."""
         try:
@@ -237,3 +770,6 @@ class FaceService:
         if abs(pose["roll"]) > 20:
             return "Please level your head."
         return None
+
+# Create face service instance
+face_service = FaceService()
@@ -0,0 +1,223 @@
+"""
+Face tracker for streaming recognition.
+Follows detected faces between frames with template matching so that full
+detection runs only periodically and each face is identified once per track.
+"""
+
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+import sys
+from pathlib import Path
+
+# Import config and logger
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import config
+from utils.logger import get_logger
+
+# Get logger
+logger = get_logger("face_tracker")
+
+# Height in pixels that face templates are scaled to before matching
+TEMPLATE_SIZE = 48
+# Search window around the previous box, as a fraction of the box size
+SEARCH_MARGIN = 0.5
+
+class Track:
+    """A face followed across frames, with the identity assigned to it."""
+
+    def __init__(self, track_id: int, location: Tuple[int, int, int, int]):
+        self.track_id = track_id
+        self.location = location
+        self.template: Optional[np.ndarray] = None
+        self.scale = 1.0
+        self.score = 1.0
+        self.identity: Optional[Dict[str, Any]] = None
+        self.identified_version: Optional[int] = None
+        self.identified_frame = 0
+        self.candidates: List[Dict[str, Any]] = []
+
+class FaceTracker:
+    """
+    Per-stream tracker deciding when full detection is needed.
+
+    Detection runs every detect_interval frames, when there is nothing to
+    track, or when any track's template match score drops below min_score.
+    In between, each track's box is moved to the best template match near
+    its previous position.
+
+    A track whose template match is lost drops its identity, since another
+    face may have taken its place, and identities are verified again every
+    reverify_interval frames.
+    """
+
+    def __init__(
+        self,
+        detect_interval: int = config.STREAM_DETECT_INTERVAL,
+        min_score: float = config.STREAM_TRACK_MIN_SCORE,
+        min_iou: float = config.STREAM_TRACK_MIN_IOU,
+        reverify_interval: int = config.STREAM_TRACK_REVERIFY_INTERVAL
+    ):
+        """
+        Initialize an empty tracker.
+
+        Args:
+            detect_interval: Frames between full detections
+            min_score: Template match score below which a track is considered lost
+            min_iou: Overlap needed to attach a detection to an existing track
+            reverify_interval: Frames after which an identified track is matched again
+        """
+        self.detect_interval = detect_interval
+        self.min_score = min_score
+        self.min_iou = min_iou
+        self.reverify_interval = reverify_interval
+        self.tracks: List[Track] = []
+        self._next_id = 1
+        self._since_detection = 0
+        self._frame = 0
+
+    def needs_detection(self) -> bool:
+        """Whether the next frame should run full face detection."""
+        return (
+            not self.tracks
+            or self._since_detection >= self.detect_interval
+            or any(track.score < self.min_score for track in self.tracks)
+        )
+
+    def update(
+        self, image: np.ndarray, locations: List[Tuple[int, int, int, int]], version: int
+    ) -> List[Track]:
+        """
+        Replace the tracks with a fresh set of detections.
+
+        Detections overlapping an existing track keep that track's ID and
+        identity; the rest start new tracks. Tracks without a detection end.
+        Tracks are returned for identification when they have no identity,
+        the gallery changed, or their identity is due for verification.
+
+        Args:
+            image: The frame the detections come from
+            locations: Detected face boxes
+            version: Current gallery version
+
+        Returns:
+            Tracks that still need to be identified
+        """
+        self._frame += 1
+        remaining = list(self.tracks)
+        tracks = []
+        for location in locations:
+            best, best_iou = None, self.min_iou
+            for track in remaining:
+                iou = self._iou(track.location, location)
+                if iou >= best_iou:
+                    best, best_iou = track, iou
+            if best is None:
+                best = Track(self._next_id, location)
+                self._next_id += 1
+            else:
+                remaining.remove(best)
+                best.location = location
+
+            self._set_template(best, image)
+            tracks.append(best)
+
+        self.tracks = tracks
+        self._since_detection = 0
+        return [
+            track for track in tracks
+            if track.identity is None
+            or track.identified_version != version
+            or self._frame - track.identified_frame >= self.reverify_interval
+        ]
+
+    def follow(self, image: np.ndarray) -> None:
+        """
+        Move every track to its best template match in the new frame.
+
+        A track whose match score falls below min_score loses its identity
+        and is identified again after the next detection.
+
+        Args:
+            image: The new frame
+        """
+        self._frame += 1
+        height, width = image.shape[:2]
+        for track in self.tracks:
+            top, right, bottom, left = track.location
+            margin_y = int((bottom - top) * SEARCH_MARGIN)
+            margin_x = int((right - left) * SEARCH_MARGIN)
+            y0, x0 = max(0, top - margin_y), max(0, left - margin_x)
+            y1, x1 = min(height, bottom + margin_y), min(width, right + margin_x)
+
+            window = self._gray(image[y0:y1, x0:x1], track.scale)
+            template = track.template
+            if (template is None or window.shape[0] < template.shape[0]
+                    or window.shape[1] < template.shape[1]):
+                track.score = 0.0
+                self._lose(track)
+                continue
+
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (dx, dy) = cv2.minMaxLoc(scores)
+            new_top = y0 + int(dy / track.scale)
+            new_left = x0 + int(dx / track.scale)
+            track.location = (new_top, new_left + (right - left), new_top + (bottom - top), new_left)
+            track.score = float(score)
+            if track.score < self.min_score:
+                self._lose(track)
+
+        self._since_detection += 1
+
+    def identify(
+        self,
+        track: Track,
+        identity: Optional[Dict[str, Any]],
+        version: int,
+        candidates: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """
+        Attach a recognition result to a track.
+
+        Args:
+            track: The track
+            identity: Match details, or None if the face is unknown
+            version: Gallery version the match was computed against
+            candidates: Ranked candidate users the identity was chosen from
+        """
+        track.identity = identity
+        track.candidates = candidates or []
+        track.identified_version = version
+        track.identified_frame = self._frame
+
+    def _lose(self, track: Track) -> None:
+        """Drop the identity of a track whose face may have been replaced."""
+        track.identity = None
+        track.identified_version = None
+        track.candidates = []
+
+    def _set_template(self, track: Track, image: np.ndarray) -> None:
+        """Capture the track's current face region as its matching template."""
+        top, right, bottom, left = track.location
+        track.scale = min(1.0, TEMPLATE_SIZE / max(1, bottom - top))
+        track.template = self._gray(image[max(0, top):bottom, max(0, left):right], track.scale)
+        track.score = 1.0
+
+    def _gray(self, region: np.ndarray, scale: float) -> np.ndarray:
+        """Downscale an RGB region and convert it to grayscale."""
+        if region.size == 0:
+            return np.empty((0, 0), dtype=np.uint8)
+        if scale < 1.0:
+            size = (max(1, int(region.shape[1] * scale)), max(1, int(region.shape[0] * scale)))
+            region = cv2.resize(region, size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(region, cv2.COLOR_RGB2GRAY)
+
+    def _iou(self, a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+        """Intersection over union of two (top, right, bottom, left) boxes."""
+        top, bottom = max(a[0], b[0]), min(a[2], b[2])
+        left, right = max(a[3], b[3]), min(a[1], b[1])
+        intersection = max(0, bottom - top) * max(0, right - left)
+        area_a = (a[2] - a[0]) * (a[1] - a[3])
+        area_b = (b[2] - b[0]) * (b[1] - b[3])
+        union = area_a + area_b - intersection
+        return intersection / union if union > 0 else 0.0
@@ -0,0 +1,624 @@
+"""
+Gallery service for the Face Recognition API.
+Keeps every registered face encoding resident in memory as one contiguous
+matrix so a probe can be matched with a single vectorized distance computation.
+"""
+
+import json
+import threading
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List, Any, NamedTuple, Optional
+import sys
+from pathlib import Path
+
+# Import config and logger
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import config
+from utils.logger import get_logger
+from utils.database import database
+from services.face_service import ENCODING_SIZE
+from services.ann_index import ExactIndex, create_index
+
+# Get logger
+logger = get_logger("gallery_service")
+
+# Maximum relative tolerance relaxation applied when probe and gallery poses differ
+POSE_TOLERANCE_SLACK = 0.1
+# Pose difference (in degrees) at which the full slack is applied
+POSE_TOLERANCE_RANGE = 30.0
+# Per-user reductions supported when ranking candidates
+AGGREGATIONS = ("min", "mean")
+# Maximum number of probe x row distances computed in one block
+DISTANCE_BLOCK_ELEMENTS = 1 << 24
+
+class GallerySnapshot(NamedTuple):
+    """Consistent read-only view of the gallery arrays."""
+    matrix: np.ndarray
+    sq_norms: np.ndarray
+    poses: np.ndarray
+    owners: np.ndarray
+    codes: np.ndarray
+    alive: np.ndarray
+    users: Dict[str, Dict[str, Any]]
+    index: ExactIndex
+    index_state: Any
+
+class GalleryService:
+    """In-memory gallery of face encodings with a parallel array of row owners."""
+
+    def __init__(
+        self,
+        tolerance: float = config.FACE_RECOGNITION_TOLERANCE,
+        compaction_threshold: float = config.GALLERY_COMPACTION_THRESHOLD,
+        index_kind: str = config.GALLERY_INDEX
+    ):
+        """
+        Initialize an empty gallery.
+
+        Args:
+            tolerance: Maximum face distance considered a match
+            compaction_threshold: Fraction of tombstoned rows that triggers compaction
+            index_kind: Nearest-neighbour index used to select candidate rows
+        """
+        self.tolerance = tolerance
+        self.compaction_threshold = compaction_threshold
+        self.index_kind = index_kind
+        self._lock = threading.RLock()
+        self._compacting = False
+        self._generation = 0
+        self._version = 0
+        self._allocate(0)
+        self.loaded = False
+
+    def _allocate(self, capacity: int) -> None:
+        """
+        Reset the gallery to empty buffers with the given row capacity.
+
+        Args:
+            capacity: Number of rows to preallocate
+        """
+        self._matrix = np.empty((capacity, ENCODING_SIZE), dtype=np.float32)
+        self._sq_norms = np.empty(capacity, dtype=np.float32)
+        self._poses = np.empty((capacity, 3), dtype=np.float32)
+        self._owners = np.empty(capacity, dtype=object)
+        self._codes = np.empty(capacity, dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._count = 0
+        self._tombstones = 0
+        self._rows: Dict[str, np.ndarray] = {}
+        self._user_codes: Dict[str, int] = {}
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._index = create_index(self.index_kind)
+        self._generation += 1
+
+    @property
+    def size(self) -> int:
+        """Number of live encoding rows held in the gallery."""
+        return self._count - self._tombstones
+
+    @property
+    def user_count(self) -> int:
+        """Number of distinct users held in the gallery."""
+        return len(self._users)
+
+    @property
+    def version(self) -> int:
+        """Counter bumped on every content change, for invalidating cached match results."""
+        return self._version
+
+    async def load(self) -> None:
+        """
+        Load all face encodings from the database into memory.
+        """
+        db_faces = await database.get_all_face_encodings()
+        await run_in_threadpool(lambda: self.build(db_faces))
+
+    def build(self, db_faces: List[Dict[str, Any]]) -> None:
+        """
+        Replace the gallery contents with the given database rows.
+
+        Args:
+            db_faces: Rows as returned by database.get_all_face_encodings()
+        """
+        entries = [entry for entry in map(self._decode_entry, db_faces) if entry is not None]
+        capacity = sum(len(vectors) for vectors, _, _ in entries)
+
+        with self._lock:
+            self._allocate(capacity)
+            users: Dict[str, Dict[str, Any]] = {}
+            self._append(entries, users)
+            self._users = users
+            n = self._count
+            self._index.build(self._matrix[:n], self._owners[:n])
+            self.loaded = True
+            self._version += 1
+
+        logger.info(f"Loaded gallery with {self.size} encodings for {self.user_count} users")
+
+    def on_database_change(
+        self, event: str, user_ids: List[str], rows: Optional[List[Optional[Dict[str, Any]]]] = None
+    ) -> None:
+        """
+        Apply user changes reported by the database without a full reload.
+
+        A batch is applied with a single copy of the shared user map and a
+        single growth of the row buffers.
+
+        Args:
+            event: "added", "updated" or "deleted"
+            user_ids: The IDs of the changed users
+            rows: The users' face encoding rows for added and updated users
+        """
+        entries = []
+        if event != "deleted":
+            entries = [entry for entry in map(self._decode_entry, filter(None, rows or [])) if entry is not None]
+
+        with self._lock:
+            # Copy-on-write so in-flight snapshots keep their user map
+            users = dict(self._users)
+            self._remove(user_ids, users)
+            self._append(entries, users)
+            self._users = users
+            self._version += 1
+
+        if len(user_ids) == 1:
+            logger.info(f"Applied gallery {event} for user {user_ids[0]} ({self.size} live encodings)")
+        else:
+            logger.info(f"Applied gallery {event} for {len(user_ids)} users ({self.size} live encodings)")
+        self._maybe_compact()
+
+    def _append(self, entries: List[tuple], users: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Append users' encodings after the last used row. Caller holds the lock.
+
+        Rows below the current count are never written in place, so snapshots
+        taken by concurrent readers stay valid.
+
+        Args:
+            entries: (vectors, pose, user) tuples from _decode_entry()
+            users: User map to add the users' metadata to
+        """
+        if not entries:
+            return
+
+        start = self._count
+        end = start + sum(len(vectors) for vectors, _, _ in entries)
+        if end > len(self._matrix):
+            self._grow(end)
+
+        row = start
+        for vectors, pose, user in entries:
+            block = slice(row, row + len(vectors))
+            self._matrix[block] = vectors
+            self._sq_norms[block] = np.einsum("ij,ij->i", vectors, vectors)
+            self._poses[block] = pose
+            self._owners[block] = user["user_id"]
+            self._codes[block] = self._user_codes.setdefault(user["user_id"], len(self._user_codes))
+            self._alive[block] = True
+            self._rows[user["user_id"]] = np.arange(block.start, block.stop)
+            users[user["user_id"]] = user
+            row = block.stop
+        self._count = end
+
+        self._index.add(np.arange(start, end), self._matrix[start:end])
+
+    def _grow(self, required: int) -> None:
+        """
+        Reallocate the row buffers with at least the required capacity. Caller holds the lock.
+
+        Args:
+            required: Minimum number of rows needed
+        """
+        capacity = max(required, 2 * len(self._matrix), 64)
+        n = self._count
+        for name in ("_matrix", "_sq_norms", "_poses", "_owners", "_codes", "_alive"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+
+    def _remove(self, user_ids: List[str], users: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Tombstone all rows owned by the given users. Caller holds the lock.
+
+        Args:
+            user_ids: The IDs of the users to remove
+            users: User map to remove the users' metadata from
+        """
+        removed = [rows for rows in (self._rows.pop(user_id, None) for user_id in user_ids) if rows is not None]
+        for user_id in user_ids:
+            users.pop(user_id, None)
+        if not removed:
+            return
+
+        # Copy-on-write so in-flight snapshots keep their alive mask
+        rows = np.concatenate(removed)
+        alive = self._alive.copy()
+        alive[rows] = False
+        self._alive = alive
+        self._tombstones += len(rows)
+
+    def _maybe_compact(self) -> None:
+        """
+        Start a background compaction if tombstones exceed the threshold or
+        the gallery has grown enough to retrain the index.
+        """
+        with self._lock:
+            if self._compacting or not self._count:
+                return
+            if (self._tombstones / self._count < self.compaction_threshold
+                    and not self._index.needs_training(self.size)):
+                return
+            self._compacting = True
+
+        threading.Thread(target=self.compact, name="gallery-compaction", daemon=True).start()
+
+    def compact(self) -> None:
+        """
+        Drop tombstoned rows and repack the gallery buffers.
+
+        The bulk copy, and retraining the index if the gallery has outgrown
+        it, run outside the lock; rows appended or tombstoned meanwhile are
+        reconciled when the compacted buffers are swapped in.
+        """
+        try:
+            with self._lock:
+                snapshot = self._snapshot()
+                base_count = len(snapshot.owners)
+                generation = self._generation
+
+            keep = np.flatnonzero(snapshot.alive)
+            names = ("matrix", "sq_norms", "poses", "owners", "codes")
+            compacted = {name: getattr(snapshot, name)[keep] for name in names}
+
+            index = None
+            if snapshot.index.needs_training(len(keep)):
+                index = create_index(self.index_kind)
+                index.train(compacted["matrix"])
+
+            with self._lock:
+                if generation != self._generation:
+                    logger.info("Gallery was reloaded during compaction; discarding result")
+                    return
+                n = self._count
+                tail = slice(base_count, n)
+                alive = np.concatenate([self._alive[keep], self._alive[tail]])
+                for name in names:
+                    attr = f"_{name}"
+                    setattr(self, attr, np.concatenate([compacted[name], getattr(self, attr)[tail]]))
+
+                remap = np.full(n, -1, dtype=np.int64)
+                remap[keep] = np.arange(len(keep))
+                remap[base_count:n] = np.arange(len(keep), len(keep) + n - base_count)
+                self._rows = {user_id: remap[rows] for user_id, rows in self._rows.items()}
+                if index is None:
+                    self._index.remap(remap)
+                else:
+                    # Rows appended during training are indexed by the new index too
+                    appended = np.arange(len(keep), len(alive))
+                    index.add(appended, self._matrix[appended])
+                    self._index = index
+
+                self._alive = alive
+                self._count = len(alive)
+                self._tombstones = int(np.count_nonzero(~alive))
+
+            logger.info(f"Compacted gallery to {self._count} rows ({self._tombstones} tombstones)")
+            self.save_index()
+        except Exception as e:
+            logger.error(f"Gallery compaction error: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def save_index(self) -> None:
+        """
+        Persist the nearest-neighbour index so restarts can skip retraining it.
+        """
+        with self._lock:
+            n = self._count
+            matrix = self._matrix[:n]
+            owners = self._owners[:n]
+            alive = self._alive[:n]
+            self._index.save(matrix, owners, alive)
+
+    def _decode_entry(self, db_face: Dict[str, Any]) -> Optional[tuple]:
+        """
+        Decode one database row into its encoding block, pose and user metadata.
+
+        Args:
+            db_face: A row from database.get_all_face_encodings()
+
+        Returns:
+            A (vectors, pose, user) tuple or None if the row has no usable encoding
+        """
+        vectors = db_face.get("vectors")
+        if vectors is None or not len(vectors):
+            return None
+
+        # Match against the multi-angle encodings when there are any, else the base encoding
+        multi_angle = len(vectors) > 1
+        vectors = np.asarray(vectors[1:] if multi_angle else vectors, dtype=np.float32)
+
+        user = {
+            "user_id": db_face["id"],
+            "face_id": db_face.get("face_id"),
+            "name": db_face.get("name"),
+            "image_path": db_face.get("image_path") or db_face.get("image_url"),
+            "multi_angle": multi_angle,
+        }
+        return vectors, self._pose_vector(db_face.get("face_analysis")), user
+
+    def _pose_vector(self, face_analysis: Any) -> np.ndarray:
+        """
+        Convert a stored face analysis into a (yaw, pitch, roll) vector.
+
+        Args:
+            face_analysis: Face analysis as a JSON string or dictionary
+
+        Returns:
+            The pose vector, NaN-filled when no pose is available
+        """
+        try:
+            if isinstance(face_analysis, str):
+                face_analysis = json.loads(face_analysis)
+            pose = (face_analysis or {}).get("pose") or {}
+            return np.array([pose["yaw"], pose["pitch"], pose["roll"]], dtype=np.float32)
+        except Exception:
+            return np.full(3, np.nan, dtype=np.float32)
+
+    def _snapshot(self) -> GallerySnapshot:
+        """Return a consistent view of the used gallery rows."""
+        with self._lock:
+            n = self._count
+            return GallerySnapshot(
+                self._matrix[:n], self._sq_norms[:n], self._poses[:n],
+                self._owners[:n], self._codes[:n], self._alive[:n], self._users,
+                self._index, self._index.snapshot()
+            )
+
+    def distances(self, matrix: np.ndarray, sq_norms: np.ndarray, probes: np.ndarray) -> np.ndarray:
+        """
+        Compute Euclidean distances from each probe to every gallery row.
+
+        Args:
+            matrix: Gallery matrix (N x 128)
+            sq_norms: Squared L2 norms of the gallery rows
+            probes: Probe encodings (M x 128)
+
+        Returns:
+            Distance matrix (M x N)
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        probe_norms = np.einsum("ij,ij->i", probes, probes)
+        sq = probes @ matrix.T
+        sq *= -2.0
+        sq += sq_norms
+        sq += probe_norms[:, None]
+        return np.sqrt(np.maximum(sq, 0.0, out=sq), out=sq)
+
+    def _tolerances(self, poses: np.ndarray, pose: Optional[Dict[str, float]]) -> Optional[np.ndarray]:
+        """
+        Compute per-row tolerances relaxed by the pose difference to the probe.
+
+        Args:
+            poses: Gallery pose matrix (N x 3)
+            pose: Probe pose dictionary with yaw, pitch and roll
+
+        Returns:
+            Array of N tolerances, or None if no pose adjustment applies
+        """
+        if not pose or not len(poses):
+            return None
+        try:
+            probe_pose = np.array([pose["yaw"], pose["pitch"], pose["roll"]], dtype=np.float32)
+        except (KeyError, TypeError):
+            return None
+
+        delta = np.max(np.abs(poses - probe_pose), axis=1)
+        if np.all(np.isnan(delta)):
+            return None
+        factor = np.clip(np.nan_to_num(delta) / POSE_TOLERANCE_RANGE, 0.0, 1.0)
+        return self.tolerance * (1.0 + POSE_TOLERANCE_SLACK * factor)
+
+    def search(
+        self,
+        encoding: np.ndarray,
+        top_k: int = 1,
+        aggregate: str = "min",
+        pose: Optional[Dict[str, float]] = None
+    ) -> Dict[str, Any]:
+        """
+        Rank the k closest distinct users for a probe encoding.
+
+        Args:
+            encoding: Probe face encoding
+            top_k: Number of distinct users to return
+            aggregate: Per-user reduction, "min" or "mean"
+            pose: Optional probe pose used to relax the tolerance per row
+
+        Returns:
+            A dictionary with the ranked candidates and comparison diagnostics
+        """
+        return self.search_batch([encoding], top_k, aggregate, [pose])[0]
+
+    def search_batch(
+        self,
+        encodings: List[np.ndarray],
+        top_k: int = 1,
+        aggregate: str = "min",
+        poses: Optional[List[Optional[Dict[str, float]]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Rank the k closest distinct users for each of several probe encodings.
+
+        Probes are matched in blocks with one matrix-matrix distance
+        computation per block. Each user's rows are reduced to one distance
+        with the given aggregate. With an approximate index only the union of
+        the block's candidate rows takes part.
+
+        Args:
+            encodings: Probe face encodings
+            top_k: Number of distinct users to return per probe
+            aggregate: Per-user reduction, "min" or "mean"
+            poses: Optional probe poses used to relax the tolerance per row
+
+        Returns:
+            One dictionary per probe with the ranked candidates and comparison diagnostics
+        """
+        if aggregate not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregate: {aggregate}")
+
+        probes = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        poses = poses or [None] * len(probes)
+        snapshot = self._snapshot()
+        results = []
+
+        block_size = max(1, DISTANCE_BLOCK_ELEMENTS // max(len(snapshot.owners), 1))
+        for start in range(0, len(probes), block_size):
+            block = probes[start:start + block_size]
+            matrix, sq_norms, rows_poses, owners, codes, alive = snapshot[:6]
+
+            # Restrict the search to the index candidates, if the index selects any
+            candidate_rows = [snapshot.index.candidates(snapshot.index_state, probe) for probe in block]
+            if all(rows is not None for rows in candidate_rows):
+                rows = np.unique(np.concatenate(candidate_rows))
+                matrix, sq_norms, rows_poses, owners, codes, alive = (
+                    array[rows] for array in (matrix, sq_norms, rows_poses, owners, codes, alive)
+                )
+
+            live = np.flatnonzero(alive)
+            if not len(live):
+                results.extend(
+                    {"candidates": [], "comparisons": 0, "used_pose_adjustment": False} for _ in block
+                )
+                continue
+
+            distances = self.distances(matrix, sq_norms, block)[:, live]
+            rows_poses, codes, owners = rows_poses[live], codes[live], owners[live]
+            for i, pose in enumerate(poses[start:start + len(block)]):
+                result = {"candidates": [], "comparisons": len(live), "used_pose_adjustment": False}
+                tolerances = self._tolerances(rows_poses, pose)
+                if tolerances is not None:
+                    result["used_pose_adjustment"] = True
+                else:
+                    tolerances = np.full(len(live), self.tolerance, dtype=np.float32)
+
+                result["candidates"] = self._rank(
+                    distances[i], tolerances, codes, owners, snapshot.users, top_k, aggregate
+                )
+                results.append(result)
+
+        return results
+
+    def _rank(
+        self,
+        distances: np.ndarray,
+        tolerances: np.ndarray,
+        codes: np.ndarray,
+        owners: np.ndarray,
+        users: Dict[str, Dict[str, Any]],
+        top_k: int,
+        aggregate: str
+    ) -> List[Dict[str, Any]]:
+        """
+        Reduce row distances per user and return the k best users.
+
+        As in per-row matching against each user's own tolerance, users
+        within their tolerance rank ahead of users outside it, so a nearer
+        user with a stricter tolerance cannot hide a match. With "min" a
+        user's distance is that of their nearest row within tolerance, if
+        any.
+
+        Args:
+            distances: Distance of each live row to the probe
+            tolerances: Match tolerance of each live row
+            codes: Integer owner code of each live row
+            owners: Owner user ID of each live row
+            users: User metadata by user ID
+            top_k: Number of distinct users to return
+            aggregate: Per-user reduction, "min" or "mean"
+
+        Returns:
+            Candidate dictionaries, matches first, each group ordered by increasing distance
+        """
+        # Rank keys that place everything within tolerance ahead of everything outside it
+        offset = float(distances.max()) + 1.0
+        if aggregate == "min":
+            keys = np.where(distances <= tolerances, distances, distances + offset)
+            # The k best users are the first k distinct owners among the
+            # best-ranked rows; widen the partial sort until k owners are found
+            limit = min(len(keys), 32 * top_k)
+            while True:
+                nearest = np.argpartition(keys, limit - 1)[:limit] if limit < len(keys) else np.arange(len(keys))
+                nearest = nearest[np.argsort(keys[nearest], kind="stable")]
+                _, first = np.unique(codes[nearest], return_index=True)
+                if len(first) >= top_k or limit == len(keys):
+                    break
+                limit = min(len(keys), limit * 4)
+            user_rows = nearest[np.sort(first)][:top_k]
+            user_keys = keys[user_rows]
+            user_distances = distances[user_rows]
+            user_tolerances = tolerances[user_rows]
+            user_counts = np.array([np.count_nonzero(codes == codes[row]) for row in user_rows])
+        else:
+            n_codes = int(codes.max()) + 1
+            counts = np.bincount(codes, minlength=n_codes)
+            present = np.flatnonzero(counts)
+            user_counts = counts[present]
+            user_rows = np.empty(n_codes, dtype=np.int64)
+            user_rows[codes] = np.arange(len(codes))
+            user_rows = user_rows[present]
+            user_distances = np.bincount(codes, weights=distances, minlength=n_codes)[present] / user_counts
+            user_tolerances = np.bincount(codes, weights=tolerances, minlength=n_codes)[present] / user_counts
+            user_keys = np.where(user_distances <= user_tolerances, user_distances, user_distances + offset)
+
+        k = min(top_k, len(user_rows))
+        top = np.argpartition(user_keys, k - 1)[:k]
+        top = top[np.argsort(user_keys[top], kind="stable")]
+
+        candidates = []
+        for i in top:
+            user = users.get(owners[user_rows[i]])
+            if user is None:
+                continue
+            distance = float(user_distances[i])
+            tolerance = float(user_tolerances[i])
+            candidates.append({
+                "user_id": user["user_id"],
+                "face_id": user["face_id"],
+                "name": user["name"],
+                "image_path": user["image_path"],
+                "distance": distance,
+                "confidence": 1.0 - distance,
+                "adjusted_tolerance": tolerance,
+                "within_tolerance": distance <= tolerance,
+                "multi_angle_match": user["multi_angle"],
+                "encodings_compared": int(user_counts[i]),
+            })
+        return candidates
+
+    def match(
+        self,
+        encoding: np.ndarray,
+        pose: Optional[Dict[str, float]] = None
+    ) -> Dict[str, Any]:
+        """
+        Find the closest gallery match for a probe encoding.
+
+        Args:
+            encoding: Probe face encoding
+            pose: Optional probe pose used to relax the tolerance per row
+
+        Returns:
+            A dictionary with the best match (or None) and comparison diagnostics
+        """
+        result = self.search(encoding, 1, "min", pose)
+        candidates = result.pop("candidates")
+        result["match"] = candidates[0] if candidates and candidates[0]["within_tolerance"] else None
+        return result
+
+# Create gallery instance and keep it in sync with user changes
+gallery_service = GalleryService()
+database.add_listener(gallery_service.on_database_change)
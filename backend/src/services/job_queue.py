@@ -0,0 +1,168 @@
+"""
+Background job queue for the Face Recognition API.
+Jobs are persisted in the SQLite jobs table and executed by a bounded pool
+of asyncio workers, so queued work survives restarts.
+"""
+
+import uuid
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import sys
+from pathlib import Path
+
+# Import config and logger
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import config
+from utils.logger import get_logger
+from utils.database import database
+
+# Get logger
+logger = get_logger("job_queue")
+
+class JobQueue:
+    """Durable job queue with a fixed number of concurrent workers."""
+
+    def __init__(
+        self,
+        workers: int = config.JOB_WORKERS,
+        poll_interval: float = config.JOB_POLL_INTERVAL,
+        max_attempts: int = config.JOB_MAX_ATTEMPTS
+    ):
+        """
+        Initialize the job queue. Workers are started by start().
+
+        Args:
+            workers: Number of jobs executed concurrently
+            poll_interval: Seconds an idle worker waits before checking the table again
+            max_attempts: Attempts before a failing job is marked failed
+        """
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._handlers: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def register_handler(self, kind: str, handler: Callable[..., Awaitable[Any]]) -> None:
+        """
+        Register the coroutine function executing jobs of a kind.
+
+        The handler is called with the job payload as keyword arguments and
+        should return a falsy value or raise to signal failure.
+
+        Args:
+            kind: The job type
+            handler: The job handler
+        """
+        self._handlers[kind] = handler
+
+    async def start(self) -> None:
+        """
+        Requeue interrupted jobs of the registered kinds and start the workers.
+        """
+        if self._tasks:
+            return
+
+        await database.requeue_running_jobs(list(self._handlers))
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(i)) for i in range(self.workers)]
+        logger.info(f"Started {self.workers} job workers")
+
+    async def stop(self) -> None:
+        """
+        Stop the workers. Jobs in progress are requeued on the next start.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> str:
+        """
+        Persist a job and wake an idle worker.
+
+        Args:
+            kind: The job type
+            payload: JSON-serializable handler arguments
+
+        Returns:
+            The job ID
+        """
+        job_id = str(uuid.uuid4())
+        await database.add_job(job_id, kind, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job's current state.
+
+        Args:
+            job_id: The job ID
+
+        Returns:
+            The job or None if not found
+        """
+        return await database.get_job(job_id)
+
+    async def _work(self, worker_id: int) -> None:
+        """
+        Worker loop: claim and run jobs until cancelled.
+
+        Args:
+            worker_id: Index of the worker, for logging
+        """
+        while True:
+            # Clear before claiming so an enqueue during the claim still wakes us
+            self._wakeup.clear()
+            try:
+                job = await database.claim_job(list(self._handlers))
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} could not claim a job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        """
+        Execute one claimed job and record its outcome.
+
+        Args:
+            job: The claimed job
+        """
+        error = None
+        try:
+            if not await self._handlers[job["kind"]](**job["payload"]):
+                error = "Job handler reported failure"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e)
+
+        # A failed write leaves the job running until the next start requeues
+        # it, but must not take the worker down with it
+        try:
+            if error is None:
+                await database.update_job(job["id"], "completed")
+                logger.info(f"Completed {job['kind']} job {job['id']}")
+            elif job["attempts"] < self.max_attempts:
+                await database.update_job(job["id"], "queued", error)
+                logger.warning(f"Retrying {job['kind']} job {job['id']} after attempt {job['attempts']}: {error}")
+            else:
+                await database.update_job(job["id"], "failed", error)
+                logger.error(f"{job['kind']} job {job['id']} failed after {job['attempts']} attempts: {error}")
+        except Exception as e:
+            logger.error(f"Could not record the outcome of {job['kind']} job {job['id']}: {e}")
+
+# Create job queue instances; long bulk imports get their own workers so
+# they never hold up the short jobs queued by interactive registrations
+job_queue = JobQueue()
+bulk_job_queue = JobQueue(workers=config.BULK_JOB_WORKERS)
@@ -4,8 +4,10 @@ Provides functions for tracking and retrieving API metrics.
 """
 
 import time
+import asyncio
+import threading
 import statistics
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set
 import sys
 from pathlib import Path
 from collections import defaultdict
@@ -31,8 +33,13 @@ class MetricsService:
             "response_times": [],
             "endpoints": defaultdict(int),
             "status_codes": defaultdict(int),
+            "caches": defaultdict(lambda: {"hits": 0, "misses": 0}),
             "start_time": time.time()
         }
+        # Cache lookups are counted from worker threads
+        self._cache_lock = threading.Lock()
+        # Metric writes in flight, referenced until they finish
+        self._pending_writes: Set[asyncio.Task] = set()
         logger.info("Metrics service initialized")
     
     async def record_request(
@@ -44,6 +51,9 @@ class MetricsService:
         """
         Record a request in the metrics.
         
+        The database row is written in the background, so the response
+        never waits on the database.
+        
         Args:
             endpoint: The API endpoint
             response_time: The response time in seconds
@@ -61,11 +71,24 @@ class MetricsService:
             else:
                 self.metrics["failed_requests"] += 1
             
-            # Record in database
-            await database.add_metric(endpoint, response_time, status_code)
+            # Record in database without waiting for the write
+            task = asyncio.create_task(database.add_metric(endpoint, response_time, status_code))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
         except Exception as e:
             logger.error(f"Error recording request: {e}")
     
+    def record_cache_lookup(self, cache: str, hit: bool) -> None:
+        """
+        Record a lookup in an in-process cache.
+        
+        Args:
+            cache: The cache name
+            hit: Whether the lookup was a hit
+        """
+        with self._cache_lock:
+            self.metrics["caches"][cache]["hits" if hit else "misses"] += 1
+    
     def get_metrics(self) -> Dict[str, Any]:
         """
         Get the current metrics.
@@ -77,6 +100,8 @@ class MetricsService:
             # Calculate statistics
             response_times = self.metrics["response_times"]
             avg_response_time = statistics.mean(response_times) if response_times else 0
+            with self._cache_lock:
+                caches = {name: dict(counts) for name, counts in self.metrics["caches"].items()}
             
             # Calculate uptime
             uptime_seconds = time.time() - self.metrics["start_time"]
@@ -102,6 +127,13 @@ class MetricsService:
                 },
                 "endpoints": dict(self.metrics["endpoints"]),
                 "status_codes": dict(self.metrics["status_codes"]),
+                "caches": {
+                    name: {
+                        **counts,
+                        "hit_rate": (counts["hits"] / (counts["hits"] + counts["misses"]) * 100) if counts["hits"] + counts["misses"] > 0 else 0
+                    }
+                    for name, counts in caches.items()
+                },
                 "uptime": uptime
             }
         except Exception as e:
@@ -0,0 +1,267 @@
+"""
+Probe caches for the Face Recognition API.
+Keeps recently computed probe encodings in memory, keyed by a hash of the
+raw image bytes, so re-submitted images skip decode, detection and encoding,
+and remembers each client's recent match results so near-identical
+consecutive frames skip the gallery search.
+"""
+
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, Optional, Union
+import sys
+from pathlib import Path
+
+# Import config and logger
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import config
+from utils.logger import get_logger
+from services.metrics_service import metrics_service
+
+# Get logger
+logger = get_logger("probe_cache")
+
+class ProbeCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL.
+
+    An entry holds the probe's face locations and processed faces. Match
+    results may be attached to an entry together with the gallery version
+    they were computed against, and are ignored once the gallery changes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = config.PROBE_CACHE_SIZE,
+        ttl: int = config.PROBE_CACHE_TTL,
+        name: str = "probe"
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of cached probes; 0 disables the cache
+            ttl: Seconds an entry stays valid after it is stored
+            name: Cache name reported in the metrics
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the cache stores anything."""
+        return self.max_entries > 0
+
+    def key(self, image_data: Union[str, bytes]) -> str:
+        """
+        Compute the cache key for raw image data.
+
+        Args:
+            image_data: Uploaded bytes or base64 string
+
+        Returns:
+            A hex digest of the data
+        """
+        if isinstance(image_data, str):
+            image_data = image_data.encode()
+        return hashlib.blake2b(image_data, digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a probe and record the hit or miss.
+
+        Args:
+            key: Cache key from key()
+
+        Returns:
+            The cached entry, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires"] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        metrics_service.record_cache_lookup(self.name, entry is not None)
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store a probe, evicting the least recently used entries over the cap.
+
+        Args:
+            key: Cache key from key()
+            entry: The probe data to cache
+
+        Returns:
+            The stored entry
+        """
+        if not self.enabled:
+            return entry
+
+        entry["expires"] = time.monotonic() + self.ttl
+        entry.setdefault("results", {})
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get_result(self, entry: Dict[str, Any], params: Hashable, version: int) -> Optional[Any]:
+        """
+        Return a match result cached on an entry if the gallery is unchanged.
+
+        Args:
+            entry: A cached probe entry
+            params: The matching parameters the result was computed with
+            version: The current gallery version
+
+        Returns:
+            The cached result, or None if absent or stale
+        """
+        cached = entry.get("results", {}).get(params)
+        if cached is None or cached[0] != version:
+            return None
+        return cached[1]
+
+    def put_result(self, entry: Dict[str, Any], params: Hashable, version: int, result: Any) -> None:
+        """
+        Attach a match result to an entry.
+
+        Args:
+            entry: A cached probe entry
+            params: The matching parameters the result was computed with
+            version: The gallery version read before the result was computed
+            result: The match result
+        """
+        if "results" in entry:
+            entry["results"][params] = (version, result)
+
+    def clear(self) -> None:
+        """
+        Remove all cached probes.
+        """
+        with self._lock:
+            self._entries.clear()
+
+class RecentProbeCache:
+    """
+    Per-client cache of recent probe encodings and their match results.
+
+    A probe whose encoding lies within a small distance of one of the same
+    client's recent probes reuses that probe's result, as long as the match
+    parameters and the gallery version are unchanged.
+    """
+
+    def __init__(
+        self,
+        max_distance: float = config.PROBE_REUSE_DISTANCE,
+        ttl: float = config.PROBE_REUSE_TTL,
+        per_client: int = config.PROBE_REUSE_PER_CLIENT,
+        max_clients: int = config.PROBE_REUSE_MAX_CLIENTS,
+        name: str = "near_duplicate"
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_distance: Largest encoding distance treated as the same probe; 0 disables the cache
+            ttl: Seconds a result stays reusable
+            per_client: Recent probes remembered per client
+            max_clients: Clients tracked at once, least recently seen evicted first
+            name: Cache name reported in the metrics
+        """
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.per_client = per_client
+        self.max_clients = max_clients
+        self.name = name
+        self._clients: "OrderedDict[str, Deque[tuple]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the cache stores anything."""
+        return self.max_distance > 0 and self.per_client > 0 and self.max_clients > 0
+
+    def get(self, client: str, encoding: np.ndarray, params: Hashable, version: int) -> Optional[Any]:
+        """
+        Find the result of a recent near-identical probe from the same client.
+
+        Args:
+            client: Client or session identifier
+            encoding: The probe encoding
+            params: The matching parameters
+            version: The current gallery version
+
+        Returns:
+            The cached result, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            recent = self._clients.get(client)
+            candidates = [
+                entry for entry in recent or ()
+                if entry[0] > now and entry[2] == params and entry[3] == version
+            ]
+
+        result = None
+        if candidates:
+            distances = np.linalg.norm(np.stack([entry[1] for entry in candidates]) - encoding, axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] <= self.max_distance:
+                result = candidates[best][4]
+
+        metrics_service.record_cache_lookup(self.name, result is not None)
+        return result
+
+    def put(self, client: str, encoding: np.ndarray, params: Hashable, version: int, result: Any) -> None:
+        """
+        Remember a probe and its result for a client.
+
+        Args:
+            client: Client or session identifier
+            encoding: The probe encoding
+            params: The matching parameters
+            version: The gallery version read before the result was computed
+            result: The match result
+        """
+        if not self.enabled:
+            return
+
+        entry = (time.monotonic() + self.ttl, np.asarray(encoding), params, version, result)
+        with self._lock:
+            recent = self._clients.get(client)
+            if recent is None:
+                recent = self._clients[client] = deque(maxlen=self.per_client)
+            recent.append(entry)
+            self._clients.move_to_end(client)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Forget all clients.
+        """
+        with self._lock:
+            self._clients.clear()
+
+# Create probe cache instances
+probe_cache = ProbeCache()
+recent_probes = RecentProbeCache()
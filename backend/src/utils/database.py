@@ -3,23 +3,121 @@ Database utility module for the Face Recognition API.
 Provides functions for database operations.
 """
 
+import re
 import sqlite3
 import json
+import numpy as np
 import time
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple, Union
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Tuple, TypedDict, TypeVar, Union
 import sys
 
 # Import config and logger
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from config import config
 from utils.logger import get_logger
+from utils.encoding_codec import ENCODING_DIMENSION, ENCODING_DTYPE, read_into, split_vectors
 
 # Get logger
 logger = get_logger("database")
 
+T = TypeVar("T")
+
+# Schema version stored in PRAGMA user_version; migrations run up to it
+SCHEMA_VERSION = 2
+
+class UserRow(TypedDict):
+    """A user as returned by the user queries, without any encoding data."""
+    id: str
+    face_id: Optional[str]
+    name: str
+    employee_id: Optional[str]
+    department: Optional[str]
+    role: Optional[str]
+    image_path: Optional[str]
+    image_url: Optional[str]
+    face_analysis: Optional[str]
+    created_at: Optional[str]
+    updated_at: Optional[str]
+
+# Columns selected by the user queries; encodings are only read by the gallery loader
+USER_COLUMNS = ", ".join(UserRow.__annotations__)
+# Sort key of the newest-first user listing; users without a creation time
+# sort last instead of dropping out of keyset comparisons. Seeks spell out the
+# (key, id) comparison because SQLite only range-scans an expression index on
+# plain comparisons, not on row values
+LISTING_KEY = "COALESCE(created_at, '')"
+
+# Full-text search relevance weights of the name, employee_id, department and role columns
+SEARCH_WEIGHTS = (10.0, 5.0, 2.0, 2.0)
+
+def _on_db_thread(method: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """
+    Turn a blocking Database method that writes into a coroutine run on the writer thread.
+    
+    Args:
+        method: The blocking method
+    
+    Returns:
+        An async method awaiting the result without blocking the event loop
+    """
+    @functools.wraps(method)
+    async def wrapper(self: "Database", *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, self, *args, **kwargs))
+    return wrapper
+
+def _on_reader_thread(method: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """
+    Turn a blocking read-only Database method into a coroutine run on the reader pool.
+    
+    Args:
+        method: The blocking method
+    
+    Returns:
+        An async method awaiting the result without blocking the event loop
+    """
+    @functools.wraps(method)
+    async def wrapper(self: "Database", *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, functools.partial(method, self, *args, **kwargs))
+    return wrapper
+
+class PooledConnection(sqlite3.Connection):
+    """
+    SQLite connection kept open for reuse by its thread.
+    
+    close() only ends an unfinished transaction, so existing code that
+    closes its connection after each operation returns it to the pool.
+    """
+    
+    def close(self) -> None:
+        """
+        Release the connection, rolling back any uncommitted changes.
+        """
+        if self.in_transaction:
+            self.rollback()
+    
+    def dispose(self) -> None:
+        """
+        Really close the connection.
+        """
+        super().close()
+
 class Database:
-    """Database class for handling all database operations."""
+    """
+    Database class for handling all database operations.
+    
+    The async methods run their sqlite3 calls off the event loop, each
+    thread on its own pooled WAL connection. Writes are queued in call order
+    on one writer thread, and reads run concurrently on a small reader pool,
+    so a slow scan or bulk write does not hold up other requests' lookups.
+    Listeners are notified from the writer thread.
+    """
     
     def __init__(self, db_path: str = config.DB_PATH):
         """
@@ -29,6 +127,13 @@ class Database:
             db_path: Path to the SQLite database file
         """
         self.db_path = db_path
+        self._listeners: List[Callable[[str, List[str], Optional[List[Optional[Dict[str, Any]]]]], None]] = []
+        self._local = threading.local()
+        self._connections: List[PooledConnection] = []
+        self._connections_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database")
+        self._read_executor = self._reader_pool()
+        self._fts_enabled = False
         self._ensure_db_exists()
         
     def _ensure_db_exists(self) -> None:
@@ -40,8 +145,8 @@ class Database:
             db_dir = Path(self.db_path).parent
             db_dir.mkdir(exist_ok=True)
             
-            # Connect to database
-            conn = sqlite3.connect(self.db_path)
+            # Connect to database; the first connection switches the file to WAL mode
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             # Create users table if it doesn't exist
@@ -55,14 +160,38 @@ class Database:
                 role TEXT,
                 image_path TEXT,
                 image_url TEXT,
-                face_encoding BLOB,
-                multi_angle_encodings BLOB,
                 face_analysis TEXT,
                 created_at TEXT,
                 updated_at TEXT
             )
             ''')
             
+            # Index the newest-first listing order used for pagination
+            cursor.execute('DROP INDEX IF EXISTS idx_users_created_at')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_users_listing ON users ({LISTING_KEY} DESC, id DESC)')
+            
+            # Keep the user count in a one-row counter maintained by triggers,
+            # seeded from the table the first time it is created
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+            ''')
+            cursor.execute("INSERT OR IGNORE INTO counters (name, value) SELECT 'users', COUNT(*) FROM users")
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS users_count_insert AFTER INSERT ON users
+            BEGIN
+                UPDATE counters SET value = value + 1 WHERE name = 'users';
+            END
+            ''')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS users_count_delete AFTER DELETE ON users
+            BEGIN
+                UPDATE counters SET value = value - 1 WHERE name = 'users';
+            END
+            ''')
+            
             # Create metrics table if it doesn't exist
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS metrics (
@@ -83,8 +212,37 @@ class Database:
             )
             ''')
             
-            # Commit changes and close connection
+            # Create background jobs table if it doesn't exist
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TEXT,
+                updated_at TEXT
+            )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, kind)')
+            
+            # Create face encodings table if it doesn't exist; variant 0 is the
+            # base encoding and variants 1..n are the multi-angle encodings.
+            # Rows are clustered by user so a full scan reads them in order.
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS face_encodings (
+                user_id TEXT NOT NULL,
+                variant INTEGER NOT NULL,
+                vec BLOB NOT NULL,
+                PRIMARY KEY (user_id, variant)
+            ) WITHOUT ROWID
+            ''')
+            
+            # Commit changes, migrate older databases and close connection
             conn.commit()
+            self._migrate(conn)
+            self._fts_enabled = self._ensure_search_index(conn)
             conn.close()
             
             logger.info(f"Database initialized at {self.db_path}")
@@ -92,22 +250,307 @@ class Database:
             logger.error(f"Error initializing database: {e}")
             raise
     
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """
+        Upgrade the schema of an existing database to SCHEMA_VERSION.
+        
+        Version 1 moves the encodings stored in the users table's
+        face_encoding and multi_angle_encodings columns to face_encodings;
+        users whose encodings fail to convert keep them there, and the
+        version is left unchanged so the move is retried.
+        
+        Version 2 drops the search index keyed by user ID so that it is
+        rebuilt keyed by integer rowid.
+        
+        Args:
+            conn: A connection to the database
+        """
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        
+        moved = 0
+        failed = 0
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(users)')}
+        if version < 1 and 'face_encoding' in columns:
+            cursor = conn.cursor()
+            rows = cursor.execute('''
+            SELECT id, face_encoding, multi_angle_encodings FROM users
+            WHERE face_encoding IS NOT NULL OR multi_angle_encodings IS NOT NULL
+            ''').fetchall()
+            for row in rows:
+                # Move each user in its own savepoint and clear the legacy
+                # columns only once the move succeeded, so a BLOB that fails
+                # to convert is kept for the next start to retry
+                cursor.execute('SAVEPOINT migrate_user')
+                try:
+                    self._write_encodings(cursor, row['id'], row['face_encoding'], row['multi_angle_encodings'])
+                    cursor.execute(
+                        'UPDATE users SET face_encoding = NULL, multi_angle_encodings = NULL WHERE id = ?',
+                        (row['id'],)
+                    )
+                    cursor.execute('RELEASE migrate_user')
+                    moved += 1
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO migrate_user')
+                    cursor.execute('RELEASE migrate_user')
+                    failed += 1
+                    logger.error(f"Error migrating encodings of user {row['id']}: {e}")
+        
+        if version < 2:
+            for trigger in ('users_fts_insert', 'users_fts_delete', 'users_fts_update'):
+                conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            conn.execute('DROP TABLE IF EXISTS users_fts')
+        
+        if failed:
+            logger.error(f"Kept the legacy encodings of {failed} users; the migration is retried on the next start")
+        else:
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+        
+        if moved:
+            # Reclaim the space the BLOBs took in the users table
+            conn.execute('VACUUM')
+            logger.info(f"Moved encodings of {moved} users to the face_encodings table")
+    
+    def _ensure_search_index(self, conn: sqlite3.Connection) -> bool:
+        """
+        Create the full-text index over the users' searchable columns.
+        
+        The index is an FTS5 table whose rowids are the keys users_fts_keys
+        assigns to user IDs, kept in sync with the users table by triggers,
+        so updates and deletes reach their index row by rowid. The keys are
+        an INTEGER PRIMARY KEY, which VACUUM preserves, unlike the implicit
+        rowids of users. The index is filled from the existing users when it
+        is first created.
+        
+        Args:
+            conn: A connection to the database
+            
+        Returns:
+            True if full-text search is available, False if SQLite lacks FTS5
+        """
+        cursor = conn.cursor()
+        if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'users_fts'").fetchone():
+            return True
+        
+        try:
+            cursor.execute('''
+            CREATE VIRTUAL TABLE users_fts USING fts5(
+                name,
+                employee_id,
+                department,
+                role,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '1 2 3'
+            )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search unavailable, falling back to LIKE search: {e}")
+            return False
+        
+        cursor.execute('DROP TABLE IF EXISTS users_fts_keys')
+        cursor.execute('''
+        CREATE TABLE users_fts_keys (
+            key INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL UNIQUE
+        )
+        ''')
+        cursor.execute('INSERT INTO users_fts_keys (user_id) SELECT id FROM users')
+        cursor.execute('''
+        INSERT INTO users_fts (rowid, name, employee_id, department, role)
+        SELECT users_fts_keys.key, users.name, users.employee_id, users.department, users.role
+        FROM users_fts_keys JOIN users ON users.id = users_fts_keys.user_id
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users
+        BEGIN
+            INSERT INTO users_fts_keys (user_id) VALUES (new.id);
+            INSERT INTO users_fts (rowid, name, employee_id, department, role)
+            VALUES (
+                (SELECT key FROM users_fts_keys WHERE user_id = new.id),
+                new.name, new.employee_id, new.department, new.role
+            );
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users
+        BEGIN
+            DELETE FROM users_fts WHERE rowid = (SELECT key FROM users_fts_keys WHERE user_id = old.id);
+            DELETE FROM users_fts_keys WHERE user_id = old.id;
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF id, name, employee_id, department, role ON users
+        BEGIN
+            UPDATE users_fts_keys SET user_id = new.id WHERE user_id = old.id;
+            UPDATE users_fts
+            SET name = new.name, employee_id = new.employee_id, department = new.department, role = new.role
+            WHERE rowid = (SELECT key FROM users_fts_keys WHERE user_id = new.id);
+        END
+        ''')
+        conn.commit()
+        logger.info("Created full-text search index for users")
+        return True
+    
+    def _write_encodings(
+        self,
+        cursor: sqlite3.Cursor,
+        user_id: str,
+        face_encoding_bytes: Optional[bytes] = None,
+        multi_angle_encodings_bytes: Optional[bytes] = None
+    ) -> None:
+        """
+        Store a user's encodings, replacing the kinds that are given.
+        
+        Args:
+            cursor: Cursor of the current transaction
+            user_id: The ID of the user
+            face_encoding_bytes: Base face encoding as bytes
+            multi_angle_encodings_bytes: Multiple face encodings as bytes
+        """
+        if face_encoding_bytes is not None:
+            cursor.execute(
+                'INSERT OR REPLACE INTO face_encodings (user_id, variant, vec) VALUES (?, 0, ?)',
+                (user_id, split_vectors(face_encoding_bytes)[0])
+            )
+        if multi_angle_encodings_bytes is not None:
+            cursor.execute('DELETE FROM face_encodings WHERE user_id = ? AND variant > 0', (user_id,))
+            cursor.executemany(
+                'INSERT INTO face_encodings (user_id, variant, vec) VALUES (?, ?, ?)',
+                [
+                    (user_id, variant, vec)
+                    for variant, vec in enumerate(split_vectors(multi_angle_encodings_bytes), start=1)
+                ]
+            )
+    
+    def _read_face_row(self, cursor: sqlite3.Cursor, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a user's face row, as returned by get_all_face_encodings(), for change listeners.
+        
+        Args:
+            cursor: A database cursor
+            user_id: The ID of the user
+            
+        Returns:
+            The face row or None if the user does not exist
+        """
+        cursor.execute('''
+        SELECT id, face_id, name, face_analysis, image_path, image_url
+        FROM users
+        WHERE id = ?
+        ''', (user_id,))
+        user = cursor.fetchone()
+        if user is None:
+            return None
+        
+        cursor.execute('SELECT vec FROM face_encodings WHERE user_id = ? ORDER BY variant', (user_id,))
+        blobs = [row['vec'] for row in cursor.fetchall()]
+        vectors = np.empty((len(blobs), ENCODING_DIMENSION), dtype=ENCODING_DTYPE)
+        for i, blob in enumerate(blobs):
+            read_into(blob, vectors[i])
+        return dict(user, vectors=vectors)
+    
     def get_connection(self) -> sqlite3.Connection:
         """
-        Get a connection to the database.
+        Get the calling thread's pooled connection to the database.
+        
+        Each thread opens one connection on first use and keeps it. WAL
+        journaling lets readers proceed while another connection writes,
+        and the busy timeout makes a writer wait for the lock instead of
+        failing with "database is locked".
         
         Returns:
             A connection to the database
         """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            # Discard anything a failed operation left uncommitted
+            conn.close()
+            return conn
+        
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=config.DB_TIMEOUT / 1000,
+                factory=PooledConnection,
+                check_same_thread=False
+            )
             conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-            return conn
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute(f'PRAGMA busy_timeout = {int(config.DB_TIMEOUT)}')
+            conn.execute(f'PRAGMA cache_size = {-int(config.DB_CACHE_SIZE_KB)}')
+            conn.execute(f'PRAGMA mmap_size = {int(config.DB_MMAP_SIZE)}')
+            conn.execute('PRAGMA temp_store = MEMORY')
         except Exception as e:
             logger.error(f"Error connecting to database: {e}")
             raise
+        
+        self._local.conn = conn
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
+    def _reader_pool(self) -> ThreadPoolExecutor:
+        """
+        Create the executor that runs read-only operations.
+        """
+        return ThreadPoolExecutor(max_workers=config.DB_READERS, thread_name_prefix="database-reader")
     
-    async def add_user(
+    def close(self) -> None:
+        """
+        Close every pooled connection once queued operations have finished.
+        Threads reconnect on their next use.
+        """
+        readers, self._read_executor = self._read_executor, self._reader_pool()
+        readers.shutdown(wait=True)
+        self._executor.submit(self._close_connections).result()
+    
+    def _close_connections(self) -> None:
+        """
+        Close every pooled connection.
+        """
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.dispose()
+            except Exception as e:
+                logger.error(f"Error closing database connection: {e}")
+        self._local = threading.local()
+    
+    def add_listener(
+        self, listener: Callable[[str, List[str], Optional[List[Optional[Dict[str, Any]]]]], None]
+    ) -> None:
+        """
+        Register a callback notified after users are added, updated or deleted.
+        
+        Args:
+            listener: Callable receiving the event name ("added", "updated" or
+                "deleted"), the IDs of the changed users and their face rows as
+                returned by get_all_face_encodings(); users added in one batch
+                are reported in one call
+        """
+        self._listeners.append(listener)
+    
+    def _notify(self, event: str, user_ids: List[str], rows: Optional[List[Optional[Dict[str, Any]]]] = None) -> None:
+        """
+        Notify all registered listeners of user changes.
+        
+        Args:
+            event: The event name
+            user_ids: The IDs of the changed users
+            rows: The users' face encoding rows, if any
+        """
+        for listener in self._listeners:
+            try:
+                listener(event, user_ids, rows)
+            except Exception as e:
+                logger.error(f"Error notifying listener of {event} for {len(user_ids)} users: {e}")
+    
+    @_on_db_thread
+    def add_user(
         self, 
         user_data: Dict[str, Any], 
         face_encoding_bytes: Optional[bytes] = None,
@@ -136,19 +579,10 @@ class Database:
             
             # Prepare query
             fields = list(user_data.keys())
-            if face_encoding_bytes is not None:
-                fields.append('face_encoding')
-            if multi_angle_encodings_bytes is not None:
-                fields.append('multi_angle_encodings')
-                
             placeholders = ', '.join(['?' for _ in range(len(fields))])
             
             # Prepare values
             values = list(user_data.values())
-            if face_encoding_bytes is not None:
-                values.append(face_encoding_bytes)
-            if multi_angle_encodings_bytes is not None:
-                values.append(multi_angle_encodings_bytes)
             
             # Execute query
             query = f'''
@@ -156,18 +590,81 @@ class Database:
             VALUES ({placeholders})
             '''
             cursor.execute(query, values)
+            self._write_encodings(cursor, user_data.get('id'), face_encoding_bytes, multi_angle_encodings_bytes)
             
-            # Commit changes and close connection
+            # Commit changes
             conn.commit()
+            
+            # Read back the face row for change listeners
+            row = self._read_face_row(cursor, user_data.get('id')) if self._listeners else None
+            
+            # Close connection
             conn.close()
             
             logger.info(f"Added user {user_data.get('name')} with ID {user_data.get('id')}")
+            
+            self._notify("added", [user_data.get('id')], [row])
             return user_data.get('id')
         except Exception as e:
             logger.error(f"Error adding user: {e}")
             raise
-    
-    async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+
+    @_on_db_thread
+    def add_users(
+        self,
+        users: List[Tuple[Dict[str, Any], Optional[bytes], Optional[bytes]]]
+    ) -> List[str]:
+        """
+        Add several users in a single transaction.
+
+        Users whose ID already exists are skipped, so re-running an
+        interrupted batch with the same IDs does not create duplicates.
+
+        Args:
+            users: Tuples of user data, face encoding bytes and multi-angle encodings bytes
+
+        Returns:
+            The IDs of the added users
+        """
+        if not users:
+            return []
+
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            current_time = time.strftime('%Y-%m-%d %H:%M:%S')
+            added = []
+            for user_data, face_encoding_bytes, multi_angle_encodings_bytes in users:
+                user_data.setdefault('created_at', current_time)
+                user_data['updated_at'] = current_time
+                fields = list(user_data.keys())
+                cursor.execute(
+                    f"INSERT OR IGNORE INTO users ({', '.join(fields)}) VALUES ({', '.join('?' for _ in fields)})",
+                    list(user_data.values())
+                )
+                if cursor.rowcount:
+                    self._write_encodings(cursor, user_data.get('id'), face_encoding_bytes, multi_angle_encodings_bytes)
+                    added.append(user_data.get('id'))
+
+            # Commit the whole batch at once
+            conn.commit()
+
+            # Read back the face rows for change listeners
+            rows = [self._read_face_row(cursor, user_id) for user_id in added] if self._listeners else []
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error adding {len(users)} users: {e}")
+            raise
+        finally:
+            conn.close()
+
+        logger.info(f"Added {len(added)} users")
+        if added:
+            self._notify("added", added, rows)
+        return added
+
+    @_on_reader_thread
+    def get_user_by_id(self, user_id: str) -> Optional[UserRow]:
         """
         Get a user by ID.
         
@@ -182,7 +679,7 @@ class Database:
             cursor = conn.cursor()
             
             # Execute query
-            cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+            cursor.execute(f'SELECT {USER_COLUMNS} FROM users WHERE id = ?', (user_id,))
             user = cursor.fetchone()
             
             # Close connection
@@ -200,7 +697,8 @@ class Database:
             logger.error(f"Error getting user by ID: {e}")
             raise
     
-    async def get_all_users(self) -> List[Dict[str, Any]]:
+    @_on_reader_thread
+    def get_all_users(self) -> List[UserRow]:
         """
         Get all users from the database.
         
@@ -212,7 +710,7 @@ class Database:
             cursor = conn.cursor()
             
             # Execute query
-            cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
+            cursor.execute(f'SELECT {USER_COLUMNS} FROM users ORDER BY created_at DESC')
             users = cursor.fetchall()
             
             # Close connection
@@ -226,7 +724,8 @@ class Database:
             logger.error(f"Error getting all users: {e}")
             raise
     
-    async def get_users_paginated(self, page: int = 1, limit: int = 100) -> List[Dict[str, Any]]:
+    @_on_reader_thread
+    def get_users_paginated(self, page: int = 1, limit: int = 100) -> List[UserRow]:
         """
         Get paginated users from the database.
         
@@ -246,7 +745,7 @@ class Database:
             
             # Execute query with pagination
             cursor.execute(
-                'SELECT * FROM users ORDER BY created_at DESC LIMIT ? OFFSET ?',
+                f'SELECT {USER_COLUMNS} FROM users ORDER BY {LISTING_KEY} DESC, id DESC LIMIT ? OFFSET ?',
                 (limit, offset)
             )
             users = cursor.fetchall()
@@ -262,10 +761,60 @@ class Database:
             logger.error(f"Error getting paginated users: {e}")
             raise
     
-    async def get_users_count(self) -> int:
+    @_on_reader_thread
+    def get_users_after(self, after: Optional[Tuple[str, str]] = None, limit: int = 100) -> List[UserRow]:
+        """
+        Get the users that follow a position in the newest-first listing order.
+        
+        Keyset pagination: the query seeks straight to the position in the
+        listing index, so deep pages cost the same as the first. Users
+        without a creation time are listed last, in ID order.
+        
+        Args:
+            after: (created_at, id) of the last user of the previous page, with
+                "" for a missing created_at, or None for the first page
+            limit: Number of items per page
+            
+        Returns:
+            The next users
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            # Execute query from the position
+            if after is None:
+                cursor.execute(
+                    f'SELECT {USER_COLUMNS} FROM users ORDER BY {LISTING_KEY} DESC, id DESC LIMIT ?',
+                    (limit,)
+                )
+            else:
+                cursor.execute(f'''
+                SELECT {USER_COLUMNS} FROM users
+                WHERE {LISTING_KEY} <= ? AND ({LISTING_KEY} < ? OR id < ?)
+                ORDER BY {LISTING_KEY} DESC, id DESC
+                LIMIT ?
+                ''', (after[0], after[0], after[1], limit))
+            users = cursor.fetchall()
+            
+            # Close connection
+            conn.close()
+            
+            # Convert to list of dictionaries
+            users_list = [dict(user) for user in users]
+            logger.info(f"Retrieved {len(users_list)} users after {after} (limit {limit})")
+            return users_list
+        except Exception as e:
+            logger.error(f"Error getting users after {after}: {e}")
+            raise
+    
+    @_on_reader_thread
+    def get_users_count(self) -> int:
         """
         Get the total count of users in the database.
         
+        Reads the trigger-maintained counter instead of counting the table.
+        
         Returns:
             The total number of users
         """
@@ -273,8 +822,8 @@ class Database:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            # Execute count query
-            cursor.execute('SELECT COUNT(*) FROM users')
+            # Read the counter
+            cursor.execute("SELECT value FROM counters WHERE name = 'users'")
             count = cursor.fetchone()[0]
             
             # Close connection
@@ -286,7 +835,8 @@ class Database:
             logger.error(f"Error getting user count: {e}")
             raise
     
-    async def update_user(
+    @_on_db_thread
+    def update_user(
         self, 
         user_id: str, 
         user_data: Dict[str, Any],
@@ -314,17 +864,9 @@ class Database:
             
             # Prepare query
             set_clause = ', '.join([f'{key} = ?' for key in user_data.keys()])
-            if face_encoding_bytes is not None:
-                set_clause += ', face_encoding = ?'
-            if multi_angle_encodings_bytes is not None:
-                set_clause += ', multi_angle_encodings = ?'
                 
             # Prepare values
             values = list(user_data.values())
-            if face_encoding_bytes is not None:
-                values.append(face_encoding_bytes)
-            if multi_angle_encodings_bytes is not None:
-                values.append(multi_angle_encodings_bytes)
             values.append(user_id)
             
             # Execute query
@@ -337,13 +879,23 @@ class Database:
             
             # Check if user was updated
             updated = cursor.rowcount > 0
+            if updated:
+                self._write_encodings(cursor, user_id, face_encoding_bytes, multi_angle_encodings_bytes)
             
-            # Commit changes and close connection
+            # Commit changes
             conn.commit()
+            
+            # Read back the face row for change listeners
+            row = None
+            if updated and self._listeners:
+                row = self._read_face_row(cursor, user_id)
+            
+            # Close connection
             conn.close()
             
             if updated:
                 logger.info(f"Updated user with ID {user_id}")
+                self._notify("updated", [user_id], [row])
             else:
                 logger.warning(f"User with ID {user_id} not found for update")
             
@@ -352,7 +904,8 @@ class Database:
             logger.error(f"Error updating user: {e}")
             raise
     
-    async def delete_user(self, user_id: str) -> bool:
+    @_on_db_thread
+    def delete_user(self, user_id: str) -> bool:
         """
         Delete a user from the database.
         
@@ -371,6 +924,7 @@ class Database:
             
             # Check if user was deleted
             deleted = cursor.rowcount > 0
+            cursor.execute('DELETE FROM face_encodings WHERE user_id = ?', (user_id,))
             
             # Commit changes and close connection
             conn.commit()
@@ -378,6 +932,7 @@ class Database:
             
             if deleted:
                 logger.info(f"Deleted user with ID {user_id}")
+                self._notify("deleted", [user_id])
             else:
                 logger.warning(f"User with ID {user_id} not found for deletion")
             
@@ -386,57 +941,102 @@ class Database:
             logger.error(f"Error deleting user: {e}")
             raise
     
-    async def get_all_face_encodings(self) -> List[Dict[str, Any]]:
+    @_on_reader_thread
+    def get_all_face_encodings(self) -> List[Dict[str, Any]]:
         """
         Get all face encodings from the database.
         
+        The encodings are read in one scan of face_encodings, in primary key
+        order, straight into a single preallocated float32 matrix.
+        
         Returns:
-            A list of all face encodings with user data
+            A list of users with encodings; each has the user's fields and
+            "vectors", a view of the user's rows of the matrix in variant order
         """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            # Execute query
+            # Read users and encodings from one snapshot
+            cursor.execute('BEGIN')
             cursor.execute('''
-            SELECT id, face_id, name, face_encoding, multi_angle_encodings, face_analysis, image_path, image_url
+            SELECT id, face_id, name, face_analysis, image_path, image_url
             FROM users
-            WHERE face_encoding IS NOT NULL
             ''')
-            encodings = cursor.fetchall()
+            users = {user['id']: user for user in cursor.fetchall()}
+            
+            count = cursor.execute('SELECT COUNT(*) FROM face_encodings').fetchone()[0]
+            matrix = np.empty((count, ENCODING_DIMENSION), dtype=ENCODING_DTYPE)
+            owners = []
+            cursor.execute('SELECT user_id, vec FROM face_encodings ORDER BY user_id, variant')
+            for i, (user_id, vec) in enumerate(cursor):
+                read_into(vec, matrix[i])
+                owners.append(user_id)
             
             # Close connection
             conn.close()
             
-            # Convert to list of dictionaries
-            encodings_list = [dict(encoding) for encoding in encodings]
+            # Slice the matrix into one block per user
+            encodings_list = []
+            start = 0
+            for end in range(1, len(owners) + 1):
+                if end < len(owners) and owners[end] == owners[start]:
+                    continue
+                user = users.get(owners[start])
+                if user is not None:
+                    encodings_list.append(dict(user, vectors=matrix[start:end]))
+                start = end
+            
             logger.info(f"Retrieved {len(encodings_list)} face encodings")
             return encodings_list
         except Exception as e:
             logger.error(f"Error getting face encodings: {e}")
             raise
     
-    async def search_users(self, query: str) -> List[Dict[str, Any]]:
+    @_on_reader_thread
+    def search_users(self, query: str, limit: int = 20) -> List[UserRow]:
         """
         Search for users in the database.
         
+        Every word of the query must prefix a word of the user's name,
+        employee ID, department or role. Matches are ranked by relevance,
+        with name matches weighted highest.
+        
         Args:
             query: The search query
+            limit: Maximum number of users to return
             
         Returns:
-            A list of matching users
+            A list of matching users, best match first
         """
         try:
+            terms = re.findall(r"\w+", query)
+            if not terms:
+                return []
+            
             conn = self.get_connection()
             cursor = conn.cursor()
             
             # Execute query
-            search_term = f"%{query}%"
-            cursor.execute('''
-            SELECT * FROM users
-            WHERE name LIKE ? OR employee_id LIKE ? OR department LIKE ? OR role LIKE ?
-            ORDER BY created_at DESC
-            ''', (search_term, search_term, search_term, search_term))
+            if self._fts_enabled:
+                match = " ".join(f'"{term}"*' for term in terms)
+                columns = ", ".join(f"users.{column}" for column in UserRow.__annotations__)
+                cursor.execute(f'''
+                SELECT {columns} FROM users_fts
+                JOIN users_fts_keys ON users_fts_keys.key = users_fts.rowid
+                JOIN users ON users.id = users_fts_keys.user_id
+                WHERE users_fts MATCH ?
+                ORDER BY bm25(users_fts, {", ".join(map(str, SEARCH_WEIGHTS))})
+                LIMIT ?
+                ''', (match, limit))
+            else:
+                search_term = f"%{query}%"
+                cursor.execute(f'''
+                SELECT {USER_COLUMNS} FROM users
+                WHERE name LIKE ? OR employee_id LIKE ? OR department LIKE ? OR role LIKE ?
+                ORDER BY created_at DESC
+                LIMIT ?
+                ''', (search_term, search_term, search_term, search_term, limit))
             users = cursor.fetchall()
             
             # Close connection
@@ -450,7 +1050,8 @@ class Database:
             logger.error(f"Error searching users: {e}")
             raise
     
-    async def add_metric(
+    @_on_db_thread
+    def add_metric(
         self, 
         endpoint: str, 
         response_time: float, 
@@ -481,7 +1082,8 @@ class Database:
             logger.error(f"Error adding metric: {e}")
             # Don't raise exception for metrics to avoid affecting main functionality
     
-    async def get_metrics(
+    @_on_reader_thread
+    def get_metrics(
         self, 
         limit: int = 100, 
         endpoint: Optional[str] = None
@@ -525,7 +1127,8 @@ class Database:
             logger.error(f"Error getting metrics: {e}")
             raise
     
-    async def get_cache(self, key: str) -> Optional[Dict[str, Any]]:
+    @_on_reader_thread
+    def get_cache(self, key: str) -> Optional[Dict[str, Any]]:
         """
         Get a cached value from the database.
         
@@ -561,7 +1164,8 @@ class Database:
             # Don't raise exception for cache to avoid affecting main functionality
             return None
     
-    async def set_cache(self, key: str, value: Any, ttl: int = config.CACHE_TTL) -> None:
+    @_on_db_thread
+    def set_cache(self, key: str, value: Any, ttl: int = config.CACHE_TTL) -> None:
         """
         Set a cached value in the database.
         
@@ -591,7 +1195,8 @@ class Database:
             logger.error(f"Error setting cache: {e}")
             # Don't raise exception for cache to avoid affecting main functionality
     
-    async def clear_cache(self) -> int:
+    @_on_db_thread
+    def clear_cache(self) -> int:
         """
         Clear all expired cache entries.
         
@@ -620,7 +1225,8 @@ class Database:
             # Don't raise exception for cache to avoid affecting main functionality
             return 0
     
-    async def clear_all_cache(self) -> int:
+    @_on_db_thread
+    def clear_all_cache(self) -> int:
         """
         Clear all cache entries.
         
@@ -649,5 +1255,190 @@ class Database:
             # Don't raise exception for cache to avoid affecting main functionality
             return 0
 
+    @_on_db_thread
+    def add_job(self, job_id: str, kind: str, payload: Dict[str, Any]) -> str:
+        """
+        Queue a background job.
+        
+        Args:
+            job_id: The ID of the job
+            kind: The job type, used to pick its handler
+            payload: JSON-serializable job arguments
+            
+        Returns:
+            The ID of the queued job
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            # Execute query
+            current_time = time.strftime('%Y-%m-%d %H:%M:%S')
+            cursor.execute('''
+            INSERT INTO jobs (id, kind, status, payload, created_at, updated_at)
+            VALUES (?, ?, 'queued', ?, ?, ?)
+            ''', (job_id, kind, json.dumps(payload), current_time, current_time))
+            
+            # Commit changes and close connection
+            conn.commit()
+            conn.close()
+            
+            logger.info(f"Queued {kind} job {job_id}")
+            return job_id
+        except Exception as e:
+            logger.error(f"Error adding job: {e}")
+            raise
+    
+    @_on_db_thread
+    def claim_job(self, kinds: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the oldest queued job of the given kinds and mark it running.
+        
+        Args:
+            kinds: Job types the caller can handle
+            
+        Returns:
+            The claimed job, or None if no job is queued
+        """
+        if not kinds:
+            return None
+            
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            # Take the write lock up front so two workers cannot claim the same job
+            cursor.execute('BEGIN IMMEDIATE')
+            placeholders = ', '.join(['?' for _ in kinds])
+            cursor.execute(f'''
+            SELECT * FROM jobs
+            WHERE status = 'queued' AND kind IN ({placeholders})
+            ORDER BY rowid
+            LIMIT 1
+            ''', kinds)
+            job = cursor.fetchone()
+            
+            if job:
+                cursor.execute('''
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+                ''', (time.strftime('%Y-%m-%d %H:%M:%S'), job['id']))
+            
+            # Commit changes and close connection
+            conn.commit()
+            conn.close()
+            
+            if not job:
+                return None
+            job_dict = dict(job)
+            job_dict['status'] = 'running'
+            job_dict['attempts'] += 1
+            job_dict['payload'] = json.loads(job_dict['payload'])
+            return job_dict
+        except Exception as e:
+            logger.error(f"Error claiming job: {e}")
+            raise
+    
+    @_on_db_thread
+    def update_job(self, job_id: str, status: str, error: Optional[str] = None) -> bool:
+        """
+        Set the status of a job.
+        
+        Args:
+            job_id: The ID of the job
+            status: "queued", "running", "completed" or "failed"
+            error: Error message of the last failed attempt
+            
+        Returns:
+            True if the job was updated, False otherwise
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            # Execute query
+            cursor.execute('''
+            UPDATE jobs
+            SET status = ?, error = ?, updated_at = ?
+            WHERE id = ?
+            ''', (status, error, time.strftime('%Y-%m-%d %H:%M:%S'), job_id))
+            updated = cursor.rowcount > 0
+            
+            # Commit changes and close connection
+            conn.commit()
+            conn.close()
+            
+            return updated
+        except Exception as e:
+            logger.error(f"Error updating job: {e}")
+            raise
+    
+    @_on_reader_thread
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job by ID.
+        
+        Args:
+            job_id: The ID of the job
+            
+        Returns:
+            The job or None if not found
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            # Execute query
+            cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+            job = cursor.fetchone()
+            
+            # Close connection
+            conn.close()
+            
+            if not job:
+                return None
+            job_dict = dict(job)
+            job_dict['payload'] = json.loads(job_dict['payload'])
+            return job_dict
+        except Exception as e:
+            logger.error(f"Error getting job: {e}")
+            raise
+    
+    @_on_db_thread
+    def requeue_running_jobs(self, kinds: List[str]) -> int:
+        """
+        Put jobs left running by a previous process back in the queue.
+        
+        Args:
+            kinds: The job types to requeue
+            
+        Returns:
+            The number of requeued jobs
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            # Execute query
+            placeholders = ', '.join('?' * len(kinds))
+            cursor.execute(f'''
+            UPDATE jobs
+            SET status = 'queued', updated_at = ?
+            WHERE status = 'running' AND kind IN ({placeholders})
+            ''', (time.strftime('%Y-%m-%d %H:%M:%S'), *kinds))
+            requeued = cursor.rowcount
+            
+            # Commit changes and close connection
+            conn.commit()
+            conn.close()
+            
+            if requeued:
+                logger.info(f"Requeued {requeued} interrupted jobs")
+            return requeued
+        except Exception as e:
+            logger.error(f"Error requeuing jobs: {e}")
+            raise
+
 # Create database instance
 database = Database()
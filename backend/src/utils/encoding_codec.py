@@ -0,0 +1,79 @@
+"""
+Binary layout of stored face encodings.
+A stored block is a fixed header (magic, format version, dimension, vector
+count) followed by the vectors as raw little-endian float32, so it can be
+read with np.frombuffer without any parsing.
+"""
+
+import struct
+import numpy as np
+from typing import Iterable, List
+
+ENCODING_MAGIC = b"FENC"
+ENCODING_FORMAT_VERSION = 1
+# Magic, format version, dimension, vector count
+ENCODING_HEADER = struct.Struct("<4sHHI")
+ENCODING_DTYPE = np.dtype("<f4")
+ENCODING_DIMENSION = 128
+# Headerless float64 blocks written before the format was versioned
+LEGACY_DTYPE = np.dtype(np.float64)
+
+def pack_vectors(vectors: Iterable[np.ndarray]) -> bytes:
+    """
+    Serialize encodings as one block.
+
+    Args:
+        vectors: Encodings of ENCODING_DIMENSION values each
+
+    Returns:
+        The header followed by the vectors as little-endian float32
+    """
+    matrix = np.asarray(list(vectors), dtype=ENCODING_DTYPE).reshape(-1, ENCODING_DIMENSION)
+    header = ENCODING_HEADER.pack(ENCODING_MAGIC, ENCODING_FORMAT_VERSION, ENCODING_DIMENSION, len(matrix))
+    return header + matrix.tobytes()
+
+def unpack_vectors(data: bytes) -> np.ndarray:
+    """
+    Deserialize a block written by pack_vectors or in the legacy float64 layout.
+
+    Args:
+        data: The stored block
+
+    Returns:
+        A (count x ENCODING_DIMENSION) float32 array
+    """
+    if data[:len(ENCODING_MAGIC)] != ENCODING_MAGIC:
+        return np.frombuffer(data, dtype=LEGACY_DTYPE).reshape(-1, ENCODING_DIMENSION).astype(ENCODING_DTYPE)
+
+    _, version, dimension, count = ENCODING_HEADER.unpack_from(data)
+    if version != ENCODING_FORMAT_VERSION or dimension != ENCODING_DIMENSION:
+        raise ValueError(f"Unsupported encoding block (version {version}, dimension {dimension})")
+    return np.frombuffer(data, dtype=ENCODING_DTYPE, count=count * dimension, offset=ENCODING_HEADER.size).reshape(
+        count, dimension
+    )
+
+def split_vectors(data: bytes) -> List[bytes]:
+    """
+    Split a block into one single-vector block per encoding.
+
+    Args:
+        data: The stored block
+
+    Returns:
+        A block per encoding, in order
+    """
+    return [pack_vectors([vector]) for vector in unpack_vectors(data)]
+
+def read_into(data: bytes, out: np.ndarray) -> None:
+    """
+    Copy a single-vector block into a row of a preallocated matrix.
+
+    Args:
+        data: A block holding one encoding
+        out: Destination row of ENCODING_DIMENSION float32 values
+    """
+    if (len(data) == ENCODING_HEADER.size + ENCODING_DIMENSION * ENCODING_DTYPE.itemsize
+            and data[:len(ENCODING_MAGIC)] == ENCODING_MAGIC):
+        out[:] = np.frombuffer(data, dtype=ENCODING_DTYPE, offset=ENCODING_HEADER.size)
+    else:
+        out[:] = unpack_vectors(data)[0]
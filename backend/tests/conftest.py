@@ -0,0 +1,39 @@
+"""
+Shared fixtures for the Face Recognition API tests.
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Keep the module-level singletons away from the real data and log files
+_data_dir = tempfile.mkdtemp(prefix="face_recognition_tests_")
+os.environ.setdefault("DB_PATH", os.path.join(_data_dir, "face_recognition.db"))
+os.environ.setdefault("GALLERY_INDEX_PATH", os.path.join(_data_dir, "gallery_index.npz"))
+os.environ.setdefault("BULK_IMPORT_DIR", os.path.join(_data_dir, "bulk"))
+os.environ.setdefault("LOG_FILE", os.path.join(_data_dir, "app.log"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+# Import the application from src; backend/config.py would shadow the
+# src/config package if the backend directory stayed on the path
+_backend_dir = Path(__file__).resolve().parent.parent
+sys.path[:] = [path for path in sys.path if Path(path or os.getcwd()).resolve() != _backend_dir]
+sys.path.insert(0, str(_backend_dir / "src"))
+
+from utils.database import Database
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion."""
+    return asyncio.run
+
+@pytest.fixture
+def db(tmp_path):
+    """A Database on a fresh file."""
+    database = Database(str(tmp_path / "test.db"))
+    yield database
+    database.close()
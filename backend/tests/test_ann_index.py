@@ -0,0 +1,88 @@
+"""
+Tests for the persisted IVF gallery index.
+"""
+
+import numpy as np
+
+from services.ann_index import IVFIndex
+
+def _gallery(rng, users=60, per_user=3, clusters=8):
+    centers = rng.normal(size=(clusters, 128)).astype(np.float32)
+    user_centers = centers[rng.integers(clusters, size=users)]
+    matrix = np.repeat(user_centers, per_user, axis=0)
+    matrix += rng.normal(scale=0.01, size=matrix.shape).astype(np.float32)
+    owners = np.repeat(np.array([f"u{i:03}" for i in range(users)], dtype=object), per_user)
+    return centers, matrix, owners
+
+def _row_lists(index):
+    return [rows.tolist() for rows in index._lists]
+
+def test_persisted_assignment_is_reused(tmp_path):
+    rng = np.random.default_rng(0)
+    _, matrix, owners = _gallery(rng)
+    path = str(tmp_path / "index.npz")
+
+    index = IVFIndex(nlist=8, nprobe=1, path=path)
+    index.build(matrix, owners)
+    index.save(matrix, owners, np.ones(len(matrix), dtype=bool))
+
+    reloaded = IVFIndex(nlist=8, nprobe=1, path=path)
+    reloaded.build(matrix, owners)
+    np.testing.assert_array_equal(reloaded._centroids, index._centroids)
+    assert _row_lists(reloaded) == _row_lists(index)
+
+def test_replaced_encodings_are_reassigned(tmp_path):
+    rng = np.random.default_rng(1)
+    centers, matrix, owners = _gallery(rng)
+    path = str(tmp_path / "index.npz")
+
+    index = IVFIndex(nlist=8, nprobe=1, path=path)
+    index.build(matrix, owners)
+    index.save(matrix, owners, np.ones(len(matrix), dtype=bool))
+
+    # Replace every user's encodings with the same number of vectors near another center
+    replaced = matrix.copy()
+    for i in range(0, len(matrix), 3):
+        target = centers[(i // 3) % len(centers)]
+        replaced[i:i + 3] = target + rng.normal(scale=0.01, size=(3, 128)).astype(np.float32)
+
+    reloaded = IVFIndex(nlist=8, nprobe=1, path=path)
+    reloaded.build(replaced, owners)
+    state = reloaded.snapshot()
+    for row in range(len(replaced)):
+        assert row in reloaded.candidates(state, replaced[row])
+
+def test_index_without_digests_reassigns_rows(tmp_path):
+    rng = np.random.default_rng(2)
+    _, matrix, owners = _gallery(rng)
+    path = str(tmp_path / "index.npz")
+
+    index = IVFIndex(nlist=8, nprobe=1, path=path)
+    index.build(matrix, owners)
+    np.savez(
+        path,
+        centroids=index._centroids,
+        owners=owners.astype(str),
+        assign=np.zeros(len(matrix), dtype=np.int32)
+    )
+
+    reloaded = IVFIndex(nlist=8, nprobe=1, path=path)
+    reloaded.build(matrix, owners)
+    assert _row_lists(reloaded) == _row_lists(index)
+
+def test_training_starts_once_the_gallery_can_be_partitioned():
+    index = IVFIndex(nlist=0, path=None)
+    index.build(np.empty((0, 128), dtype=np.float32), np.empty(0, dtype=object))
+
+    assert index.snapshot() is None
+    assert not index.needs_training(3)
+    assert index.needs_training(4)
+
+    rng = np.random.default_rng(3)
+    _, matrix, _ = _gallery(rng, users=4, per_user=4)
+    index.train(matrix)
+    assert len(index._centroids) == 4
+    assert sorted(np.concatenate(index._lists).tolist()) == list(range(16))
+    assert not index.needs_training(63)
+    assert index.needs_training(64)
+    assert not IVFIndex(nlist=4, path=None).needs_training(3)
@@ -0,0 +1,85 @@
+"""
+Tests for reading bulk enrollment sources.
+"""
+
+import json
+import tarfile
+import zipfile
+
+import pytest
+
+pytest.importorskip("face_recognition")
+
+from services.bulk_enrollment import BulkEnrollment, iter_images, load_checkpoint, read_manifest
+
+def test_directory_images_are_named_by_relative_path(tmp_path):
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "x.jpg").write_bytes(folder.encode())
+    (tmp_path / "notes.txt").write_text("skipped")
+
+    assert list(iter_images(str(tmp_path))) == [("a/x.jpg", b"a"), ("b/x.jpg", b"b")]
+    assert list(iter_images(str(tmp_path), skip=1)) == [("b/x.jpg", b"b")]
+
+def test_archive_images_are_named_by_relative_path(tmp_path):
+    zip_path = tmp_path / "images.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("a/x.jpg", b"a")
+        archive.writestr("b/x.jpg", b"b")
+    assert [name for name, _ in iter_images(str(zip_path))] == ["a/x.jpg", "b/x.jpg"]
+
+    image_path = tmp_path / "y.jpg"
+    image_path.write_bytes(b"c")
+    tar_path = tmp_path / "images.tar"
+    with tarfile.open(tar_path, "w") as archive:
+        archive.add(image_path, arcname="./c/y.jpg")
+    assert [name for name, _ in iter_images(str(tar_path))] == ["c/y.jpg"]
+
+def test_manifest_is_keyed_by_normalized_image_path(tmp_path):
+    manifest_path = tmp_path / "manifest.csv"
+    manifest_path.write_text("Name,Image\nAlpha,a/x.jpg\nBeta,.\\b\\x.jpg\n")
+
+    manifest, key_column = read_manifest(str(manifest_path))
+
+    assert key_column == "image"
+    assert {key: row["name"] for key, row in manifest.items()} == {"a/x.jpg": "Alpha", "b/x.jpg": "Beta"}
+
+def _unmatched_import(tmp_path, images):
+    source = tmp_path / "images"
+    source.mkdir()
+    for i in range(images):
+        (source / f"{i:02}.jpg").write_bytes(b"image")
+    manifest_path = tmp_path / "manifest.csv"
+    manifest_path.write_text("name,employee_id\nNobody,missing\n")
+    return str(source), str(manifest_path), str(tmp_path / "checkpoint.json")
+
+def _logged(path):
+    with open(path) as f:
+        return [json.loads(line)["image"] for line in f]
+
+def test_checkpoint_keeps_a_sample_of_failures(tmp_path, run):
+    source, manifest_path, checkpoint_path = _unmatched_import(tmp_path, 7)
+
+    state = run(BulkEnrollment(source, manifest_path, checkpoint_path, batch_size=2, failure_sample=3).run())
+
+    assert state["failed"] == 7
+    assert [failure["image"] for failure in state["failures"]] == ["00.jpg", "01.jpg", "02.jpg"]
+    assert _logged(state["failures_path"]) == [f"{i:02}.jpg" for i in range(7)]
+    assert load_checkpoint(checkpoint_path) == state
+
+def test_resumed_import_drops_failures_logged_after_the_checkpoint(tmp_path, run):
+    source, manifest_path, checkpoint_path = _unmatched_import(tmp_path, 5)
+    state = run(BulkEnrollment(source, manifest_path, checkpoint_path, batch_size=2, failure_sample=1).run())
+
+    # Rewind to a checkpoint taken after three images, as if the import had
+    # crashed after logging the failures of the next batch
+    with open(state["failures_path"], "rb") as f:
+        logged = sum(len(f.readline()) for _ in range(3))
+    state.update(position=3, failed=3, failures_logged=logged, completed=False)
+    with open(checkpoint_path, "w") as f:
+        json.dump(state, f)
+
+    resumed = run(BulkEnrollment(source, manifest_path, checkpoint_path, batch_size=2, failure_sample=1).run())
+
+    assert resumed["failed"] == 5
+    assert _logged(resumed["failures_path"]) == [f"{i:02}.jpg" for i in range(5)]
@@ -0,0 +1,66 @@
+"""
+Tests for the pooled database connections and the threads running database operations.
+"""
+
+import asyncio
+import threading
+
+from config import config
+from services.metrics_service import MetricsService
+from utils.database import Database, _on_db_thread, _on_reader_thread
+
+def _blocked(decorator, db, release):
+    """Start an operation that holds one of the database's threads until released."""
+    return asyncio.ensure_future(decorator(lambda self: release.wait(5))(db))
+
+def test_connections_use_wal_and_the_configured_busy_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DB_TIMEOUT", 2500)
+    database = Database(str(tmp_path / "pragmas.db"))
+    try:
+        conn = database.get_connection()
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        busy_timeout = conn.execute('PRAGMA busy_timeout').fetchone()[0]
+        reused = database.get_connection() is conn
+    finally:
+        database.close()
+
+    assert journal_mode == "wal"
+    assert busy_timeout == 2500
+    assert reused
+
+def test_slow_read_does_not_block_a_lookup(run, db):
+    run(db.add_users([({"id": "user-1", "name": "Ada"}, None, None)]))
+    release = threading.Event()
+
+    async def scenario():
+        slow = _blocked(_on_reader_thread, db, release)
+        try:
+            return await asyncio.wait_for(db.get_user_by_id("user-1"), timeout=2)
+        finally:
+            release.set()
+            await slow
+
+    assert run(scenario())["name"] == "Ada"
+
+def test_reads_and_metrics_do_not_wait_for_a_slow_write(run, db, monkeypatch):
+    run(db.add_users([({"id": "user-1", "name": "Ada"}, None, None)]))
+    release = threading.Event()
+    metrics = MetricsService()
+    monkeypatch.setattr("services.metrics_service.database", db)
+
+    async def scenario():
+        slow = _blocked(_on_db_thread, db, release)
+        try:
+            user = await asyncio.wait_for(db.get_user_by_id("user-1"), timeout=2)
+            await asyncio.wait_for(metrics.record_request("/api/health", 0.01, 200), timeout=2)
+            pending = len(metrics._pending_writes)
+        finally:
+            release.set()
+            await slow
+        await asyncio.gather(*metrics._pending_writes)
+        return user, pending, await db.get_metrics(endpoint="/api/health")
+
+    user, pending, stored = run(scenario())
+    assert user["name"] == "Ada"
+    assert pending == 1
+    assert [metric["status_code"] for metric in stored] == [200]
@@ -0,0 +1,157 @@
+"""
+Tests for the stored encoding layout and the move of encodings out of the users table.
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from utils.database import Database, SCHEMA_VERSION
+from utils.encoding_codec import (
+    ENCODING_DIMENSION,
+    ENCODING_DTYPE,
+    ENCODING_HEADER,
+    pack_vectors,
+    read_into,
+    split_vectors,
+    unpack_vectors,
+)
+
+def _vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, ENCODING_DIMENSION))
+
+def test_v1_round_trip():
+    vectors = _vectors(3)
+    data = pack_vectors(vectors)
+
+    assert len(data) == ENCODING_HEADER.size + 3 * ENCODING_DIMENSION * 4
+    decoded = unpack_vectors(data)
+    assert decoded.dtype == ENCODING_DTYPE
+    assert np.array_equal(decoded, vectors.astype(ENCODING_DTYPE))
+
+def test_legacy_float64_blocks_decode():
+    vectors = _vectors(2)
+    decoded = unpack_vectors(vectors.astype(np.float64).tobytes())
+
+    assert decoded.dtype == ENCODING_DTYPE
+    assert np.array_equal(decoded, vectors.astype(ENCODING_DTYPE))
+    assert np.array_equal(unpack_vectors(pack_vectors(decoded)), decoded)
+
+def test_split_and_read_into_handle_both_layouts():
+    vectors = _vectors(2).astype(ENCODING_DTYPE)
+    out = np.empty(ENCODING_DIMENSION, dtype=ENCODING_DTYPE)
+
+    for data in (pack_vectors(vectors), vectors.astype(np.float64).tobytes()):
+        blocks = split_vectors(data)
+        assert len(blocks) == 2
+        for block, vector in zip(blocks, vectors):
+            read_into(block, out)
+            assert np.array_equal(out, vector)
+
+    read_into(vectors[0].astype(np.float64).tobytes(), out)
+    assert np.array_equal(out, vectors[0])
+
+def test_unknown_format_version_is_rejected():
+    data = bytearray(pack_vectors(_vectors(1)))
+    ENCODING_HEADER.pack_into(data, 0, b"FENC", 99, ENCODING_DIMENSION, 1)
+
+    with pytest.raises(ValueError):
+        unpack_vectors(bytes(data))
+
+def test_legacy_database_encodings_are_migrated(tmp_path, run):
+    path = tmp_path / "legacy.db"
+    base, multi = _vectors(1, seed=1)[0], _vectors(2, seed=2)
+    conn = sqlite3.connect(path)
+    conn.execute('''
+    CREATE TABLE users (
+        id TEXT PRIMARY KEY,
+        face_id TEXT,
+        name TEXT NOT NULL,
+        employee_id TEXT,
+        department TEXT,
+        role TEXT,
+        image_path TEXT,
+        image_url TEXT,
+        face_encoding BLOB,
+        multi_angle_encodings BLOB,
+        face_analysis TEXT,
+        created_at TEXT,
+        updated_at TEXT
+    )
+    ''')
+    conn.executemany(
+        'INSERT INTO users (id, face_id, name, face_encoding, multi_angle_encodings) VALUES (?, ?, ?, ?, ?)',
+        [
+            ("u1", "f1", "Ada", base.tobytes(), multi.tobytes()),
+            ("u2", "f2", "Grace", base.tobytes(), None),
+            ("u3", "f3", "Linus", None, None),
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+    database = Database(str(path))
+    try:
+        rows = {row["id"]: row for row in run(database.get_all_face_encodings())}
+        conn = database.get_connection()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        leftover = conn.execute(
+            'SELECT COUNT(*) FROM users WHERE face_encoding IS NOT NULL OR multi_angle_encodings IS NOT NULL'
+        ).fetchone()[0]
+    finally:
+        database.close()
+
+    assert version == SCHEMA_VERSION
+    assert leftover == 0
+    assert set(rows) == {"u1", "u2"}
+    assert np.array_equal(rows["u1"]["vectors"], np.vstack([base, multi]).astype(ENCODING_DTYPE))
+    assert np.array_equal(rows["u2"]["vectors"], base[None].astype(ENCODING_DTYPE))
+
+def test_corrupt_legacy_encodings_are_kept_for_retry(tmp_path, run):
+    path = tmp_path / "legacy.db"
+    base = _vectors(1, seed=1)[0]
+    conn = sqlite3.connect(path)
+    conn.execute('''
+    CREATE TABLE users (
+        id TEXT PRIMARY KEY,
+        face_id TEXT,
+        name TEXT NOT NULL,
+        employee_id TEXT,
+        department TEXT,
+        role TEXT,
+        image_path TEXT,
+        image_url TEXT,
+        face_encoding BLOB,
+        multi_angle_encodings BLOB,
+        face_analysis TEXT,
+        created_at TEXT,
+        updated_at TEXT
+    )
+    ''')
+    conn.executemany(
+        'INSERT INTO users (id, face_id, name, face_encoding, multi_angle_encodings) VALUES (?, ?, ?, ?, ?)',
+        [
+            ("u1", "f1", "Ada", base.tobytes(), None),
+            ("u2", "f2", "Grace", base.tobytes(), b"\x01\x02\x03"),
+            ("u3", "f3", "Linus", base.tobytes(), None),
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+    database = Database(str(path))
+    try:
+        rows = {row["id"]: row for row in run(database.get_all_face_encodings())}
+        conn = database.get_connection()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        kept = conn.execute(
+            'SELECT id, face_encoding, multi_angle_encodings FROM users WHERE face_encoding IS NOT NULL'
+        ).fetchall()
+    finally:
+        database.close()
+
+    assert version == 0
+    assert [tuple(row) for row in kept] == [("u2", base.tobytes(), b"\x01\x02\x03")]
+    assert set(rows) == {"u1", "u3"}
+    assert np.array_equal(rows["u1"]["vectors"], base[None].astype(ENCODING_DTYPE))
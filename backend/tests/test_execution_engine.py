@@ -0,0 +1,68 @@
+"""
+Tests for shared memory handling in the face execution engine.
+"""
+
+import asyncio
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+pytest.importorskip("face_recognition")
+
+from services.execution_engine import ExecutionEngine, SharedArray, _attach_shared_memory
+
+class _RunningExecutor:
+    """An executor whose submitted tasks are running until the test finishes them."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.submitted.append((future, args))
+        return future
+
+def _exists(name):
+    try:
+        _attach_shared_memory(name).close()
+        return True
+    except FileNotFoundError:
+        return False
+
+def test_cancelled_call_keeps_shared_memory_until_the_worker_finishes(run):
+    engine = ExecutionEngine(mode="process")
+    executor = engine._executor = _RunningExecutor()
+
+    async def scenario():
+        task = asyncio.ensure_future(engine.call("detect_faces", np.ones((8, 8, 3), dtype=np.uint8)))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(scenario())
+    future, (method, args) = executor.submitted[0]
+    block = next(arg for arg in args if isinstance(arg, SharedArray))
+
+    assert method == "detect_faces"
+    assert _exists(block.name)
+    future.set_result([])
+    assert not _exists(block.name)
+
+def test_completed_call_releases_shared_memory(run):
+    engine = ExecutionEngine(mode="process")
+    executor = engine._executor = _RunningExecutor()
+
+    async def scenario():
+        task = asyncio.ensure_future(engine.call("detect_faces", np.ones((8, 8, 3), dtype=np.uint8)))
+        await asyncio.sleep(0)
+        future, (_, args) = executor.submitted[0]
+        future.set_result(["face"])
+        return await task, args
+
+    result, args = run(scenario())
+    block = next(arg for arg in args if isinstance(arg, SharedArray))
+    assert result == ["face"]
+    assert not _exists(block.name)
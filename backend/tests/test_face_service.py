@@ -0,0 +1,100 @@
+"""
+Tests for per-face landmark and encoding work in the face service.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("face_recognition")
+
+from services import face_service as face_service_module
+from services.face_service import FaceService
+
+class _Shape:
+    """A frontal landmark shape spanning a face box."""
+
+    def __init__(self, rect, count):
+        left, top, right = rect.left(), rect.top(), rect.right()
+        width = right - left
+        eye_y, nose = top + 0.35 * width, (left + 0.5 * width, top + 0.67 * width)
+        left_eye, right_eye = (left + 0.3 * width, eye_y), (left + 0.7 * width, eye_y)
+        if count == 5:
+            points = [right_eye, right_eye, left_eye, left_eye, nose]
+        else:
+            points = [nose] * 68
+            points[36:42] = [left_eye] * 6
+            points[42:48] = [right_eye] * 6
+        self._points = [SimpleNamespace(x=int(x), y=int(y)) for x, y in points]
+
+    def parts(self):
+        return self._points
+
+@pytest.fixture
+def predictor_calls(monkeypatch):
+    calls = []
+
+    def predictor(count):
+        def predict(image, rect):
+            calls.append(count)
+            return _Shape(rect, count)
+        return predict
+
+    def compute_face_descriptor(image, shape, num_jitters=1):
+        calls.append("encode")
+        return np.zeros(128)
+
+    monkeypatch.setattr(face_service_module, "pose_predictor_5_point", predictor(5))
+    monkeypatch.setattr(face_service_module, "pose_predictor_68_point", predictor(68))
+    monkeypatch.setattr(
+        face_service_module, "face_encoder", SimpleNamespace(compute_face_descriptor=compute_face_descriptor)
+    )
+    return calls
+
+def test_gated_face_runs_each_landmark_model_once(predictor_calls):
+    service = FaceService()
+    service.quality_gate = True
+    image = np.random.default_rng(0).integers(0, 256, size=(240, 240, 3), dtype=np.uint8)
+
+    result = service.process_face(image, (20, 220, 220, 20), quality_gate=True)
+
+    assert result["quality_check"]["passed"]
+    assert result["encoding"] is not None
+    assert sorted(predictor_calls, key=str) == [5, 68, "encode"]
+
+def test_rejected_face_skips_the_68_point_model_and_encoder(predictor_calls):
+    service = FaceService()
+    service.quality_gate = True
+    image = np.zeros((240, 240, 3), dtype=np.uint8)
+
+    result = service.process_face(image, (20, 220, 220, 20), quality_gate=True)
+
+    assert not result["quality_check"]["passed"]
+    assert result["encoding"] is None
+    assert predictor_calls == []
+
+def test_boxes_on_reduced_jpeg_decode_are_in_upload_coordinates(predictor_calls, monkeypatch):
+    import cv2
+
+    service = FaceService()
+    service.quality_gate = False
+    service.decode_max_side = 1600
+    service.detection_max_side = 0
+    decoded_shapes = []
+
+    def face_locations(image, model="hog"):
+        decoded_shapes.append(image.shape[:2])
+        height, width = image.shape[:2]
+        return [(height // 4, 3 * width // 4, 3 * height // 4, width // 4)]
+
+    monkeypatch.setattr(face_service_module.face_recognition, "face_locations", face_locations)
+    gradient = np.tile(np.arange(4000, dtype=np.uint16) % 256, (3000, 1)).astype(np.uint8)
+    ok, jpeg = cv2.imencode(".jpg", cv2.merge([gradient] * 3))
+    assert ok
+
+    probe = service.process_probe_faces(jpeg.tobytes())
+
+    assert decoded_shapes == [(1500, 2000)]
+    assert probe["face_locations"] == [(750, 3000, 2250, 1000)]
+    assert service.process_probe(jpeg.tobytes())["face_location"] == (750, 3000, 2250, 1000)
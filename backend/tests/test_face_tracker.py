@@ -0,0 +1,63 @@
+"""
+Tests for following faces between detections in streaming recognition.
+"""
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from services.face_tracker import FaceTracker
+
+BOX = (40, 104, 104, 40)
+
+def _frame(patch, dy=0, dx=0):
+    """A flat frame with a textured 64x64 patch standing in for a face."""
+    frame = np.full((200, 200, 3), 128, dtype=np.uint8)
+    top, left = BOX[0] + dy, BOX[3] + dx
+    frame[top:top + 64, left:left + 64] = patch
+    return frame
+
+def _patch(seed):
+    """Smooth random texture, so template matching survives the template downscale."""
+    noise = np.random.default_rng(seed).integers(0, 256, size=(64, 64, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (0, 0), 3)
+
+def _identified_tracker(face, **kwargs):
+    tracker = FaceTracker(detect_interval=10, min_score=0.6, min_iou=0.3, **kwargs)
+    (track,) = tracker.update(_frame(face), [BOX], version=1)
+    tracker.identify(track, {"user": {"id": "user-1"}}, 1)
+    return tracker, track
+
+def test_track_follows_a_moving_face_and_keeps_its_identity():
+    face = _patch(0)
+    tracker, track = _identified_tracker(face)
+
+    tracker.follow(_frame(face, dy=4, dx=6))
+
+    assert track.score > 0.9
+    assert abs(track.location[0] - (BOX[0] + 4)) <= 2
+    assert abs(track.location[3] - (BOX[3] + 6)) <= 2
+    assert track.identity is not None
+    assert not tracker.needs_detection()
+
+def test_lost_track_drops_its_identity_and_is_identified_again():
+    tracker, track = _identified_tracker(_patch(0))
+    other = _patch(1)
+
+    tracker.follow(_frame(other))
+
+    assert track.score < 0.6
+    assert track.identity is None
+    assert tracker.needs_detection()
+    assert tracker.update(_frame(other), [BOX], version=1) == [track]
+
+def test_identified_track_is_reverified_after_the_interval():
+    face = _patch(0)
+    tracker, track = _identified_tracker(face, reverify_interval=3)
+
+    tracker.follow(_frame(face))
+    assert tracker.update(_frame(face), [BOX], version=1) == []
+    tracker.follow(_frame(face))
+    assert tracker.update(_frame(face), [BOX], version=1) == [track]
+    assert track.identity is not None
@@ -0,0 +1,133 @@
+"""
+Tests for the resident gallery.
+"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("face_recognition")
+
+from services.gallery_service import GalleryService
+
+@pytest.fixture(autouse=True)
+def _fresh_index_file():
+    """Keep IVF indexes saved by one test from being loaded by the next."""
+    path = os.environ["GALLERY_INDEX_PATH"]
+    if os.path.exists(path):
+        os.remove(path)
+
+def _row(user_id, vectors):
+    return {"id": user_id, "name": user_id, "vectors": np.asarray(vectors, dtype=np.float32)}
+
+def _gallery(users=20, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [_row(f"u{i:02}", rng.normal(scale=0.05, size=(1, 128))) for i in range(users)]
+    gallery = GalleryService(tolerance=0.1, index_kind="exact", compaction_threshold=1.0)
+    gallery.build(rows)
+    return gallery, rows
+
+def test_batch_is_applied_with_one_user_map_copy():
+    gallery, rows = _gallery()
+    users_before = gallery._users
+    added = [_row(f"n{i}", np.full((2, 128), i, dtype=np.float32)) for i in range(5)]
+
+    gallery.on_database_change("added", [row["id"] for row in added], added)
+
+    assert users_before is not gallery._users
+    assert len(users_before) == 20 and gallery.user_count == 25
+    assert gallery.size == 20 + 5
+    assert gallery.match(np.full(128, 3, dtype=np.float32))["match"]["user_id"] == "n3"
+
+def test_deleted_and_updated_users_are_tombstoned():
+    gallery, rows = _gallery()
+    version = gallery.version
+
+    gallery.on_database_change("deleted", ["u00", "u01"])
+    gallery.on_database_change("updated", ["u02"], [_row("u02", np.ones((1, 128)))])
+
+    assert gallery.version == version + 2
+    assert gallery.user_count == 18
+    assert gallery.size == 18
+    assert gallery._tombstones == 3
+    assert gallery.match(rows[0]["vectors"][0])["match"] is None
+    assert gallery.match(np.ones(128, dtype=np.float32))["match"]["user_id"] == "u02"
+
+@pytest.mark.parametrize("index_kind", ["exact", "ivf"])
+def test_compaction_drops_tombstones_and_keeps_matches(index_kind):
+    rng = np.random.default_rng(1)
+    # The base encoding is dropped in favour of the two multi-angle rows
+    rows = [_row(f"u{i:02}", np.eye(3, 128, 3 * i) + rng.normal(scale=0.01, size=(3, 128))) for i in range(30)]
+    gallery = GalleryService(tolerance=0.3, index_kind=index_kind, compaction_threshold=1.0)
+    gallery.build(rows)
+
+    gallery.on_database_change("deleted", [f"u{i:02}" for i in range(0, 30, 3)])
+    added = [_row("n0", np.eye(1, 128, 127))]
+    gallery.on_database_change("added", ["n0"], added)
+    assert gallery._tombstones == 20
+
+    gallery.compact()
+
+    assert gallery._tombstones == 0
+    assert gallery._count == gallery.size == 41
+    assert gallery._alive[:gallery._count].all()
+    for user_id, user_rows in gallery._rows.items():
+        assert set(gallery._owners[user_rows]) == {user_id}
+    for i, row in enumerate(rows):
+        match = gallery.match(row["vectors"][1])["match"]
+        assert (match is None) if i % 3 == 0 else (match["user_id"] == row["id"])
+    assert gallery.match(added[0]["vectors"][0])["match"]["user_id"] == "n0"
+
+def test_compaction_starts_once_tombstones_reach_the_threshold():
+    gallery, rows = _gallery()
+    gallery.compaction_threshold = 0.25
+
+    gallery.on_database_change("deleted", ["u00", "u01", "u02", "u03"])
+    assert gallery._tombstones == 4
+    gallery.on_database_change("deleted", ["u04"])
+
+    deadline = time.monotonic() + 5
+    while gallery._compacting and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert gallery._tombstones == 0
+    assert gallery._count == 15
+    assert gallery.match(rows[5]["vectors"][0])["match"]["user_id"] == "u05"
+
+def test_ivf_index_is_trained_as_an_empty_gallery_grows():
+    gallery = GalleryService(tolerance=0.3, index_kind="ivf", compaction_threshold=1.0)
+    gallery.build([])
+    assert gallery._index.snapshot() is None
+
+    rows = [_row(f"u{i:03}", np.eye(1, 128, i % 128) * (1 + i // 128)) for i in range(200)]
+    for start in range(0, len(rows), 10):
+        batch = rows[start:start + 10]
+        gallery.on_database_change("added", [row["id"] for row in batch], batch)
+        deadline = time.monotonic() + 5
+        while gallery._compacting and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    centroids, lists = gallery._index.snapshot()
+    assert len(centroids) >= 8
+    assert sorted(np.concatenate(lists).tolist()) == list(range(200))
+    for row in rows[::7]:
+        assert gallery.match(row["vectors"][0])["match"]["user_id"] == row["id"]
+
+@pytest.mark.parametrize("aggregate", ["min", "mean"])
+def test_user_within_own_tolerance_ranks_first(aggregate):
+    def user(user_id, axis, distance, yaw):
+        row = _row(user_id, np.eye(1, 128, axis) * distance)
+        row["face_analysis"] = {"pose": {"yaw": yaw, "pitch": 0.0, "roll": 0.0}}
+        return row
+
+    gallery = GalleryService(tolerance=0.6, index_kind="exact")
+    # The nearer user is outside the strict tolerance of a matching pose; the
+    # farther one is within the tolerance relaxed by a 30 degree pose difference
+    gallery.build([user("near", 0, 0.62, 0.0), user("far", 1, 0.64, 30.0)])
+
+    probe_pose = {"yaw": 0.0, "pitch": 0.0, "roll": 0.0}
+    candidates = gallery.search(np.zeros(128, dtype=np.float32), 2, aggregate, probe_pose)["candidates"]
+
+    assert [c["user_id"] for c in candidates] == ["far", "near"]
+    assert [c["within_tolerance"] for c in candidates] == [True, False]
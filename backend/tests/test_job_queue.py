@@ -0,0 +1,150 @@
+"""
+Tests for the durable job queue and the face encoding job.
+"""
+
+import uuid
+import asyncio
+
+import numpy as np
+import pytest
+
+from services.job_queue import JobQueue
+from utils.database import database
+
+async def _run_next(queue, kind):
+    """Claim and run the next queued job of a kind."""
+    job = await database.claim_job([kind])
+    assert job is not None
+    await queue._run(job)
+    return job
+
+def test_failed_job_is_retried_until_it_succeeds(run):
+    kind = f"flaky-{uuid.uuid4()}"
+    calls = []
+
+    async def handler(value):
+        calls.append(value)
+        if len(calls) == 1:
+            raise RuntimeError("transient")
+        return True
+
+    async def scenario():
+        queue = JobQueue(max_attempts=3)
+        queue.register_handler(kind, handler)
+        job_id = await queue.enqueue(kind, {"value": 7})
+
+        await _run_next(queue, kind)
+        retried = await queue.get_job(job_id)
+        await _run_next(queue, kind)
+        return retried, await queue.get_job(job_id)
+
+    retried, done = run(scenario())
+    assert calls == [7, 7]
+    assert retried["status"] == "queued"
+    assert retried["error"] == "transient"
+    assert done["status"] == "completed"
+    assert done["attempts"] == 2
+
+def test_job_fails_after_max_attempts(run):
+    kind = f"broken-{uuid.uuid4()}"
+
+    async def handler():
+        return False
+
+    async def scenario():
+        queue = JobQueue(max_attempts=2)
+        queue.register_handler(kind, handler)
+        job_id = await queue.enqueue(kind, {})
+
+        await _run_next(queue, kind)
+        await _run_next(queue, kind)
+        return job_id, await queue.get_job(job_id), await database.claim_job([kind])
+
+    job_id, job, leftover = run(scenario())
+    assert job["status"] == "failed"
+    assert job["attempts"] == 2
+    assert job["error"] == "Job handler reported failure"
+    assert leftover is None
+
+def test_worker_survives_a_failed_outcome_write(run, monkeypatch):
+    from services import job_queue as job_queue_module
+
+    kind = f"unrecorded-{uuid.uuid4()}"
+    calls = []
+    update_job = database.update_job
+
+    async def handler(value):
+        calls.append(value)
+        return True
+
+    async def flaky_update_job(job_id, *args):
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return await update_job(job_id, *args)
+
+    monkeypatch.setattr(job_queue_module.database, "update_job", flaky_update_job)
+
+    async def scenario():
+        queue = JobQueue(workers=1, poll_interval=0.01)
+        queue.register_handler(kind, handler)
+        first_id = await queue.enqueue(kind, {"value": 1})
+        await queue.start()
+        try:
+            second_id = await queue.enqueue(kind, {"value": 2})
+            for _ in range(500):
+                second = await queue.get_job(second_id)
+                if second["status"] == "completed":
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.stop()
+        return await queue.get_job(first_id), second
+
+    first, second = run(scenario())
+    assert calls == [1, 2]
+    assert first["status"] == "running"
+    assert second["status"] == "completed"
+
+def test_interrupted_jobs_are_requeued_by_their_own_queue(run):
+    kind, other = f"interrupted-{uuid.uuid4()}", f"other-{uuid.uuid4()}"
+
+    async def scenario():
+        job_id = await database.add_job(str(uuid.uuid4()), kind, {})
+        other_id = await database.add_job(str(uuid.uuid4()), other, {})
+        await database.claim_job([kind])
+        await database.claim_job([other])
+        await database.requeue_running_jobs([kind])
+        return job_id, await database.claim_job([kind]), await database.get_job(other_id)
+
+    job_id, job, other_job = run(scenario())
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+    assert other_job["status"] == "running"
+
+def test_face_encoding_job_keeps_the_base_encoding(run, tmp_path, monkeypatch):
+    pytest.importorskip("face_recognition")
+    from api import registration
+
+    calls = []
+
+    async def call(method, *args):
+        calls.append(method)
+        return [np.full(128, 0.5), np.full(128, 0.25)]
+
+    monkeypatch.setattr(registration.face_engine, "call", call)
+    monkeypatch.setattr(registration.face_service, "process_image_scaled", lambda data: (np.zeros((8, 8, 3), np.uint8), 1))
+    image_path = tmp_path / "face.jpg"
+    image_path.write_bytes(b"image")
+
+    async def scenario():
+        user_id = str(uuid.uuid4())
+        base = registration.face_service.encode_to_bytes(np.full(128, 0.125))
+        await database.add_user({"id": user_id, "face_id": user_id, "name": "Ada"}, base)
+        done = await registration.process_face_encoding(user_id, str(image_path), True, [1, 6, 6, 1])
+        users = await database.get_all_face_encodings()
+        return done, next(user["vectors"] for user in users if user["id"] == user_id)
+
+    done, vectors = run(scenario())
+    assert done
+    assert calls == ["generate_multi_angle_encodings"]
+    assert np.allclose(vectors, [[0.125], [0.5], [0.25]])
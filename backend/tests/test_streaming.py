@@ -0,0 +1,38 @@
+"""
+Tests for the per-connection frame slot of streaming recognition.
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("face_recognition")
+
+from api.streaming import LatestFrame
+
+def test_stale_frames_are_dropped_for_the_latest(run):
+    async def scenario():
+        frames = LatestFrame()
+        frames.put(b"frame-1")
+        frames.put(b"frame-2")
+        frames.put(b"frame-3")
+        latest = await frames.take()
+        frames.put(b"frame-4")
+        following = await frames.take()
+        return frames, latest, following
+
+    frames, latest, following = run(scenario())
+    assert latest == (b"frame-3", 3)
+    assert following == (b"frame-4", 4)
+    assert frames.received == 4
+    assert frames.dropped == 2
+
+def test_close_wakes_a_waiting_consumer(run):
+    async def scenario():
+        frames = LatestFrame()
+        waiting = asyncio.ensure_future(frames.take())
+        await asyncio.sleep(0)
+        frames.close()
+        return await asyncio.wait_for(waiting, timeout=1)
+
+    assert run(scenario()) is None
@@ -0,0 +1,78 @@
+"""
+Tests for keyset pagination of the user listing and the user counter.
+"""
+
+import pytest
+
+from api.users import _decode_cursor, _encode_cursor
+from utils.database import LISTING_KEY
+
+def _add(run, db, count):
+    # Two users per timestamp so pages have to break ties on the ID
+    users = [
+        ({"id": f"user-{i:02d}", "name": f"User {i}", "created_at": f"2024-01-01 00:00:{i // 2:02d}"}, None, None)
+        for i in range(count)
+    ]
+    run(db.add_users(users))
+
+def _walk(run, db, limit):
+    pages, after = [], None
+    while True:
+        users = run(db.get_users_after(after, limit))
+        if not users:
+            return pages
+        pages.append([user["id"] for user in users])
+        after = _decode_cursor(_encode_cursor(users[-1]))
+
+def test_cursor_pages_cover_the_listing_once(run, db):
+    _add(run, db, 11)
+    pages = _walk(run, db, 3)
+
+    listed = [user_id for page in pages for user_id in page]
+    assert [len(page) for page in pages] == [3, 3, 3, 2]
+    assert listed == [f"user-{i:02d}" for i in reversed(range(11))]
+    assert listed == [user["id"] for user in run(db.get_users_paginated(1, 11))]
+
+def test_cursor_pages_skip_deleted_positions(run, db):
+    _add(run, db, 6)
+    first = run(db.get_users_after(None, 2))
+    run(db.delete_user(first[-1]["id"]))
+
+    after = _decode_cursor(_encode_cursor(first[-1]))
+    assert [user["id"] for user in run(db.get_users_after(after, 2))] == ["user-03", "user-02"]
+
+def test_users_without_creation_time_are_listed_last(run, db):
+    _add(run, db, 3)
+    run(db.add_users([({"id": user_id, "name": user_id, "created_at": None}, None, None) for user_id in ("n1", "n2")]))
+
+    pages = _walk(run, db, 2)
+
+    assert [user_id for page in pages for user_id in page] == ["user-02", "user-01", "user-00", "n2", "n1"]
+    assert [user["id"] for user in run(db.get_users_paginated(3, 2))] == ["n1"]
+    assert run(db.get_users_count()) == 5
+
+def test_cursor_query_seeks_the_index(db):
+    plan = " ".join(
+        row[3] for row in db.get_connection().execute(f'''
+        EXPLAIN QUERY PLAN SELECT id FROM users
+        WHERE {LISTING_KEY} <= ? AND ({LISTING_KEY} < ? OR id < ?)
+        ORDER BY {LISTING_KEY} DESC, id DESC
+        LIMIT 10
+        ''', ("2024-01-01 00:00:00", "2024-01-01 00:00:00", "x"))
+    )
+    assert "SEARCH users USING INDEX idx_users_listing" in plan
+    assert "TEMP B-TREE" not in plan
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "bnVsbA", "WzEsMl0", "WyJhIl0"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        _decode_cursor(cursor)
+
+def test_counter_follows_inserts_and_deletes(run, db):
+    _add(run, db, 5)
+    run(db.add_users([({"id": "user-00", "name": "Duplicate"}, None, None)]))
+    run(db.delete_user("user-01"))
+    run(db.delete_user("missing"))
+
+    count = db.get_connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    assert run(db.get_users_count()) == count == 4
@@ -0,0 +1,87 @@
+"""
+Tests for the full-text user search index.
+"""
+
+import sqlite3
+
+from utils.database import Database, SCHEMA_VERSION
+
+def _add(run, db, *users):
+    run(db.add_users([(dict(user), None, None) for user in users]))
+
+def _ids(users):
+    return [user["id"] for user in users]
+
+def test_prefix_search_ranks_name_matches_first(run, db):
+    _add(
+        run, db,
+        {"id": "a", "name": "Ana Lopez", "department": "Johnson Labs"},
+        {"id": "b", "name": "John Smith", "department": "Engineering"},
+        {"id": "c", "name": "Mary Jones", "role": "Developer"}
+    )
+
+    assert _ids(run(db.search_users("jo")))[0] in ("b", "c")
+    assert _ids(run(db.search_users("john"))) == ["b", "a"]
+    assert _ids(run(db.search_users("mary dev"))) == ["c"]
+    assert run(db.search_users("!!")) == []
+    assert len(run(db.search_users("jo", limit=1))) == 1
+
+def test_triggers_follow_updates_and_deletes(run, db):
+    _add(run, db, {"id": "a", "name": "John Smith"}, {"id": "b", "name": "Mary Jones"})
+
+    run(db.update_user("b", {"name": "Mary Johnson"}))
+    assert _ids(run(db.search_users("johnson"))) == ["b"]
+    assert run(db.search_users("jones")) == []
+
+    run(db.delete_user("a"))
+    assert _ids(run(db.search_users("john"))) == ["b"]
+
+    conn = db.get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM users_fts").fetchone()[0] == 1
+    assert [row["user_id"] for row in conn.execute("SELECT user_id FROM users_fts_keys")] == ["b"]
+
+def test_trigger_deletes_by_rowid(db):
+    conn = db.get_connection()
+    trigger = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'users_fts_delete'").fetchone()[0]
+    assert "WHERE rowid =" in trigger
+
+    plan = " ".join(
+        row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT key FROM users_fts_keys WHERE user_id = ?", ("a",)
+        )
+    )
+    assert "SEARCH" in plan
+
+def test_keys_survive_vacuum(run, db):
+    _add(run, db, *({"id": f"u{i:03}", "name": f"Person {i}"} for i in range(50)))
+    run(db.delete_user("u010"))
+    db.get_connection().execute("VACUUM")
+
+    run(db.update_user("u020", {"name": "Renamed Someone"}))
+    assert _ids(run(db.search_users("renamed"))) == ["u020"]
+    remaining = _ids(run(db.search_users("person", limit=100)))
+    assert len(remaining) == 48 and "u010" not in remaining
+
+def test_user_id_keyed_index_is_rebuilt(tmp_path, run):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE users (id TEXT PRIMARY KEY, face_id TEXT, name TEXT NOT NULL, employee_id TEXT, "
+        "department TEXT, role TEXT, image_path TEXT, image_url TEXT, face_analysis TEXT, "
+        "created_at TEXT, updated_at TEXT)"
+    )
+    conn.execute("INSERT INTO users (id, name, created_at) VALUES ('old', 'Zoë Olden', '2024-01-01')")
+    conn.execute("CREATE VIRTUAL TABLE users_fts USING fts5(user_id UNINDEXED, name, employee_id, department, role)")
+    conn.execute("INSERT INTO users_fts (user_id, name) VALUES ('old', 'Zoë Olden')")
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    try:
+        assert db.get_connection().execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        assert _ids(run(db.search_users("zoe"))) == ["old"]
+        run(db.delete_user("old"))
+        assert run(db.search_users("zoe")) == []
+    finally:
+        db.close()